@@ -41,6 +41,7 @@ def run_webhook_server():
         "webhook_server:app",
         host="0.0.0.0",
         port=config["webhook_port"],
+        workers=config.get("api_workers", 1),
         log_level="info"
     )
 
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import ctypes
+import ctypes.util
+import asyncio
+import logging
+import soundfile as sf
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class _Inotify:
+    """Minimal inotify wrapper (Linux only) used to wake the watcher up on folder changes"""
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+
+    def __init__(self, folder: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {folder}")
+
+    def drain(self):
+        """Discard pending events; the watcher rescans the folder anyway"""
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+
+    def close(self):
+        os.close(self.fd)
+
+def match_group(path: str, groups: List[str]) -> Optional[str]:
+    """
+    Return the group whose name appears in the file name (case-insensitive).
+    The longest match wins so 'song1_mix' does not claim the stems of 'song10_mix'.
+    """
+    name = os.path.basename(path).lower()
+    matches = [group for group in groups if group.lower() in name]
+    return max(matches, key=len) if matches else None
+
+@dataclass
+class _TrackedFile:
+    size: int
+    mtime: float
+    stable_since: float
+    finalized: bool = False
+
+class ExportWatcher:
+    """
+    Watches the Logic export folder for new .wav stems.
+
+    A file is finalized once its size and mtime have not changed for `stable_time`
+    seconds and its WAV header parses. The export is complete when every name in
+    `expected_stems` is matched (case-insensitively) by a finalized file. When
+    `groups` is given (one name per song of a batch export) every stem is expected
+    once per group, matched by files containing both the group and the stem name.
+    Uses inotify on Linux to react to changes immediately and polls elsewhere.
+    """
+
+    def __init__(
+        self,
+        folder: str,
+        expected_stems: List[str],
+        stable_time: float = 2.0,
+        poll_interval: float = 1.0,
+        on_stem_ready: Optional[Callable[[str], None]] = None,
+        groups: Optional[List[str]] = None
+    ):
+        self.folder = folder
+        self.expected_stems = [s.lower() for s in expected_stems]
+        self.groups = [g.lower() for g in groups] if groups else None
+        self.stable_time = stable_time
+        self.poll_interval = poll_interval
+        self.on_stem_ready = on_stem_ready
+        self.existing: Dict[str, Tuple[int, float]] = {}
+        self.tracked: Dict[str, _TrackedFile] = {}
+        self.inotify: Optional[_Inotify] = None
+
+    def start(self):
+        """Snapshot the folder; call right before triggering the export"""
+        os.makedirs(self.folder, exist_ok=True)
+        self.existing = {
+            name: (st.st_size, st.st_mtime)
+            for name, st in self._scan().items()
+        }
+        self.tracked = {}
+        if sys.platform.startswith("linux"):
+            try:
+                self.inotify = _Inotify(self.folder)
+            except OSError as e:
+                logger.warning(f"inotify unavailable, polling {self.folder}: {str(e)}")
+                self.inotify = None
+
+    def close(self):
+        if self.inotify:
+            self.inotify.close()
+            self.inotify = None
+
+    def _scan(self) -> Dict[str, os.stat_result]:
+        stats = {}
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.lower().endswith('.wav'):
+                    try:
+                        stats[entry.name] = entry.stat()
+                    except FileNotFoundError:
+                        continue
+        return stats
+
+    @staticmethod
+    def _header_ok(path: str) -> bool:
+        try:
+            info = sf.info(path)
+            return info.frames > 0 and info.samplerate > 0
+        except Exception:
+            return False
+
+    def finalized_files(self) -> List[str]:
+        return sorted(
+            os.path.join(self.folder, name)
+            for name, tracked in self.tracked.items() if tracked.finalized
+        )
+
+    def missing_stems(self) -> List[str]:
+        names = [os.path.basename(f).lower() for f in self.finalized_files()]
+        if not self.groups:
+            return [stem for stem in self.expected_stems if not any(stem in name for name in names)]
+        found = {
+            (match_group(name, self.groups), stem)
+            for name in names
+            for stem in self.expected_stems
+            if stem in name
+        }
+        return [
+            f"{group}/{stem}"
+            for group in self.groups
+            for stem in self.expected_stems
+            if (group, stem) not in found
+        ]
+
+    def is_complete(self) -> bool:
+        return bool(self.tracked) and not self.missing_stems()
+
+    def check(self) -> Tuple[float, List[str]]:
+        """
+        Rescan the folder and finalize stable files. Blocking (scandir, WAV header reads):
+        wait() runs it in the default executor.
+
+        Returns:
+            Seconds until the next file could become stable (poll_interval if none pending)
+            and the paths of the files finalized by this check
+        """
+        now = time.monotonic()
+        next_check = self.poll_interval
+        finalized = []
+        for name, st in self._scan().items():
+            if self.existing.get(name) == (st.st_size, st.st_mtime):
+                continue  # Untouched file from before the export
+            tracked = self.tracked.get(name)
+            if tracked is None or (tracked.size, tracked.mtime) != (st.st_size, st.st_mtime):
+                self.tracked[name] = _TrackedFile(st.st_size, st.st_mtime, now)
+                next_check = min(next_check, self.stable_time)
+                continue
+            if tracked.finalized:
+                continue
+            remaining = tracked.stable_since + self.stable_time - now
+            if remaining > 0:
+                next_check = min(next_check, remaining)
+                continue
+            path = os.path.join(self.folder, name)
+            if self._header_ok(path):
+                tracked.finalized = True
+                logger.info(f"Stem finalized: {name} ({st.st_size} bytes)")
+                finalized.append(path)
+            else:
+                next_check = min(next_check, self.poll_interval)
+        return max(0.05, next_check), finalized
+
+    async def wait(self, timeout: float) -> bool:
+        """
+        Wait until the expected stem set is complete or `timeout` seconds pass.
+
+        Returns:
+            True if every expected stem was finalized, False on timeout
+        """
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+        if self.inotify:
+            loop.add_reader(self.inotify.fd, changed.set)
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                delay, finalized = await loop.run_in_executor(None, self.check)
+                # Called on the event loop: the callbacks schedule uploads
+                if self.on_stem_ready:
+                    for path in finalized:
+                        self.on_stem_ready(path)
+                if self.is_complete():
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning(f"Export timed out, missing stems: {self.missing_stems()}")
+                    return False
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=min(delay, remaining))
+                except asyncio.TimeoutError:
+                    pass
+                changed.clear()
+                if self.inotify:
+                    self.inotify.drain()
+        finally:
+            if self.inotify:
+                loop.remove_reader(self.inotify.fd)
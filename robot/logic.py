@@ -1,12 +1,18 @@
 #!/usr/bin/env python3
 import os
 import time
+import fnmatch
 import subprocess
 import asyncio
 import pyautogui
 import logging
 import json
-from typing import Dict, Any
+import plistlib
+import functools
+from typing import Dict, Any, Optional, List, Callable, Tuple
+from robot.probes import ProgressDialogProbe, screen_grabber
+from robot.export_watcher import ExportWatcher, match_group
+from utils.timing import StageTimer
 
 # Configure logging
 logging.basicConfig(
@@ -19,26 +25,167 @@ logging.basicConfig(
 )
 
 class LogicRobot:
-    def __init__(self):
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
         self.logger = logging.getLogger(__name__)
+        self.config = config or {}
         # Fail-safe for pyautogui
         pyautogui.FAILSAFE = True
+        # Warm session state: Logic is kept running between jobs in session mode
+        self.session_mode = self.config.get('session_mode', False)
+        self.restart_after_jobs = self.config.get('restart_after_jobs', 20)
+        self.jobs_since_restart = 0
+        self.needs_restart = True
+        self.restarts = 0
+        # Front window title before the current mix file was opened
+        self.previous_title: Optional[str] = None
+
+    async def run_command(self, args, capture_output: bool = False) -> subprocess.CompletedProcess:
+        """Run a command without blocking the event loop"""
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            stdout=asyncio.subprocess.PIPE if capture_output else asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE if capture_output else asyncio.subprocess.DEVNULL
+        )
+        stdout, stderr = await process.communicate()
+        return subprocess.CompletedProcess(
+            args,
+            process.returncode,
+            stdout.decode() if stdout is not None else None,
+            stderr.decode() if stderr is not None else None
+        )
+        
+    def get_logic_version(self) -> str:
+        """Installed Logic Pro version (or the 'logic_version' config override)"""
+        version = self.config.get('logic_version')
+        if version:
+            return version
+        plist_path = os.path.join(
+            self.config.get('logic_app_path', '/Applications/Logic Pro.app'),
+            'Contents',
+            'Info.plist'
+        )
+        try:
+            with open(plist_path, 'rb') as f:
+                info = plistlib.load(f)
+            return f"{info.get('CFBundleShortVersionString', 'unknown')}-{info.get('CFBundleVersion', '0')}"
+        except Exception as e:
+            self.logger.warning(f"Could not read Logic Pro version from {plist_path}: {str(e)}")
+            return "unknown"
         
     async def notify(self, message: str):
         """Show notification using osascript"""
         try:
-            subprocess.run(['osascript', '-e', f'display notification "{message}"'])
+            await self.run_command(['osascript', '-e', f'display notification "{message}"'])
         except Exception as e:
             self.logger.error(f"Error sending notification: {str(e)}")
 
     async def force_quit_logic(self):
         """Force quit Logic Pro"""
         try:
-            subprocess.run(['killall', 'Logic Pro'], stderr=subprocess.DEVNULL)
+            self.needs_restart = True
+            await self.run_command(['killall', 'Logic Pro'])
             await asyncio.sleep(2)
         except Exception as e:
             self.logger.error(f"Error force quitting Logic Pro: {str(e)}")
 
+    async def front_window_title(self) -> Optional[str]:
+        """Title of the front Logic Pro window, None if Logic Pro has no window"""
+        apple_script = '''
+        tell application "System Events"
+            if exists process "Logic Pro" then
+                if exists window 1 of process "Logic Pro" then
+                    return "window:" & (name of window 1 of process "Logic Pro")
+                end if
+            end if
+            return "none"
+        end tell
+        '''
+        try:
+            result = await self.run_command(['osascript', '-e', apple_script],
+                                            capture_output=True)
+            output = (result.stdout or "").strip()
+            return output[len("window:"):] if output.startswith("window:") else None
+        except Exception as e:
+            self.logger.error(f"Error checking Logic Pro window: {str(e)}")
+            return None
+
+    @staticmethod
+    def project_name(file_path: str) -> str:
+        """Name Logic Pro gives the project of a mix file (shown in the window title)"""
+        return os.path.splitext(os.path.basename(file_path))[0]
+
+    async def wait_for_window(
+        self,
+        timeout: float,
+        fallback_delay: float,
+        previous_title: Optional[str] = None,
+        project: Optional[str] = None,
+        interval: float = 0.5
+    ) -> bool:
+        """
+        Poll until the front Logic Pro window changes, instead of sleeping a fixed time.
+        A warm Logic always has a window open, so a window only counts when its title
+        differs from previous_title (the front window before the file was opened) and,
+        if project is given, contains the project name. When no title ever matches (e.g.
+        the previous project had the same name) but a window is up, the old fixed delay
+        is waited instead.
+        
+        Returns:
+            False if Logic Pro showed no window at all within timeout
+        """
+        project = project.lower() if project else None
+        if project and previous_title and project in previous_title.lower():
+            self.logger.warning(f"Previous Logic Pro window was also {project!r}, waiting {fallback_delay}s")
+            await asyncio.sleep(fallback_delay)
+            return True
+        
+        deadline = time.monotonic() + timeout
+        title = None
+        while time.monotonic() < deadline:
+            title = await self.front_window_title()
+            if (title is not None and title != previous_title
+                    and (project is None or project in title.lower())):
+                return True
+            await asyncio.sleep(interval)
+        if title is None:
+            return False
+        self.logger.warning(f"Logic Pro window {title!r} did not change in {timeout}s, waiting {fallback_delay}s")
+        await asyncio.sleep(fallback_delay)
+        return True
+
+    async def open_in_logic(self, file_path: str) -> bool:
+        """
+        Open a mix file in Logic Pro.
+        In session mode a running Logic is reused and only restarted after
+        restart_after_jobs jobs or after an error; otherwise Logic is always relaunched.
+        """
+        launch_timeout = self.config.get('logic_launch_timeout', 30000) / 1000
+        restart = (
+            not self.session_mode
+            or self.needs_restart
+            or self.jobs_since_restart >= self.restart_after_jobs
+        )
+        
+        if restart:
+            # Force quit Logic Pro if running
+            await self.force_quit_logic()
+            self.restarts += 1
+            self.jobs_since_restart = 0
+        else:
+            self.logger.info(f"Reusing running Logic Pro ({self.jobs_since_restart} job(s) in this session)")
+        
+        # Open Logic Pro with the mix file; a warm Logic shows the Change Project dialog
+        self.previous_title = None if restart else await self.front_window_title()
+        await self.run_command(['open', '-a', 'Logic Pro', file_path])
+        if not await self.wait_for_window(
+            launch_timeout,
+            self.config.get('logic_open_delay', 10),
+            previous_title=self.previous_title
+        ):
+            return False
+        self.needs_restart = False
+        return True
+
     async def focus_logic_pro(self) -> bool:
         """Focus Logic Pro window using AppleScript"""
         apple_script = '''
@@ -47,7 +194,7 @@ class LogicRobot:
         end tell
         '''
         try:
-            subprocess.run(['osascript', '-e', apple_script])
+            await self.run_command(['osascript', '-e', apple_script])
             await asyncio.sleep(1)  # Wait for window to focus
             return True
         except Exception as e:
@@ -69,7 +216,7 @@ class LogicRobot:
         end tell
         '''
         try:
-            subprocess.run(['osascript', '-e', apple_script])
+            await self.run_command(['osascript', '-e', apple_script])
             await asyncio.sleep(1)  # Wait for window to move
             return True
         except Exception as e:
@@ -100,7 +247,7 @@ class LogicRobot:
         end tell
         '''
         try:
-            subprocess.run(['osascript', '-e', apple_script])
+            await self.run_command(['osascript', '-e', apple_script])
             await asyncio.sleep(2)  # Wait for space switch
             return True
         except Exception as e:
@@ -127,7 +274,7 @@ class LogicRobot:
                 end tell
             end tell
             '''
-            subprocess.run(['osascript', '-e', apple_script])
+            await self.run_command(['osascript', '-e', apple_script])
             await asyncio.sleep(2)  # Wait for window to stabilize
             return True
         except Exception as e:
@@ -171,92 +318,218 @@ class LogicRobot:
         '''
         
         try:
-            result = subprocess.run(['osascript', '-e', apple_script], 
-                                  capture_output=True, 
-                                  text=True)
+            result = await self.run_command(['osascript', '-e', apple_script],
+                                            capture_output=True)
             return "true" in result.stdout.lower()
         except Exception as e:
             self.logger.error(f"Error finding Change Project button: {str(e)}")
             return False
 
-    async def process_audio_file(self, file_path: str, folder_name: str) -> Dict[str, Any]:
+    def create_stem_split_probe(self) -> Optional[ProgressDialogProbe]:
+        """Create the Stem Splitter progress probe and take its baseline frame"""
+        try:
+            region = self.config.get('stem_split_region', [660, 390, 600, 300])
+            probe = ProgressDialogProbe(
+                screen_grabber(region),
+                pixel_threshold=self.config.get('stem_split_pixel_threshold', 24),
+                change_ratio=self.config.get('stem_split_change_ratio', 0.2)
+            )
+            probe.start()
+            return probe
+        except Exception as e:
+            self.logger.error(f"Error creating Stem Splitter probe: {str(e)}")
+            return None
+
+    async def wait_for_stem_splitter(self, probe: Optional[ProgressDialogProbe]) -> bool:
+        """
+        Wait for the Stem Splitter progress dialog to disappear,
+        capped by stem_split_timeout (ms) from config.json.
+        """
+        timeout = self.config.get('stem_split_timeout', 240000) / 1000
+        if probe is None:
+            # No screen access, fall back to waiting the whole timeout
+            await asyncio.sleep(timeout)
+            return False
+        return await probe.wait(
+            timeout,
+            interval=self.config.get('stem_split_poll_interval', 2.0)
+        )
+
+    def create_export_watcher(
+        self,
+        on_stem_ready: Optional[Callable[[str], None]] = None,
+        groups: Optional[List[str]] = None
+    ) -> ExportWatcher:
+        """
+        Start watching the Logic export folder; call right before triggering the export.
+        on_stem_ready is called with the path of every stem as soon as it is finalized.
+        """
+        watcher = ExportWatcher(
+            self.config.get('cleanup_folder', os.path.expanduser('~/Music/Logic')),
+            self.config.get('expected_stems', ["Vocals", "Drums", "Bass", "Other"]),
+            stable_time=self.config.get('export_stable_time', 2.0),
+            poll_interval=self.config.get('export_poll_interval', 1.0),
+            on_stem_ready=on_stem_ready,
+            groups=groups
+        )
+        watcher.start()
+        return watcher
+
+    async def prepare_logic_window(self, file_path: str) -> Optional[Tuple[str, str]]:
+        """
+        Bring Logic Pro up with the mix file open, in Space 1 and ready for GUI automation.
+        
+        Returns:
+            None when ready, otherwise an (error, message) tuple
+        """
+        # First move to Space 1
+        if not await self.move_to_space_one():
+            return "Failed to move to Space 1", "Could not switch to correct desktop space"
+        
+        # Open the mix file, relaunching Logic Pro unless a warm session can be reused
+        if not await self.open_in_logic(file_path):
+            await self.force_quit_logic()
+            return "Logic Pro window did not appear", "Timed out waiting for Logic Pro to open the file"
+        
+        # Ensure Logic Pro is ready for interaction in Space 1
+        if not await self.ensure_logic_pro_ready():
+            return "Failed to prepare Logic Pro window", "Could not focus or move Logic Pro window to Space 1"
+        
+        # Check for Change Project button
+        if not await self.find_and_click_change_project():
+            self.logger.warning("Change Project button not found, continuing anyway...")
+        
+        # Wait for the window of this mix: before it the GUI steps would hit the previous project
+        await self.wait_for_window(
+            self.config.get('logic_launch_timeout', 30000) / 1000,
+            self.config.get('change_project_delay', 2),
+            previous_title=self.previous_title,
+            project=self.project_name(file_path)
+        )
+        
+        # Ensure we're still in Space 1 before GUI automation: the clicks use fixed coordinates
+        if self.jobs_since_restart == 0:
+            await self.move_to_space_one()
+        await self.ensure_logic_pro_ready()
+        return None
+
+    async def run_stem_splitter(self, label: str, track_index: int = 0):
+        """Run Stem Splitter on the region of a track and wait for it to finish"""
+        # Click on the track area
+        track_y = 223 + track_index * self.config.get('track_height', 100)
+        pyautogui.rightClick(x=898, y=track_y)
+        await asyncio.sleep(2)
+        
+        # Navigate to Stem Splitter
+        pyautogui.press('s')
+        await asyncio.sleep(1)
+        pyautogui.press('enter')
+        await asyncio.sleep(1)
+        probe = self.create_stem_split_probe()
+        pyautogui.press('enter')
+        await asyncio.sleep(1)
+        
+        self.logger.info(f"🔄 Stem Splitter started for: {label}")
+        if await self.wait_for_stem_splitter(probe):
+            self.logger.info(f"✅ Stem Splitter completed: {label}")
+        else:
+            self.logger.warning(f"Stem Splitter completion not detected before timeout, continuing anyway: {label}")
+
+    async def run_export(
+        self,
+        label: str,
+        on_stem_ready: Optional[Callable[[str], None]] = None,
+        groups: Optional[List[str]] = None
+    ) -> ExportWatcher:
+        """
+        Export all tracks and wait until the expected stems are written.
+        
+        Returns:
+            The (closed) export watcher, holding the finalized files and missing stems
+        """
+        watcher = self.create_export_watcher(on_stem_ready, groups)
+        pyautogui.hotkey('command', 'r')  # File > Export shortcut
+        await asyncio.sleep(2)
+        pyautogui.press('enter')
+        await asyncio.sleep(1)
+        pyautogui.press('enter')
+        
+        self.logger.info(f"📁 Export started for: {label}")
+        try:
+            if not await watcher.wait(self.config.get('export_timeout', 60000) / 1000):
+                self.logger.warning(f"Export incomplete for {label}, missing: {watcher.missing_stems()}")
+                # Logic may still be exporting: the next job must not start from that state
+                self.needs_restart = True
+        finally:
+            watcher.close()
+        return watcher
+
+    async def close_project(self, jobs: int = 1):
+        """Close the project, quitting Logic Pro unless the session is kept warm"""
+        # Ensure we're in Space 1 before closing
+        # await self.move_to_space_one()
+        # await self.ensure_logic_pro_ready()
+        
+        # Close Logic Pro
+        pyautogui.click(x=730, y=388)  # Click close button
+        await asyncio.sleep(2)
+        self.jobs_since_restart += jobs
+        if not self.session_mode:
+            await self.force_quit_logic()
+
+    async def import_audio_file(self, file_path: str):
+        """Import an audio file into the open project on a new track"""
+        # New audio track (Track > New Audio Track), then back to the project start
+        pyautogui.hotkey('command', 'option', 'a')
+        await asyncio.sleep(1)
+        pyautogui.press('enter')
+        await asyncio.sleep(1)
+        
+        # File > Import > Audio File, then type the path in "Go to folder"
+        pyautogui.hotkey('command', 'shift', 'i')
+        await asyncio.sleep(2)
+        pyautogui.hotkey('command', 'shift', 'g')
+        await asyncio.sleep(1)
+        pyautogui.write(file_path)
+        pyautogui.press('enter')
+        await asyncio.sleep(1)
+        pyautogui.press('enter')
+        await asyncio.sleep(2)
+
+    async def process_audio_file(
+        self,
+        file_path: str,
+        folder_name: str,
+        on_stem_ready: Optional[Callable[[str], None]] = None
+    ) -> Dict[str, Any]:
         """Process a single audio file with Logic Pro automation"""
+        timer = StageTimer()
         try:
             self.logger.info(f"Starting processing: {folder_name}")
             
-            # First move to Space 1
-            if not await self.move_to_space_one():
-                return {
-                    "status": "error",
-                    "folder": folder_name,
-                    "file": file_path,
-                    "error": "Failed to move to Space 1",
-                    "message": "Could not switch to correct desktop space"
-                }
-            
-            # Force quit Logic Pro if running
-            await self.force_quit_logic()
-            
-            # Open Logic Pro with the mix file
-            subprocess.run(['open', '-a', 'Logic Pro', file_path])
-            await asyncio.sleep(10)  # Wait for Logic to load
-            
-            # Ensure Logic Pro is ready for interaction in Space 1
-            if not await self.ensure_logic_pro_ready():
+            with timer.stage("logic_launch"):
+                failure = await self.prepare_logic_window(file_path)
+            if failure:
                 return {
                     "status": "error",
                     "folder": folder_name,
                     "file": file_path,
-                    "error": "Failed to prepare Logic Pro window",
-                    "message": "Could not focus or move Logic Pro window to Space 1"
+                    "error": failure[0],
+                    "message": failure[1],
+                    "timings": timer.to_dict()
                 }
             
-            # Check for Change Project button
-            if not await self.find_and_click_change_project():
-                self.logger.warning("Change Project button not found, continuing anyway...")
-            await asyncio.sleep(2)
-            
-            # Ensure we're still in Space 1 before GUI automation
-            await self.move_to_space_one()
-            await self.ensure_logic_pro_ready()
-            
             # GUI Automation sequence
             try:
-                # Click on the track area
-                pyautogui.rightClick(x=898, y=223)
-                await asyncio.sleep(2)
-                
-                # Navigate to Stem Splitter
-                pyautogui.press('s')
-                await asyncio.sleep(1)
-                pyautogui.press('enter')
-                await asyncio.sleep(1)
-                pyautogui.press('enter')
-                await asyncio.sleep(1)
-                
-                self.logger.info(f"🔄 Stem Splitter started for: {folder_name}")
-                await asyncio.sleep(240)  # Wait for processing
-                
-                self.logger.info(f"✅ Stem Splitter completed. Starting export: {folder_name}")
+                with timer.stage("stem_split"):
+                    await self.run_stem_splitter(folder_name)
                 
                 # Export sequence
-                pyautogui.hotkey('command', 'r')  # File > Export shortcut
-                await asyncio.sleep(2)
-                pyautogui.press('enter')
-                await asyncio.sleep(1)
-                pyautogui.press('enter')
-                
-                self.logger.info(f"📁 Export started for: {folder_name}")
-                await asyncio.sleep(40)  # Wait for export
-                
-                # Ensure we're in Space 1 before closing
-                # await self.move_to_space_one()
-                # await self.ensure_logic_pro_ready()
+                with timer.stage("export"):
+                    watcher = await self.run_export(folder_name, on_stem_ready)
                 
-                # Close Logic Pro
-                pyautogui.click(x=730, y=388)  # Click close button
-                await asyncio.sleep(2)
-                await self.force_quit_logic()
+                with timer.stage("close"):
+                    await self.close_project()
                 
                 self.logger.info(f"✅ {folder_name} processed and exported!")
                 
@@ -264,7 +537,11 @@ class LogicRobot:
                     "status": "success",
                     "folder": folder_name,
                     "file": file_path,
-                    "message": "Processing completed successfully"
+                    "message": "Processing completed successfully",
+                    "export_complete": watcher.is_complete(),
+                    "missing_stems": watcher.missing_stems(),
+                    "exported_files": watcher.finalized_files(),
+                    "timings": timer.to_dict()
                 }
                 
             except Exception as e:
@@ -275,7 +552,8 @@ class LogicRobot:
                     "folder": folder_name,
                     "file": file_path,
                     "error": str(e),
-                    "message": "GUI automation failed"
+                    "message": "GUI automation failed",
+                    "timings": timer.to_dict()
                 }
                 
         except Exception as e:
@@ -286,24 +564,125 @@ class LogicRobot:
                 "folder": folder_name,
                 "file": file_path,
                 "error": str(e),
-                "message": "Processing failed"
+                "message": "Processing failed",
+                "timings": timer.to_dict()
             }
 
-    async def verify_export(self, folder_name: str) -> bool:
-        """Verify if files were exported correctly to Music/Logic folder"""
+    async def process_audio_files(
+        self,
+        items: List[Tuple[str, str]],
+        on_stem_ready: Optional[Callable[[str, str], None]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Process several audio files in one Logic Pro project: the first file is opened,
+        the others are imported as new tracks, Stem Splitter runs on every track and a
+        single export writes the stems of all songs.
+        
+        Args:
+            items: List of (file_path, folder_name)
+            on_stem_ready: Called with (folder_name, stem_path) for every finalized stem
+            
+        Returns:
+            One result per item, in the same order
+        """
+        names = [folder_name for _, folder_name in items]
+        label = ", ".join(names)
+        # Exported stems are named after their track, i.e. after the mix file
+        item_groups = [self.project_name(file_path).lower() for file_path, _ in items]
+        if len(set(item_groups)) < len(items):
+            raise ValueError(f"Mix files with the same name cannot be exported together: {label}")
+        groups = dict(zip(item_groups, names))
+        # One timer for the whole project, so every song reports the same steps
+        timer = StageTimer()
+        
+        def error_results(error: str, message: str) -> List[Dict[str, Any]]:
+            return [
+                {
+                    "status": "error",
+                    "folder": folder_name,
+                    "file": file_path,
+                    "error": error,
+                    "message": message,
+                    "timings": timer.to_dict()
+                }
+                for file_path, folder_name in items
+            ]
+        
+        try:
+            self.logger.info(f"Starting batch processing of {len(items)} songs: {label}")
+            
+            with timer.stage("logic_launch"):
+                failure = await self.prepare_logic_window(items[0][0])
+            if failure:
+                return error_results(*failure)
+            
+            try:
+                with timer.stage("import"):
+                    for file_path, _ in items[1:]:
+                        await self.import_audio_file(file_path)
+                
+                with timer.stage("stem_split"):
+                    for index, (_, folder_name) in enumerate(items):
+                        await self.run_stem_splitter(folder_name, track_index=index)
+                
+                def stem_ready(path: str):
+                    group = match_group(path, list(groups))
+                    if group and on_stem_ready:
+                        on_stem_ready(groups[group], path)
+                
+                with timer.stage("export"):
+                    watcher = await self.run_export(label, stem_ready, groups=list(groups))
+                
+                with timer.stage("close"):
+                    await self.close_project(jobs=len(items))
+                
+            except Exception as e:
+                self.logger.error(f"Error during GUI automation: {str(e)}")
+                await self.force_quit_logic()
+                return error_results(str(e), "GUI automation failed")
+            
+            # Fan the exported stems back out to their songs
+            files_by_folder = {folder_name: [] for folder_name in names}
+            for path in watcher.finalized_files():
+                group = match_group(path, list(groups))
+                if group:
+                    files_by_folder[groups[group]].append(path)
+            
+            missing = watcher.missing_stems()
+            results = []
+            for (file_path, folder_name), group in zip(items, item_groups):
+                results.append({
+                    "status": "success",
+                    "folder": folder_name,
+                    "file": file_path,
+                    "message": "Processing completed successfully",
+                    "batch_size": len(items),
+                    "export_complete": not any(m.startswith(f"{group}/") for m in missing),
+                    "missing_stems": [m[len(group) + 1:] for m in missing if m.startswith(f"{group}/")],
+                    "exported_files": files_by_folder[folder_name],
+                    "timings": timer.to_dict()
+                })
+            self.logger.info(f"✅ Batch of {len(items)} songs processed and exported!")
+            return results
+            
+        except Exception as e:
+            self.logger.error(f"Error processing batch {label}: {str(e)}")
+            await self.force_quit_logic()
+            return error_results(str(e), "Processing failed")
+
+    async def verify_export(self, folder_name: str, exported_files: Optional[List[str]] = None) -> bool:
+        """Verify that the stems reported by the export watcher are in the Logic export folder"""
         try:
-            logic_folder = "/Users/moises/Music/Logic"
+            logic_folder = self.config.get('cleanup_folder', os.path.expanduser('~/Music/Logic'))
             
             if not os.path.exists(logic_folder):
                 self.logger.error(f"Logic export folder does not exist: {logic_folder}")
                 return False
             
-            # Look for exported files with the folder name
-            exported_files = []
-            for file in os.listdir(logic_folder):
-                print("File: ", file)
-                if folder_name.lower() in file.lower() and file.endswith('.wav'):
-                    exported_files.append(file)
+            exported_files = [
+                f for f in (exported_files or [])
+                if f.endswith('.wav') and os.path.isfile(f)
+            ]
             
             if len(exported_files) > 0:
                 self.logger.info(f"Found {len(exported_files)} exported files for {folder_name}")
@@ -316,44 +695,103 @@ class LogicRobot:
             self.logger.error(f"Error verifying export: {str(e)}")
             return False
 
-    async def process_folder(self, folder_path: str, folder_name: str = None) -> Dict[str, Any]:
+    def find_mix_file(self, folder_path: str, folder_name: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        Find the _mix.wav file (the file matching mix_pattern) of a folder.
+        
+        Returns:
+            Tuple of (mix file path, None) or (None, skipped result)
+        """
+        # Check for _mix.wav file
+        mix_pattern = self.config.get('mix_pattern', '*_mix.wav')
+        mix_files = sorted(f for f in os.listdir(folder_path) if fnmatch.fnmatch(f, mix_pattern))
+        wav_files = [f for f in os.listdir(folder_path) if f.endswith('.wav')]
+        
+        if not mix_files:
+            return None, {
+                "status": "skipped",
+                "folder": folder_name,
+                "message": "No _mix.wav file found"
+            }
+        
+        if len(wav_files) > len(mix_files):
+            return None, {
+                "status": "skipped",
+                "folder": folder_name,
+                "message": "Already has other .wav files"
+            }
+        
+        return os.path.join(folder_path, mix_files[0]), None
+
+    async def apply_export_verification(self, result: Dict[str, Any]):
+        """Verify the export of a successful result, turning it into an error if stems are missing"""
+        if result["status"] == "success":
+            if await self.verify_export(result["folder"], result.get("exported_files")):
+                result["export_verified"] = True
+                result["message"] = "Processing and export completed successfully"
+            else:
+                result["status"] = "error"
+                result["error"] = "Export verification failed - files not found in Logic folder"
+                result["export_verified"] = False
+                result["message"] = "Processing completed but export verification failed"
+
+    async def process_folders(
+        self,
+        folders: List[Tuple[str, str]],
+        on_stem_ready: Optional[Callable[[str, str], None]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Process several folders containing a _mix.wav file in one Logic Pro session.
+        
+        Args:
+            folders: List of (folder_path, folder_name)
+            on_stem_ready: Called with (folder_name, stem_path) for every finalized stem
+            
+        Returns:
+            One result per folder, in the same order
+        """
+        results: Dict[str, Dict[str, Any]] = {}
+        items = []
+        for folder_path, folder_name in folders:
+            mix_file, skipped = self.find_mix_file(folder_path, folder_name)
+            if skipped:
+                results[folder_name] = skipped
+            else:
+                items.append((mix_file, folder_name))
+        
+        if len(items) == 1:
+            file_path, folder_name = items[0]
+            stem_ready = functools.partial(on_stem_ready, folder_name) if on_stem_ready else None
+            batch_results = [await self.process_audio_file(file_path, folder_name, stem_ready)]
+        elif items:
+            batch_results = await self.process_audio_files(items, on_stem_ready)
+        else:
+            batch_results = []
+        
+        for result in batch_results:
+            await self.apply_export_verification(result)
+            results[result["folder"]] = result
+        return [results[folder_name] for _, folder_name in folders]
+
+    async def process_folder(
+        self,
+        folder_path: str,
+        folder_name: str = None,
+        on_stem_ready: Optional[Callable[[str], None]] = None
+    ) -> Dict[str, Any]:
         """Process a folder containing _mix.wav file"""
         try:
             if not folder_name:
                 folder_name = os.path.basename(folder_path)
             
-            # Check for _mix.wav file
-            mix_files = [f for f in os.listdir(folder_path) if f.endswith('_mix.wav')]
-            wav_files = [f for f in os.listdir(folder_path) if f.endswith('.wav')]
-            
-            if not mix_files:
-                return {
-                    "status": "skipped",
-                    "folder": folder_name,
-                    "message": "No _mix.wav file found"
-                }
-            
-            if len(wav_files) > len(mix_files):
-                return {
-                    "status": "skipped",
-                    "folder": folder_name,
-                    "message": "Already has other .wav files"
-                }
+            mix_file, skipped = self.find_mix_file(folder_path, folder_name)
+            if skipped:
+                return skipped
             
-            mix_file = os.path.join(folder_path, mix_files[0])
-            result = await self.process_audio_file(mix_file, folder_name)
+            result = await self.process_audio_file(mix_file, folder_name, on_stem_ready)
             
             # If processing was successful, verify export
-            if result["status"] == "success":
-                if await self.verify_export(folder_name):
-                    result["export_verified"] = True
-                    result["message"] = "Processing and export completed successfully"
-                else:
-                    result["status"] = "error"
-                    result["error"] = "Export verification failed - files not found in Logic folder"
-                    result["export_verified"] = False
-                    result["message"] = "Processing completed but export verification failed"
-            
+            await self.apply_export_verification(result)
             return result
             
         except Exception as e:
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+import os
+import time
+import asyncio
+import logging
+import numpy as np
+from typing import Callable, Iterable, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+Region = Sequence[int]  # (left, top, width, height)
+
+def screen_grabber(region: Region) -> Callable[[], np.ndarray]:
+    """Return a function grabbing `region` of the screen with pyautogui"""
+    def grab() -> np.ndarray:
+        # Imported lazily so the probes can run (and be tested) without a display
+        import pyautogui
+        return np.asarray(pyautogui.screenshot(region=tuple(region)))
+    return grab
+
+def recorded_grabber(frames: Iterable) -> Callable[[], np.ndarray]:
+    """
+    Return a function replaying a recorded sequence of screenshots.
+    Frames can be arrays or image file paths; the last frame is repeated once exhausted.
+    """
+    frames = list(frames)
+    state = {"index": 0}
+
+    def grab() -> np.ndarray:
+        frame = frames[min(state["index"], len(frames) - 1)]
+        state["index"] += 1
+        if isinstance(frame, (str, os.PathLike)):
+            from PIL import Image
+            with Image.open(frame) as image:
+                return np.asarray(image.convert("RGB"))
+        return np.asarray(frame)
+    return grab
+
+def load_recording(folder: str) -> List[str]:
+    """List the .png screenshots of a recording folder in name order"""
+    return sorted(
+        os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith('.png')
+    )
+
+def changed_fraction(a: np.ndarray, b: np.ndarray, pixel_threshold: int = 24) -> float:
+    """
+    Fraction of pixels that differ between two frames.
+    A pixel counts as changed when any channel moved by more than pixel_threshold.
+    """
+    if a.shape != b.shape:
+        return 1.0
+    diff = np.abs(a.astype(np.int16) - b.astype(np.int16))
+    if diff.ndim == 3:
+        diff = diff.max(axis=2)
+    return float(np.count_nonzero(diff > pixel_threshold)) / diff.size
+
+class ProgressDialogProbe:
+    """
+    Detects a progress dialog appearing and then disappearing from a screen region.
+
+    The probe compares every new frame with a baseline taken before the dialog was
+    triggered. Once the region changes by more than `change_ratio` the dialog is
+    considered visible and that frame becomes the reference. The dialog is gone when
+    the region differs from the reference by more than `change_ratio` and has stayed
+    unchanged for `stable_frames` consecutive frames.
+    """
+
+    def __init__(
+        self,
+        grab: Callable[[], np.ndarray],
+        pixel_threshold: int = 24,
+        change_ratio: float = 0.2,
+        stable_frames: int = 2,
+        downsample: int = 2
+    ):
+        self.grab = grab
+        self.pixel_threshold = pixel_threshold
+        self.change_ratio = change_ratio
+        self.stable_frames = stable_frames
+        self.downsample = max(1, downsample)
+        self.baseline: Optional[np.ndarray] = None
+        self.reference: Optional[np.ndarray] = None
+        self.previous: Optional[np.ndarray] = None
+        self.stable_count = 0
+        self.dialog_seen = False
+
+    def capture(self) -> np.ndarray:
+        frame = np.asarray(self.grab())
+        return frame[::self.downsample, ::self.downsample]
+
+    def start(self):
+        """Take the baseline frame; call right before triggering the dialog"""
+        self.baseline = self.capture()
+        self.reference = None
+        self.previous = None
+        self.stable_count = 0
+        self.dialog_seen = False
+
+    def _changed(self, a: np.ndarray, b: np.ndarray) -> float:
+        return changed_fraction(a, b, self.pixel_threshold)
+
+    def update(self, frame: np.ndarray) -> bool:
+        """Feed a new frame and return True once the dialog has disappeared"""
+        if self.baseline is None:
+            self.baseline = frame
+            return False
+
+        if not self.dialog_seen:
+            if self._changed(self.baseline, frame) > self.change_ratio:
+                self.dialog_seen = True
+                self.reference = frame
+                logger.info("Progress dialog detected")
+            self.previous = frame
+            return False
+
+        if self.previous is not None and self._changed(self.previous, frame) <= self.change_ratio:
+            self.stable_count += 1
+        else:
+            self.stable_count = 0
+        self.previous = frame
+
+        return (
+            self._changed(self.reference, frame) > self.change_ratio
+            and self.stable_count >= self.stable_frames
+        )
+
+    def poll(self) -> bool:
+        return self.update(self.capture())
+
+    async def wait(self, timeout: float, interval: float = 2.0) -> bool:
+        """
+        Poll the screen until the dialog disappears or `timeout` seconds pass.
+
+        Returns:
+            True if completion was detected, False on timeout
+        """
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                # Screenshots are blocking, keep them off the event loop
+                if await loop.run_in_executor(None, self.poll):
+                    return True
+            except Exception as e:
+                logger.warning(f"Error grabbing screen for progress probe: {str(e)}")
+            await asyncio.sleep(min(interval, max(0.0, deadline - time.monotonic())))
+        return False
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import fnmatch
+import asyncio
+import logging
+from typing import Dict, Any, Optional, List, Callable, Tuple
+from utils.timing import StageTimer
+
+class SimulatedRobot:
+    """
+    Stand-in for LogicRobot that needs neither Logic Pro nor a display.
+
+    Each run takes `simulated_robot_delay` seconds: most of it "splitting", then a copy of
+    the mix per expected stem is written into the export folder (cleanup_folder), named
+    like Logic names its exports, and the rest "closing the project". Results and stem
+    callbacks have the same shape as LogicRobot's, so several workers can run and be
+    tested on one machine (select it with "robot": "simulated").
+    """
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.logger = logging.getLogger(__name__)
+        self.config = config or {}
+        self.delay = self.config.get('simulated_robot_delay', 2.0)
+        self.export_folder = self.config.get('cleanup_folder', os.path.expanduser('~/Music/Logic'))
+        self.expected_stems = self.config.get('expected_stems', ["Vocals", "Drums", "Bass", "Other"])
+        self.processed = 0
+
+    def get_logic_version(self) -> str:
+        return self.config.get('logic_version') or "simulated"
+
+    def find_mix_file(self, folder_path: str) -> Optional[str]:
+        mix_pattern = self.config.get('mix_pattern', '*_mix.wav')
+        mix_files = sorted(f for f in os.listdir(folder_path) if fnmatch.fnmatch(f, mix_pattern))
+        return os.path.join(folder_path, mix_files[0]) if mix_files else None
+
+    def export_stems(self, mix_file: str) -> List[str]:
+        """Write one stem per expected stem name next to the other exports"""
+        os.makedirs(self.export_folder, exist_ok=True)
+        base = os.path.splitext(os.path.basename(mix_file))[0]
+        exported = []
+        for stem in self.expected_stems:
+            path = os.path.join(self.export_folder, f"{base}_{stem}.wav")
+            shutil.copyfile(mix_file, f"{path}.part")
+            os.replace(f"{path}.part", path)
+            exported.append(path)
+        return exported
+
+    async def process_folder(
+        self,
+        folder_path: str,
+        folder_name: str = None,
+        on_stem_ready: Optional[Callable[[str], None]] = None
+    ) -> Dict[str, Any]:
+        """Simulate the processing of a folder containing a _mix.wav file"""
+        folder_name = folder_name or os.path.basename(folder_path)
+        mix_file = self.find_mix_file(folder_path)
+        if mix_file is None:
+            return {
+                "status": "skipped",
+                "folder": folder_name,
+                "message": "No _mix.wav file found"
+            }
+
+        self.logger.info(f"Simulating stem split of {folder_name} ({self.delay}s)")
+        timer = StageTimer()
+        with timer.stage("stem_split"):
+            await asyncio.sleep(self.delay * 0.8)
+        try:
+            with timer.stage("export"):
+                exported = await asyncio.to_thread(self.export_stems, mix_file)
+        except Exception as e:
+            return {
+                "status": "error",
+                "folder": folder_name,
+                "file": mix_file,
+                "error": str(e),
+                "message": "Simulated export failed",
+                "timings": timer.to_dict()
+            }
+        if on_stem_ready:
+            for path in exported:
+                on_stem_ready(path)
+        # Streamed uploads run while Logic closes the project, as with the real robot
+        with timer.stage("close"):
+            await asyncio.sleep(self.delay * 0.2)
+        self.processed += 1
+
+        return {
+            "status": "success",
+            "folder": folder_name,
+            "file": mix_file,
+            "message": "Processing and export completed successfully",
+            "export_complete": True,
+            "missing_stems": [],
+            "export_verified": True,
+            "exported_files": exported,
+            "simulated": True,
+            "timings": timer.to_dict()
+        }
+
+    async def process_folders(
+        self,
+        folders: List[Tuple[str, str]],
+        on_stem_ready: Optional[Callable[[str, str], None]] = None
+    ) -> List[Dict[str, Any]]:
+        """Simulate a batch run: every folder in turn, one result per folder"""
+        results = []
+        for folder_path, folder_name in folders:
+            stem_ready = None
+            if on_stem_ready:
+                stem_ready = lambda path, folder_name=folder_name: on_stem_ready(folder_name, path)
+            result = await self.process_folder(folder_path, folder_name, stem_ready)
+            results.append(dict(result, batch_size=len(folders)))
+        return results
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Tests for the export watcher, writing stems into a temporary folder the way Logic does.
+The inotify tests run on Linux only; the polling path is tested everywhere.
+"""
+
+import os
+import sys
+import time
+import select
+import asyncio
+import tempfile
+import numpy as np
+import soundfile as sf
+import pytest
+from robot.export_watcher import ExportWatcher, _Inotify, match_group
+
+STEMS = ["Vocals", "Drums", "Bass", "Other"]
+linux_only = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux only")
+
+def write_stem(folder: str, name: str, frames: int = 4410):
+    sf.write(os.path.join(folder, name), np.zeros((frames, 2)), 44100)
+
+async def write_incrementally(folder: str, name: str, chunks: int, interval: float):
+    """Append to a stem for chunks * interval seconds, like a long export"""
+    with sf.SoundFile(os.path.join(folder, name), 'w', samplerate=44100, channels=2) as f:
+        for _ in range(chunks):
+            f.write(np.zeros((4410, 2)))
+            f.flush()
+            await asyncio.sleep(interval)
+
+def watch(folder: str, polling: bool = False, **kwargs) -> ExportWatcher:
+    kwargs = {"stable_time": 0.3, "poll_interval": 0.1, **kwargs}
+    watcher = ExportWatcher(folder, kwargs.pop("expected_stems", STEMS), **kwargs)
+    watcher.start()
+    if polling and watcher.inotify:
+        watcher.close()  # Same as a platform without inotify
+    return watcher
+
+@linux_only
+def test_inotify_wakes_up_on_changes():
+    with tempfile.TemporaryDirectory() as folder:
+        inotify = _Inotify(folder)
+        try:
+            assert select.select([inotify.fd], [], [], 0)[0] == []
+            write_stem(folder, "a - Vocals.wav")
+            assert select.select([inotify.fd], [], [], 1)[0] == [inotify.fd]
+            inotify.drain()
+            assert select.select([inotify.fd], [], [], 0)[0] == []
+        finally:
+            inotify.close()
+
+@linux_only
+def test_inotify_is_used_on_linux():
+    with tempfile.TemporaryDirectory() as folder:
+        watcher = watch(folder)
+        assert watcher.inotify is not None
+        watcher.close()
+        assert watcher.inotify is None
+
+@linux_only
+def test_inotify_notices_new_stems_between_polls():
+    async def main():
+        with tempfile.TemporaryDirectory() as folder:
+            watcher = watch(folder, expected_stems=["Vocals"], poll_interval=30)
+            asyncio.get_running_loop().call_later(0.2, write_stem, folder, "Song_mix - Vocals.wav")
+            started = time.monotonic()
+            assert await watcher.wait(10)
+            assert time.monotonic() - started < 5  # Long before the next poll
+            watcher.close()
+    asyncio.run(main())
+
+@pytest.mark.parametrize("polling", [False, True])
+def test_completes_when_all_stems_are_written_at_once(polling):
+    async def main():
+        with tempfile.TemporaryDirectory() as folder:
+            ready = []
+            watcher = watch(folder, polling, on_stem_ready=ready.append)
+            loop = asyncio.get_running_loop()
+            loop.call_later(0.2, lambda: [write_stem(folder, f"Song_mix - {stem}.wav") for stem in STEMS])
+            started = time.monotonic()
+            assert await watcher.wait(5)
+            # Finalized only once the files stayed unchanged for stable_time
+            assert time.monotonic() - started >= 0.2 + watcher.stable_time
+            assert len(watcher.finalized_files()) == 4
+            assert sorted(ready) == watcher.finalized_files()
+            watcher.close()
+    asyncio.run(main())
+
+@pytest.mark.parametrize("polling", [False, True])
+def test_growing_stem_is_finalized_after_the_last_write(polling):
+    async def main():
+        with tempfile.TemporaryDirectory() as folder:
+            watcher = watch(folder, polling, expected_stems=["Vocals"])
+            writer = asyncio.create_task(write_incrementally(folder, "Song_mix - Vocals.wav", 8, 0.1))
+            assert await watcher.wait(5)
+            # Not finalized while it was growing: every chunk was written before
+            assert writer.done()
+            assert sf.info(watcher.finalized_files()[0]).frames == 8 * 4410
+            watcher.close()
+    asyncio.run(main())
+
+def test_completion_needs_every_expected_stem():
+    async def main():
+        with tempfile.TemporaryDirectory() as folder:
+            watcher = watch(folder)
+            for stem in STEMS[:3]:
+                write_stem(folder, f"Song_mix - {stem}.wav")
+            assert not await watcher.wait(1)
+            assert watcher.missing_stems() == ["other"]
+            write_stem(folder, "Song_mix - Other.wav")
+            assert await watcher.wait(5)
+            watcher.close()
+    asyncio.run(main())
+
+def test_files_from_before_the_export_are_ignored():
+    async def main():
+        with tempfile.TemporaryDirectory() as folder:
+            for stem in STEMS:
+                write_stem(folder, f"Old_mix - {stem}.wav")
+            watcher = watch(folder)
+            assert not await watcher.wait(1)
+            assert watcher.finalized_files() == []
+            # Overwritten by the new export: no longer the file from before
+            write_stem(folder, "Old_mix - Vocals.wav", frames=8820)
+            assert not await watcher.wait(1)
+            assert [os.path.basename(f) for f in watcher.finalized_files()] == ["Old_mix - Vocals.wav"]
+            watcher.close()
+    asyncio.run(main())
+
+def test_invalid_wav_is_never_finalized():
+    async def main():
+        with tempfile.TemporaryDirectory() as folder:
+            watcher = watch(folder, expected_stems=["Vocals"])
+            with open(os.path.join(folder, "Song_mix - Vocals.wav"), "wb") as f:
+                f.write(b"RIFF" + b"\0" * 40)
+            assert not await watcher.wait(1)
+            assert watcher.finalized_files() == []
+            watcher.close()
+    asyncio.run(main())
+
+def test_match_group_prefers_the_longest_name():
+    groups = ["song1_mix", "song10_mix"]
+    assert match_group("/x/Song1_mix - Vocals.wav", groups) == "song1_mix"
+    assert match_group("/x/Song10_mix - Vocals.wav", groups) == "song10_mix"
+    assert match_group("/x/Other_mix - Vocals.wav", groups) is None
+
+@pytest.mark.parametrize("polling", [False, True])
+def test_grouped_export_needs_every_stem_of_every_song(polling):
+    async def main():
+        with tempfile.TemporaryDirectory() as folder:
+            watcher = watch(folder, polling, expected_stems=["Vocals", "Bass"], groups=["Song1_mix", "Song10_mix"])
+            write_stem(folder, "Song1_mix - Vocals.wav")
+            write_stem(folder, "Song1_mix - Bass.wav")
+            write_stem(folder, "Song10_mix - Vocals.wav")
+            assert not await watcher.wait(1)
+            assert watcher.missing_stems() == ["song10_mix/bass"]
+            write_stem(folder, "Song10_mix - Bass.wav")
+            assert await watcher.wait(5)
+            watcher.close()
+    asyncio.run(main())
+
+if __name__ == "__main__":
+    if sys.platform.startswith("linux"):
+        test_inotify_wakes_up_on_changes()
+        test_inotify_is_used_on_linux()
+        test_inotify_notices_new_stems_between_polls()
+    for polling in (False, True):
+        test_completes_when_all_stems_are_written_at_once(polling)
+        test_growing_stem_is_finalized_after_the_last_write(polling)
+        test_grouped_export_needs_every_stem_of_every_song(polling)
+    test_completion_needs_every_expected_stem()
+    test_files_from_before_the_export_are_ignored()
+    test_invalid_wav_is_never_finalized()
+    test_match_group_prefers_the_longest_name()
+    print("✅ All export watcher tests passed")
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Tests for the worker fleet: several local worker processes with the simulated robot
+share one queue through Redis. They need a local Redis (FLEET_REDIS_URL, default
+redis://localhost:6379/15, a database emptied by the tests) and are skipped when
+none is reachable.
+"""
+
+import os
+import json
+import time
+import asyncio
+import tempfile
+import multiprocessing
+import numpy as np
+import soundfile as sf
+from redis.asyncio import Redis
+from redis.exceptions import ConnectionError
+from fastapi import HTTPException
+import webhook_server
+from webhook_server import ProcessingRequest, PrefixProcessingRequest
+from worker.job_client import JobClient, QueueFullError
+from worker.idempotency import IdempotencyConflictError
+
+REDIS_URL = os.environ.get("FLEET_REDIS_URL", "redis://localhost:6379/15")
+
+def fleet_config(root: str, **overrides) -> dict:
+    with open('config.json', 'r') as f:
+        config = json.load(f)
+    config.update({
+        "redis_url": REDIS_URL,
+        "robot": "simulated",
+        "simulated_robot_delay": 1.0,
+        "storage_backend": "local",
+        "storage_root": os.path.join(root, "storage"),
+        "temp_base_folder": os.path.join(root, "temp"),
+        "heartbeat_interval": 0.5,
+        "heartbeat_ttl": 2,
+        "reaper_interval": 0.5,
+        "visibility_timeout": 600,  # Dead workers must be detected by heartbeat, not by lease
+        "prefetch_depth": 0,
+        "batch_size": 1,
+        "result_cache": False,
+        "min_free_disk_mb": 0
+    })
+    config.update(overrides)
+    return config
+
+def run_worker(config: dict):
+    """Worker process entry point"""
+    import worker.logic_worker as logic_worker
+    logic_worker.config.clear()
+    logic_worker.config.update(config)
+    asyncio.run(logic_worker.LogicWorker().start_worker())
+
+def start_workers(root: str, worker_ids, **overrides):
+    context = multiprocessing.get_context("spawn")
+    processes = {}
+    for worker_id in worker_ids:
+        config = fleet_config(
+            root,
+            worker_id=worker_id,
+            cleanup_folder=os.path.join(root, "exports", worker_id),  # One Logic export folder per Mac
+            **overrides
+        )
+        processes[worker_id] = context.Process(target=run_worker, args=(config,), daemon=True)
+        processes[worker_id].start()
+    return processes
+
+def add_songs(root: str, count: int):
+    for n in range(count):
+        folder = os.path.join(root, "storage", "bucket", "songs", f"Song{n}")
+        os.makedirs(folder)
+        sf.write(os.path.join(folder, f"Song{n}_mix.wav"), np.zeros((4410, 2)), 44100)
+
+async def wait_for(condition, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = await condition()
+        if result:
+            return result
+        await asyncio.sleep(0.2)
+    raise AssertionError("Timed out")
+
+def run(test):
+    """Run an async test with a job client on an emptied Redis database"""
+    async def main():
+        redis = Redis.from_url(REDIS_URL, decode_responses=True)
+        try:
+            await redis.ping()
+        except ConnectionError:
+            await redis.close()
+            import pytest
+            pytest.skip(f"No Redis available at {REDIS_URL}")
+        await redis.flushdb()
+        await redis.close()
+        with tempfile.TemporaryDirectory() as root:
+            client = JobClient(fleet_config(root))
+            await client.initialize()
+            processes = {}
+            try:
+                await test(client, root, processes)
+            finally:
+                for process in processes.values():
+                    process.kill()
+                    process.join()
+                await client.redis.flushdb()
+                await client.close()
+    asyncio.run(main())
+
+async def statuses(client: JobClient, execution_ids):
+    return [(await client.get_job_status(execution_id))["status"] for execution_id in execution_ids]
+
+async def call_api(client: JobClient, endpoint, *args):
+    """Call an API endpoint with the test job client, returning the response or the HTTPException"""
+    saved_client = webhook_server.job_client
+    webhook_server.job_client = client
+    try:
+        return await endpoint(*args)
+    except HTTPException as e:
+        return e
+    finally:
+        webhook_server.job_client = saved_client
+
+async def queued_jobs(client: JobClient) -> int:
+    stats = await client.queue.stats()
+    return sum(stats["pending"].values())
+
+def test_workers_register_and_share_the_queue():
+    async def test(client, root, processes):
+        add_songs(root, 6)
+        processes.update(start_workers(root, ["mac-a", "mac-b", "mac-c"]))
+
+        async def all_registered():
+            return len(await client.list_workers()) == 3
+        await wait_for(all_registered)
+        workers = await client.list_workers()
+        assert [worker["worker_id"] for worker in workers] == ["mac-a", "mac-b", "mac-c"]
+        assert workers[0]["capabilities"]["robot"] == "simulated"
+
+        execution_ids = await client.create_jobs([
+            {"input_bucket_path": f"bucket/songs/Song{n}", "output_bucket_path": "bucket/out"}
+            for n in range(6)
+        ])
+
+        async def all_completed():
+            return await statuses(client, execution_ids) == ["completed"] * 6
+        await wait_for(all_completed)
+        for n in range(6):
+            stems = os.listdir(os.path.join(root, "storage", "bucket", "out", f"Song{n}"))
+            assert len(stems) == 4
+        
+        mix_size = os.path.getsize(os.path.join(root, "storage", "bucket", "songs", "Song0", "Song0_mix.wav"))
+        resources = (await client.get_job_status(execution_ids[0]))["resources"]
+        assert resources["downloaded_bytes"] == mix_size
+        assert resources["uploaded_bytes"] == 4 * mix_size  # The simulated stems are copies of the mix
+        assert resources["peak_temp_bytes"] >= 5 * mix_size
+        assert resources["peak_rss_bytes"] > 0
+
+        async def all_acknowledged():
+            workers = await client.list_workers()
+            return sum(worker["jobs_processed"] for worker in workers) == 6 and workers
+        workers = await wait_for(all_acknowledged)
+        assert sum(1 for worker in workers if worker["jobs_processed"]) > 1
+        
+        metrics = await client.collect_metrics()
+        assert 'logic_jobs_finished_total{status="completed"} 6' in metrics
+        assert 'logic_queue_length{priority="normal"} 0' in metrics
+        assert "logic_workers 3" in metrics
+        assert 'logic_worker_event_loop_lag_seconds{worker_id="mac-a"}' in metrics
+        assert 'logic_stage_duration_seconds_count{stage="robot"} 6' in metrics
+        assert f"logic_downloaded_bytes_total {6 * mix_size}" in metrics
+        assert "logic_job_peak_temp_bytes_count 6" in metrics
+    run(test)
+
+def test_jobs_of_dead_worker_are_reassigned():
+    async def test(client, root, processes):
+        add_songs(root, 1)
+        processes.update(start_workers(root, ["mac-a", "mac-b"], simulated_robot_delay=3.0))
+
+        async def all_registered():
+            return len(await client.list_workers()) == 2
+        await wait_for(all_registered)
+        execution_id = await client.create_job("bucket/songs/Song0", "bucket/out")
+
+        async def busy_worker():
+            for worker in await client.list_workers():
+                if worker["current_job"]:
+                    return worker
+        busy = await wait_for(busy_worker)
+        assert busy["current_job"]["execution_id"] == execution_id
+        processes[busy["worker_id"]].kill()
+
+        async def completed():
+            return await statuses(client, [execution_id]) == ["completed"]
+        await wait_for(completed)
+
+        async def survivor_acknowledged():
+            workers = await client.list_workers()
+            return len(workers) == 1 and workers[0]["jobs_processed"] == 1 and workers
+        workers = await wait_for(survivor_acknowledged)
+        assert workers[0]["worker_id"] != busy["worker_id"]
+    run(test)
+
+def test_full_queue_rejects_jobs_until_workers_drain_it():
+    async def test(client, root, processes):
+        add_songs(root, 3)
+        client.config.update(max_queued_jobs=2, admission_retry_after=45)
+        await client.create_jobs([
+            {"input_bucket_path": f"bucket/songs/Song{n}", "output_bucket_path": "bucket/out"}
+            for n in range(2)
+        ])
+        try:
+            await client.create_job("bucket/songs/Song2", "bucket/out")
+            raise AssertionError("Job accepted past max_queued_jobs")
+        except QueueFullError as e:
+            assert e.retry_after == 45  # No worker yet: the configured fallback
+        
+        processes.update(start_workers(root, ["mac-a"], simulated_robot_delay=0.5))
+        
+        async def drained():
+            stats = await client.queue.stats()
+            return not sum(stats["pending"].values()) and not stats["inflight"]
+        await wait_for(drained)
+        await client.create_job("bucket/songs/Song2", "bucket/out")
+    run(test)
+
+def test_fleet_of_deferred_workers_rejects_jobs():
+    async def test(client, root, processes):
+        client.config.update(admission_retry_after=45)
+        processes.update(start_workers(root, ["mac-a"], min_free_disk_mb=1 << 40))
+        processes.update(start_workers(root, ["mac-b"]))
+        
+        async def a_deferred():
+            workers = await client.list_workers()
+            return len(workers) == 2 and workers[0]["deferred"] and not workers[1]["deferred"]
+        await wait_for(a_deferred)
+        # One worker still takes jobs
+        await client.create_job("bucket/songs/Song0", "bucket/out")
+        
+        processes["mac-b"].kill()
+        async def only_a_left():
+            return [worker["worker_id"] for worker in await client.list_workers()] == ["mac-a"]
+        await wait_for(only_a_left)
+        try:
+            await client.create_job("bucket/songs/Song1", "bucket/out")
+            raise AssertionError("Job accepted while every worker defers new jobs")
+        except QueueFullError as e:
+            assert e.retry_after == 45
+    run(test)
+
+def test_batch_endpoint_enqueues_every_job_or_none():
+    async def test(client, root, processes):
+        add_songs(root, 3)
+        client.config.update(max_queued_jobs=3, admission_retry_after=45)
+        def requests(count, invalid=None):
+            return [
+                ProcessingRequest(
+                    input_bucket_path="/" if n == invalid else f"bucket/songs/Song{n}",
+                    output_bucket_path="bucket/out"
+                )
+                for n in range(count)
+            ]
+        
+        # One invalid job or one job too many and nothing is enqueued
+        response = await call_api(client, webhook_server.create_processing_jobs, requests(3, invalid=2))
+        assert response.status_code == 422 and response.detail.startswith("Job 2:")
+        response = await call_api(client, webhook_server.create_processing_jobs, requests(4))
+        assert response.status_code == 429 and response.headers == {"Retry-After": "45"}
+        assert await queued_jobs(client) == 0
+        assert [key async for key in client.redis.scan_iter("logic-job:*")] == []
+        
+        transactions = []
+        pipeline = client.redis.pipeline
+        def counted_pipeline(transaction=True, shard_hint=None):
+            if transaction:
+                transactions.append(pipeline)
+            return pipeline(transaction=transaction, shard_hint=shard_hint)
+        client.redis.pipeline = counted_pipeline
+        response = await call_api(client, webhook_server.create_processing_jobs, requests(3))
+        client.redis.pipeline = pipeline
+        assert len(transactions) == 1  # Every status and queue entry in one transaction
+        assert response.message == "3 jobs created successfully"
+        assert [job.input_bucket_path for job in response.jobs] == [f"bucket/songs/Song{n}" for n in range(3)]
+        assert await statuses(client, response.execution_ids) == ["queued"] * 3
+        assert await queued_jobs(client) == 3
+        
+        processes.update(start_workers(root, ["mac-a"], simulated_robot_delay=0.5))
+        async def all_completed():
+            return await statuses(client, response.execution_ids) == ["completed"] * 3
+        await wait_for(all_completed)
+    run(test)
+
+def test_prefix_fans_out_into_a_batch():
+    async def test(client, root, processes):
+        add_songs(root, 3)
+        songs = os.path.join(root, "storage", "bucket", "songs")
+        os.makedirs(os.path.join(songs, "Broken"))
+        with open(os.path.join(songs, "Broken", "Broken_mix.wav"), "wb") as f:
+            f.write(b"not a wav file")
+        os.makedirs(os.path.join(songs, "Notes"))
+        with open(os.path.join(songs, "Notes", "readme.txt"), "w") as f:
+            f.write("No mix in this folder")
+        
+        response = await call_api(client, webhook_server.create_prefix_jobs, PrefixProcessingRequest(
+            input_prefix="bucket/nothing", output_bucket_path="bucket/out"
+        ))
+        assert response.status_code == 404
+        response = await call_api(client, webhook_server.get_batch_status, "unknown")
+        assert response.status_code == 404
+        
+        created = await call_api(client, webhook_server.create_prefix_jobs, PrefixProcessingRequest(
+            input_prefix="bucket/songs", output_bucket_path="bucket/out"
+        ))
+        assert created.folders == ["bucket/songs/Broken"] + [f"bucket/songs/Song{n}" for n in range(3)]
+        assert len(created.execution_ids) == 4
+        for execution_id, folder in zip(created.execution_ids, created.folders):
+            status = await client.get_job_status(execution_id)
+            assert status["batch_id"] == created.batch_id and status["input_bucket_path"] == folder
+        batch = await call_api(client, webhook_server.get_batch_status, created.batch_id)
+        assert (batch.status, batch.total, batch.finished, batch.counts) == ("queued", 4, 0, {"queued": 4})
+        assert batch.execution_ids == created.execution_ids
+        
+        processes.update(start_workers(root, ["mac-a", "mac-b"], simulated_robot_delay=0.5))
+        async def batch_finished():
+            batch = await call_api(client, webhook_server.get_batch_status, created.batch_id)
+            return batch.finished == 4 and batch
+        batch = await wait_for(batch_finished)
+        assert batch.status == "completed_with_errors"
+        assert batch.counts == {"completed": 3, "error": 1}
+        for n in range(3):
+            assert len(os.listdir(os.path.join(root, "storage", "bucket", "out", f"Song{n}"))) == 4
+    run(test)
+
+def test_idempotency_key_returns_the_existing_job():
+    async def test(client, root, processes):
+        duplicates = []
+        first = await client.create_job("bucket/songs/Song0", "bucket/out", idempotency_key="retry-1")
+        retried = await client.create_job(
+            "bucket/songs/Song0", "bucket/out", idempotency_key="retry-1", duplicates=duplicates
+        )
+        assert retried == first and duplicates == [first]
+        assert (await client.queue.stats())["pending"]["normal"] == 1
+        
+        try:
+            await client.create_job("bucket/songs/Song1", "bucket/out", idempotency_key="retry-1")
+            raise AssertionError("Idempotency key reused for another request")
+        except IdempotencyConflictError:
+            pass
+        # Keys are scoped to the tenant
+        assert await client.create_job("bucket/songs/Song0", "bucket/out", tenant="other", idempotency_key="retry-1") != first
+        
+        # Concurrent submissions with one key create a single job
+        execution_ids = await asyncio.gather(*[
+            client.create_job("bucket/songs/Song2", "bucket/out", idempotency_key="retry-2")
+            for _ in range(5)
+        ])
+        assert len(set(execution_ids)) == 1
+        assert sum((await client.queue.stats())["pending"].values()) == 3
+        
+        # The key stays on the job once a worker has processed it
+        add_songs(root, 3)
+        processes.update(start_workers(root, ["mac-a"]))
+        
+        async def completed():
+            return (await client.get_job_status(first))["status"] == "completed"
+        await wait_for(completed)
+        assert (await client.get_job_status(first))["idempotency_key"] == "retry-1"
+    run(test)
+
+if __name__ == "__main__":
+    test_workers_register_and_share_the_queue()
+    test_jobs_of_dead_worker_are_reassigned()
+    test_full_queue_rejects_jobs_until_workers_drain_it()
+    test_fleet_of_deferred_workers_rejects_jobs()
+    test_batch_endpoint_enqueues_every_job_or_none()
+    test_prefix_fans_out_into_a_batch()
+    test_idempotency_key_returns_the_existing_job()
+    print("✅ All fleet tests passed")
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Tests for the Stem Splitter progress probe, replaying recorded screenshots (no display needed)
+"""
+
+import os
+import asyncio
+import tempfile
+import numpy as np
+from robot.probes import ProgressDialogProbe, recorded_grabber, load_recording, changed_fraction
+
+def make_frames():
+    """Simulated recording: desktop, dialog with a moving progress bar, desktop again"""
+    desktop = np.full((120, 200, 3), 40, dtype=np.uint8)
+    dialog_frames = []
+    for step in range(6):
+        frame = desktop.copy()
+        frame[20:100, 30:170] = 230  # dialog
+        frame[80:86, 40:40 + 20 * step] = 0  # progress bar
+        dialog_frames.append(frame)
+    return [desktop, desktop] + dialog_frames + [desktop] * 4
+
+def test_changed_fraction():
+    a = np.zeros((10, 10, 3), dtype=np.uint8)
+    b = a.copy()
+    b[:5] = 255
+    assert changed_fraction(a, a) == 0.0
+    assert changed_fraction(a, b) == 0.5
+
+def test_probe_detects_dialog_disappearing():
+    frames = make_frames()
+    probe = ProgressDialogProbe(recorded_grabber(frames), downsample=1)
+    probe.start()
+    polls = 0
+    while not probe.poll():
+        polls += 1
+        assert polls < len(frames), "completion never detected"
+    assert probe.dialog_seen
+    # Dialog disappears at frame 8, then needs 2 stable frames
+    assert polls == 9
+
+def test_probe_not_fooled_by_progress_bar():
+    frames = make_frames()[:8]
+    probe = ProgressDialogProbe(recorded_grabber(frames), downsample=1)
+    probe.start()
+    assert not any(probe.poll() for _ in range(10))
+
+def test_probe_wait_times_out():
+    desktop = np.zeros((50, 50, 3), dtype=np.uint8)
+    probe = ProgressDialogProbe(recorded_grabber([desktop]))
+    probe.start()
+    assert asyncio.run(probe.wait(timeout=0.2, interval=0.05)) is False
+
+def test_probe_replays_png_recording():
+    from PIL import Image
+    with tempfile.TemporaryDirectory() as folder:
+        for i, frame in enumerate(make_frames()):
+            Image.fromarray(frame).save(os.path.join(folder, f"frame_{i:03d}.png"))
+        probe = ProgressDialogProbe(recorded_grabber(load_recording(folder)))
+        probe.start()
+        assert asyncio.run(probe.wait(timeout=5, interval=0)) is True
+
+if __name__ == "__main__":
+    test_changed_fraction()
+    test_probe_detects_dialog_disappearing()
+    test_probe_not_fooled_by_progress_bar()
+    test_probe_wait_times_out()
+    test_probe_replays_png_recording()
+    print("✅ All probe tests passed")
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Tests for the reliable job queue. They need a local Redis (REDIS_URL, default
+redis://localhost:6379) and are skipped when none is reachable.
+"""
+
+import os
+import json
+import uuid
+import asyncio
+from redis.asyncio import Redis
+from redis.exceptions import ConnectionError
+from worker.job_queue import ReliableQueue
+
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379")
+
+def run(test):
+    """Run an async test against a throwaway queue name, removing its keys afterwards"""
+    async def main():
+        redis = Redis.from_url(REDIS_URL, decode_responses=True)
+        try:
+            await redis.ping()
+        except ConnectionError:
+            await redis.close()
+            import pytest
+            pytest.skip(f"No Redis available at {REDIS_URL}")
+        name = f"test-logic-processing:{uuid.uuid4()}"
+        try:
+            await test(redis, name)
+        finally:
+            keys = [key async for key in redis.scan_iter(f"{name}*")]
+            if keys:
+                await redis.delete(*keys)
+            await redis.close()
+    asyncio.run(main())
+
+def job(n: int, **fields) -> dict:
+    return dict({"execution_id": f"job-{n}", "input_bucket_path": f"bucket/song{n}"}, **fields)
+
+def ids(items) -> list:
+    return [json.loads(item)["execution_id"] if item else None for item in items]
+
+async def drain(queue: ReliableQueue) -> list:
+    items = []
+    while True:
+        item = await queue.get(timeout=0.1)
+        if item is None:
+            return ids(items)
+        items.append(item)
+
+def test_ack_removes_job():
+    async def test(redis, name):
+        queue = ReliableQueue(redis, name, worker_id="a")
+        await queue.push([job(1), job(2)])
+        item = await queue.get(timeout=1)
+        assert ids([item]) == ["job-1"]
+        assert await redis.lrange(queue.inflight_key, 0, -1) == [item]
+        await queue.ack(item)
+        assert await redis.llen(queue.inflight_key) == 0
+        assert await redis.zcard(queue.leases_key) == 0
+        assert ids([await queue.get(timeout=1)]) == ["job-2"]
+    run(test)
+
+def test_reaper_requeues_job_of_dead_worker():
+    async def test(redis, name):
+        crashed = ReliableQueue(redis, name, worker_id="crashed", visibility_timeout=0.2)
+        survivor = ReliableQueue(redis, name, worker_id="survivor", visibility_timeout=0.2)
+        await crashed.push([job(1)])
+        item = await crashed.get(timeout=1)
+        assert await survivor.get(timeout=0.1) is None
+        assert await survivor.reap() == 0  # Lease still valid
+        await asyncio.sleep(0.3)
+        assert await survivor.reap() == 1
+        assert await redis.llen(crashed.inflight_key) == 0
+        assert await survivor.get(timeout=1) == item
+    run(test)
+
+def test_extended_lease_is_not_reaped():
+    async def test(redis, name):
+        queue = ReliableQueue(redis, name, worker_id="a", visibility_timeout=0.3)
+        await queue.push([job(1)])
+        item = await queue.get(timeout=1)
+        await asyncio.sleep(0.2)
+        await queue.extend_lease(item)
+        await asyncio.sleep(0.2)
+        assert await queue.reap() == 0
+        assert await redis.lrange(queue.inflight_key, 0, -1) == [item]
+    run(test)
+
+def test_recover_requeues_own_jobs_in_order():
+    async def test(redis, name):
+        queue = ReliableQueue(redis, name, worker_id="a")
+        await queue.push([job(1), job(2), job(3)])
+        await queue.get(timeout=1)
+        await queue.get(timeout=1)
+        restarted = ReliableQueue(redis, name, worker_id="a")
+        assert await restarted.recover() == 2
+        assert await drain(restarted) == ["job-1", "job-2", "job-3"]
+    run(test)
+
+def test_poison_job_goes_to_dead_letter_list():
+    async def test(redis, name):
+        queue = ReliableQueue(redis, name, worker_id="a", visibility_timeout=0, max_deliveries=2)
+        dead_letters = []
+        async def on_dead_letter(item):
+            dead_letters.append(item)
+        await queue.push([job(1)])
+        for _ in range(2):
+            await queue.get(timeout=1)
+            assert await queue.reap(on_dead_letter=on_dead_letter) == 1
+        await queue.get(timeout=1)
+        assert await queue.reap(on_dead_letter=on_dead_letter) == 0
+        assert await queue.get(timeout=0.1) is None
+        assert ids(await redis.lrange(queue.dead_key, 0, -1)) == ["job-1"]
+        assert ids(dead_letters) == ["job-1"]
+    run(test)
+
+def test_recovered_job_counts_as_a_delivery():
+    async def test(redis, name):
+        await ReliableQueue(redis, name).push([job(1)])
+        dead_letters = []
+        async def on_dead_letter(item):
+            dead_letters.append(item)
+        # A job crashing the worker each time it is restarted with the same id
+        restarted = ReliableQueue(redis, name, worker_id="a", max_deliveries=1)
+        await restarted.get(timeout=1)
+        assert await restarted.recover(on_dead_letter=on_dead_letter) == 1
+        await restarted.get(timeout=1)
+        assert await restarted.recover(on_dead_letter=on_dead_letter) == 0
+        assert await restarted.get(timeout=0.1) is None
+        assert ids(dead_letters) == ["job-1"]
+        assert ids(await redis.lrange(restarted.dead_key, 0, -1)) == ["job-1"]
+    run(test)
+
+def test_higher_priority_and_earlier_deadline_first():
+    async def test(redis, name):
+        queue = ReliableQueue(redis, name, worker_id="a")
+        await queue.push([job(1), job(2, priority="low")])
+        await queue.push([job(3, deadline="2030-01-02T00:00:00"), job(4, deadline="2030-01-01T00:00:00")])
+        await queue.push([job(5, priority="high")])
+        assert await drain(queue) == ["job-5", "job-4", "job-3", "job-1", "job-2"]
+    run(test)
+
+def test_tenants_share_a_priority_by_weight():
+    async def test(redis, name):
+        queue = ReliableQueue(redis, name, worker_id="a", tenant_weights={"customer": 2})
+        await queue.push([job(n, tenant="benchmark") for n in range(6)])
+        await queue.push([job(n, tenant="customer") for n in range(10, 14)])
+        order = [execution_id.split("-")[1] for execution_id in await drain(queue)]
+        # The bulk import queued first does not hold back the customer, who gets two jobs per turn
+        assert order == ["0", "10", "11", "1", "12", "13", "2", "3", "4", "5"]
+    run(test)
+
+def test_legacy_list_is_migrated_in_order():
+    async def test(redis, name):
+        queue = ReliableQueue(redis, name, worker_id="a")
+        await redis.lpush(name, json.dumps(job(1)), json.dumps(job(2)))
+        await queue.push([job(3)])
+        await queue.push([job(4, priority="high")])
+        assert await drain(queue) == ["job-4", "job-3", "job-1", "job-2"]
+        assert await redis.llen(name) == 0
+    run(test)
+
+def test_stats_count_pending_and_inflight_jobs():
+    async def test(redis, name):
+        queue = ReliableQueue(redis, name, worker_id="a")
+        await redis.lpush(name, json.dumps(job(1)))
+        await queue.push([job(2, tenant="a"), job(3, tenant="b"), job(4, priority="high")])
+        assert await queue.stats() == {"pending": {"high": 1, "normal": 3, "low": 0}, "inflight": 0, "dead": 0}
+        await queue.get(timeout=1)
+        assert await queue.stats() == {"pending": {"high": 0, "normal": 3, "low": 0}, "inflight": 1, "dead": 0}
+    run(test)
+
+if __name__ == "__main__":
+    test_ack_removes_job()
+    test_reaper_requeues_job_of_dead_worker()
+    test_extended_lease_is_not_reaped()
+    test_recover_requeues_own_jobs_in_order()
+    test_poison_job_goes_to_dead_letter_list()
+    test_recovered_job_counts_as_a_delivery()
+    test_higher_priority_and_earlier_deadline_first()
+    test_tenants_share_a_priority_by_weight()
+    test_legacy_list_is_migrated_in_order()
+    test_stats_count_pending_and_inflight_jobs()
+    print("✅ All queue tests passed")
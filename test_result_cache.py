@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Tests for the result cache on the local storage backend. They need a local Redis
+(REDIS_URL, default redis://localhost:6379) and are skipped when none is reachable.
+"""
+
+import os
+import uuid
+import asyncio
+import tempfile
+import pytest
+from redis.asyncio import Redis
+from redis.exceptions import ConnectionError
+from utils.storage import LocalStorageBackend
+from worker.result_cache import ResultCache
+
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379")
+STEMS = ["Song_mix_Vocals.wav", "Song_mix_Drums.wav"]
+
+def run(test):
+    """Run an async test with a cache under throwaway keys, removing them afterwards"""
+    async def main():
+        redis = Redis.from_url(REDIS_URL, decode_responses=True)
+        try:
+            await redis.ping()
+        except ConnectionError:
+            await redis.close()
+            pytest.skip(f"No Redis available at {REDIS_URL}")
+        prefix = f"test-logic-cache:{uuid.uuid4()}:"
+        with tempfile.TemporaryDirectory() as root:
+            storage = LocalStorageBackend(root)
+            cache = ResultCache(redis, storage, lambda: "11.0")
+            cache.KEY_PREFIX = prefix
+            cache.INDEX_KEY = f"{prefix}index"
+            try:
+                await test(cache, storage, root)
+            finally:
+                keys = [key async for key in redis.scan_iter(f"{prefix}*")]
+                if keys:
+                    await redis.delete(*keys)
+                await redis.close()
+    asyncio.run(main())
+
+def add_stems(root: str, folder: str) -> dict:
+    """Write stems into the bucket and return their names mapped to their generation"""
+    os.makedirs(os.path.join(root, folder))
+    for n, name in enumerate(STEMS):
+        with open(os.path.join(root, folder, name), "wb") as f:
+            f.write(bytes([n]) * (100 + n))
+    storage = LocalStorageBackend(root)
+    return {name: storage.stat(f"{folder}/{name}").generation for name in STEMS}
+
+def test_hit_copies_the_stems():
+    async def test(cache, storage, root):
+        await cache.store("hash", "bucket/out/A", add_stems(root, "bucket/out/A"))
+        entry = await cache.lookup("hash")
+        assert entry["stems_path"] == "bucket/out/A"
+
+        result = cache.copy_stems(entry, "bucket/out/B")
+        assert result["status"] == "success" and result["cached"]
+        assert result["uploaded_files"] == sorted(STEMS)
+        assert result["uploaded_bytes"] == 201
+        assert result["gcp_path"] == "gs://bucket/out/B"
+        assert sorted(os.listdir(os.path.join(root, "bucket", "out", "B"))) == sorted(STEMS)
+    run(test)
+
+def test_miss():
+    async def test(cache, storage, root):
+        await cache.store("hash", "bucket/out/A", add_stems(root, "bucket/out/A"))
+        assert await cache.lookup("other-hash") is None
+        # Another Logic Pro version splits differently
+        cache.logic_version = lambda: "11.1"
+        assert await cache.lookup("hash") is None
+    run(test)
+
+def test_changed_or_removed_stems_invalidate_the_entry():
+    async def test(cache, storage, root):
+        await cache.store("hash", "bucket/out/A", add_stems(root, "bucket/out/A"))
+        entry = await cache.lookup("hash")
+
+        path = os.path.join(root, "bucket", "out", "A", STEMS[0])
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))  # Overwritten
+        with pytest.raises(Exception):
+            cache.copy_stems(entry, "bucket/out/B")
+
+        os.remove(path)
+        with pytest.raises(Exception):
+            cache.copy_stems(entry, "bucket/out/B")
+        assert not os.path.exists(os.path.join(root, "bucket", "out", "B"))
+
+        await cache.invalidate("hash")
+        assert await cache.lookup("hash") is None
+    run(test)
+
+def test_stems_without_generation_are_never_served():
+    async def test(cache, storage, root):
+        add_stems(root, "bucket/out/A")
+        # What the gsutil backend reports
+        await cache.store("hash", "bucket/out/A", {name: None for name in STEMS})
+        assert await cache.lookup("hash") is None
+
+        entry = {"stems_path": "bucket/out/A", "files": {name: None for name in STEMS}}
+        with pytest.raises(Exception):
+            cache.copy_stems(entry, "bucket/out/B")
+    run(test)
+
+def test_oldest_entries_are_evicted():
+    async def test(cache, storage, root):
+        cache.max_entries = 2
+        files = add_stems(root, "bucket/out/A")
+        for n in range(3):
+            await cache.store(f"hash-{n}", "bucket/out/A", files)
+        assert await cache.lookup("hash-0") is None
+        assert await cache.lookup("hash-2") is not None
+    run(test)
+
+if __name__ == "__main__":
+    test_hit_copies_the_stems()
+    test_miss()
+    test_changed_or_removed_stems_invalidate_the_entry()
+    test_stems_without_generation_are_never_served()
+    test_oldest_entries_are_evicted()
+    print("✅ All result cache tests passed")
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Tests for the metadata-only folder scan, against the local storage backend (no bucket needed)
+"""
+
+import os
+import struct
+import tempfile
+import numpy as np
+import soundfile as sf
+from utils.storage import LocalStorageBackend
+from utils.scan import parse_wav_header, scan_bucket_folder, header_cache, WavHeaderError, HEADER_READ_SIZE
+
+def file_reader(path):
+    def read(start, length):
+        with open(path, 'rb') as f:
+            f.seek(start)
+            return f.read(length)
+    return read
+
+def write_wav(path, frames=44100, channels=2, subtype='PCM_16'):
+    sf.write(path, np.zeros((frames, channels)), 44100, subtype=subtype)
+
+def insert_chunk_before_data(path, chunk_id, size):
+    """Add a chunk (like bext or JUNK from a DAW) between fmt and data"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    index = data.index(b'data')
+    chunk = struct.pack('<4sI', chunk_id, size) + b'\0' * size
+    data = data[:index] + chunk + data[index:]
+    data = data[:4] + struct.pack('<I', len(data) - 8) + data[8:]
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def test_header_matches_soundfile():
+    with tempfile.TemporaryDirectory() as folder:
+        for subtype, channels in [('PCM_16', 2), ('PCM_24', 1), ('FLOAT', 6)]:
+            path = os.path.join(folder, f"{subtype}.wav")
+            write_wav(path, frames=12345, channels=channels, subtype=subtype)
+            info = parse_wav_header(file_reader(path), os.path.getsize(path))
+            expected = sf.info(path)
+            assert info["frames"] == expected.frames
+            assert info["channels"] == expected.channels
+            assert info["samplerate"] == expected.samplerate
+            assert not info["truncated"]
+
+def test_large_chunk_before_data_is_skipped():
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "song_mix.wav")
+        write_wav(path)
+        insert_chunk_before_data(path, b'JUNK', 3 * HEADER_READ_SIZE)
+        reads = []
+        read = file_reader(path)
+        def counting_read(start, length):
+            reads.append((start, length))
+            return read(start, length)
+        info = parse_wav_header(counting_read, os.path.getsize(path))
+        assert info["frames"] == 44100
+        assert len(reads) == 2  # First window, then straight to the data chunk
+
+def test_truncated_and_invalid_files():
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "song_mix.wav")
+        write_wav(path)
+        size = os.path.getsize(path)
+        info = parse_wav_header(file_reader(path), size // 2)
+        assert info["truncated"] and 0 < info["frames"] < 44100
+        try:
+            parse_wav_header(lambda start, length: b'not a wav file at all', 21)
+            assert False, "invalid file accepted"
+        except WavHeaderError:
+            pass
+
+def test_scan_bucket_folder():
+    with tempfile.TemporaryDirectory() as root:
+        folder = os.path.join(root, "bucket", "songs", "Song")
+        os.makedirs(folder)
+        write_wav(os.path.join(folder, "Song_mix.wav"))
+        write_wav(os.path.join(folder, "Song_vocals.wav"))
+        backend = LocalStorageBackend(root)
+
+        result = scan_bucket_folder("bucket/songs/Song", backend=backend)
+        assert result["processable"]
+        assert result["folder_info"]["mix_files"] == ["Song_mix.wav"]
+        assert result["folder_info"]["mix_info"]["Song_mix.wav"]["frames"] == 44100
+
+        with open(os.path.join(folder, "Song_mix.wav"), 'wb') as f:
+            f.write(b'corrupted')
+        result = scan_bucket_folder("bucket/songs/Song", backend=backend)
+        assert not result["processable"]
+        assert "corrupted" in result["error"]
+
+def test_headers_cached_per_generation():
+    header_cache.entries.clear()
+    with tempfile.TemporaryDirectory() as root:
+        folder = os.path.join(root, "bucket", "Song")
+        os.makedirs(folder)
+        write_wav(os.path.join(folder, "Song_mix.wav"))
+        backend = LocalStorageBackend(root)
+        reads = []
+        original = backend.read_range
+        backend.read_range = lambda *args: reads.append(args) or original(*args)
+
+        scan_bucket_folder("bucket/Song", backend=backend)
+        scan_bucket_folder("bucket/Song", backend=backend)
+        assert len(reads) == 1
+
+        write_wav(os.path.join(folder, "Song_mix.wav"), frames=100)
+        os.utime(os.path.join(folder, "Song_mix.wav"), ns=(1, 1))  # New generation
+        result = scan_bucket_folder("bucket/Song", backend=backend)
+        assert len(reads) == 2
+        assert result["folder_info"]["mix_info"]["Song_mix.wav"]["frames"] == 100
+
+if __name__ == "__main__":
+    test_header_matches_soundfile()
+    test_large_chunk_before_data_is_skipped()
+    test_truncated_and_invalid_files()
+    test_scan_bucket_folder()
+    test_headers_cached_per_generation()
+    print("✅ All scan tests passed")
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+Tests for the encoding of job statuses into Redis hashes (no Redis needed)
+"""
+
+from worker.status_store import JobStatusStore
+
+def test_round_trip():
+    status = {
+        "execution_id": "job-1",
+        "status": "completed",
+        "callback_url": None,
+        "errors": [],
+        "results": [{"status": "success"}],
+        "timings": {"robot": {"start": 1.0, "end": 2.0, "duration": 1.0}},
+        "resources": {"peak_rss_bytes": 1024}
+    }
+    assert JobStatusStore.decode(JobStatusStore.encode(status)) == status
+
+def test_empty_json_fields_decode_to_their_type():
+    status = JobStatusStore.decode({"errors": "", "results": "", "timings": "", "resources": ""})
+    assert status == {"errors": [], "results": [], "timings": {}, "resources": {}}
+
+if __name__ == "__main__":
+    test_round_trip()
+    test_empty_json_fields_decode_to_their_type()
+    print("✅ All status store tests passed")
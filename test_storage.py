@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Tests for the local storage backend and the downloads through it (no bucket needed)
+"""
+
+import os
+import time
+import tempfile
+import threading
+import numpy as np
+import soundfile as sf
+import pytest
+from utils.storage import LocalStorageBackend, get_storage_backend
+from utils.download import download_gcp_folder
+from utils.upload import upload_stems_to_gcp
+
+def make_bucket(root: str) -> LocalStorageBackend:
+    folder = os.path.join(root, "bucket", "songs", "Song")
+    os.makedirs(os.path.join(folder, "extra"))
+    sf.write(os.path.join(folder, "Song_mix.wav"), np.zeros((4410, 2)), 44100)
+    sf.write(os.path.join(folder, "extra", "Other_mix.wav"), np.zeros((4410, 2)), 44100)
+    with open(os.path.join(folder, "notes.txt"), "wb") as f:
+        f.write(b"x" * 100)
+    return get_storage_backend("local", root=root)
+
+def test_list_and_stat():
+    with tempfile.TemporaryDirectory() as root:
+        storage = make_bucket(root)
+        objects = storage.list("bucket/songs/Song")
+        assert [obj.path for obj in objects] == [
+            "bucket/songs/Song/Song_mix.wav",
+            "bucket/songs/Song/notes.txt",
+            "bucket/songs/Song/extra/Other_mix.wav"
+        ]
+        assert objects[1].name == "notes.txt" and objects[1].size == 100
+        assert storage.list("bucket/missing") == []
+
+        obj = storage.stat("gs://bucket/songs/Song/notes.txt")
+        assert obj.size == 100 and obj.generation
+        assert storage.stat("bucket/songs/Song/missing.wav") is None
+
+def test_get_put_copy_and_read_range():
+    with tempfile.TemporaryDirectory() as root:
+        storage = make_bucket(root)
+        local = os.path.join(root, "local", "notes.txt")
+        assert storage.get("bucket/songs/Song/notes.txt", local) == 100
+
+        with open(local, "wb") as f:
+            f.write(bytes(range(256)))
+        assert storage.put(local, "bucket/out/Song/notes.txt") == 256
+        assert storage.read_range("bucket/out/Song/notes.txt", 10, 5) == bytes(range(10, 15))
+
+        assert storage.copy("bucket/out/Song/notes.txt", "bucket/copy/notes.txt") == 256
+        assert storage.stat("bucket/copy/notes.txt").size == 256
+
+def test_paths_cannot_escape_the_root():
+    with tempfile.TemporaryDirectory() as root:
+        storage = make_bucket(root)
+        with pytest.raises(ValueError):
+            storage.stat("bucket/../../etc/passwd")
+
+@pytest.mark.parametrize("selective", [True, False])
+def test_download_keeps_only_the_mix(selective):
+    with tempfile.TemporaryDirectory() as root:
+        storage = make_bucket(root)
+        transfer = {}
+        folder_name, temp_path, temp_dir = download_gcp_folder(
+            "bucket/songs/Song",
+            backend=storage,
+            selective=selective,
+            work_dir=os.path.join(root, "work"),
+            transfer=transfer
+        )
+        try:
+            assert folder_name == "Song"
+            found = sorted(
+                os.path.relpath(os.path.join(folder, file), temp_path)
+                for folder, _, files in os.walk(temp_path) for file in files
+            )
+            assert found == ["Song_mix.wav", os.path.join("extra", "Other_mix.wav")]
+            mix_size = os.path.getsize(os.path.join(temp_path, "Song_mix.wav"))
+            assert transfer["downloaded_bytes"] == 2 * mix_size + (0 if selective else 100)
+            assert transfer["filtered_bytes"] == 100
+        finally:
+            temp_dir.cleanup()
+
+def slow_down(storage: LocalStorageBackend, method: str) -> list:
+    """
+    Make a transfer method of storage slow, returning [current, maximum] of the
+    transfers running at once
+    """
+    lock = threading.Lock()
+    active = [0, 0]
+    transfer = getattr(storage, method)
+    def slow_transfer(*args):
+        with lock:
+            active[0] += 1
+            active[1] = max(active)
+        time.sleep(0.2)
+        with lock:
+            active[0] -= 1
+        return transfer(*args)
+    setattr(storage, method, slow_transfer)
+    return active
+
+def max_concurrent_transfers(root: str, selective: bool, max_transfers: int) -> int:
+    """Download the bucket with slow transfers, returning how many overlapped at most"""
+    storage = make_bucket(root)
+    active = slow_down(storage, "get")
+    temp_dir = download_gcp_folder(
+        "bucket/songs/Song",
+        backend=storage,
+        selective=selective,
+        work_dir=os.path.join(root, "work"),
+        max_transfers=max_transfers
+    )[2]
+    temp_dir.cleanup()
+    return active[1]
+
+@pytest.mark.parametrize("selective", [True, False])
+def test_download_transfers_are_parallel_and_bounded(selective):
+    with tempfile.TemporaryDirectory() as root:
+        assert max_concurrent_transfers(root, selective, max_transfers=2) == 2
+    with tempfile.TemporaryDirectory() as root:
+        assert max_concurrent_transfers(root, selective, max_transfers=1) == 1
+
+def write_stems(folder: str, count: int):
+    os.makedirs(folder)
+    for n in range(count):
+        sf.write(os.path.join(folder, f"Song_mix_Stem{n}.wav"), np.zeros((441 * (n + 1), 2)), 44100)
+
+def test_upload_stems():
+    with tempfile.TemporaryDirectory() as root:
+        storage = get_storage_backend("local", root=root)
+        stems = os.path.join(root, "stems")
+        write_stems(stems, 4)
+        streamed = "Song_mix_Stem0.wav"
+        result = upload_stems_to_gcp(
+            stems,
+            "bucket/out",
+            folder_name="Song",
+            backend=storage,
+            already_uploaded={streamed: os.path.getsize(os.path.join(stems, streamed))}
+        )
+        assert result["status"] == "success"
+        assert result["gcp_path"] == "gs://bucket/out/Song"
+        assert result["uploaded_files"] == [f"Song_mix_Stem{n}.wav" for n in range(4)]
+        assert result["uploaded_bytes"] == sum(os.path.getsize(os.path.join(stems, f)) for f in os.listdir(stems))
+        # The streamed stem is reported but not uploaded again
+        assert sorted(obj.name for obj in storage.list("bucket/out/Song")) == [f"Song_mix_Stem{n}.wav" for n in range(1, 4)]
+
+def test_upload_transfers_are_parallel_and_bounded():
+    for max_transfers in (1, 3):
+        with tempfile.TemporaryDirectory() as root:
+            storage = get_storage_backend("local", root=root)
+            write_stems(os.path.join(root, "stems"), 6)
+            active = slow_down(storage, "put")
+            result = upload_stems_to_gcp(os.path.join(root, "stems"), "bucket/out", backend=storage, max_transfers=max_transfers)
+            assert result["status"] == "success"
+            assert active[1] == max_transfers
+            assert len(storage.list("bucket/out")) == 6
+
+def test_failed_upload_is_reported():
+    with tempfile.TemporaryDirectory() as root:
+        storage = get_storage_backend("local", root=root)
+        write_stems(os.path.join(root, "stems"), 3)
+        def failing_put(local_path, bucket_path):
+            raise OSError("bucket unreachable")
+        storage.put = failing_put
+        result = upload_stems_to_gcp(os.path.join(root, "stems"), "bucket/out", backend=storage)
+        assert result["status"] == "error" and "bucket unreachable" in result["message"]
+
+if __name__ == "__main__":
+    test_list_and_stat()
+    test_get_put_copy_and_read_range()
+    test_paths_cannot_escape_the_root()
+    for selective in (True, False):
+        test_download_keeps_only_the_mix(selective)
+        test_download_transfers_are_parallel_and_bounded(selective)
+    test_upload_stems()
+    test_upload_transfers_are_parallel_and_bounded()
+    test_failed_upload_is_reported()
+    print("✅ All storage tests passed")
@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+"""
+Tests for a single worker run in-process with the simulated robot: the stages a job
+records and how a redelivered job resumes from the checkpoints of its previous
+delivery. They need a local Redis (WORKER_REDIS_URL, default redis://localhost:6379/14,
+a database emptied by the tests) and are skipped when none is reachable.
+"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import tempfile
+from types import SimpleNamespace
+from datetime import datetime
+import numpy as np
+import soundfile as sf
+from redis.asyncio import Redis
+from redis.exceptions import ConnectionError
+import worker.logic_worker as logic_worker
+from robot.simulated import SimulatedRobot
+from worker.status_store import FINISHED_STATUSES
+
+REDIS_URL = os.environ.get("WORKER_REDIS_URL", "redis://localhost:6379/14")
+
+def worker_config(root: str) -> dict:
+    with open('config.json', 'r') as f:
+        config = json.load(f)
+    config.update({
+        "redis_url": REDIS_URL,
+        "robot": "simulated",
+        "simulated_robot_delay": 0.2,
+        "storage_backend": "local",
+        "storage_root": os.path.join(root, "storage"),
+        "temp_base_folder": os.path.join(root, "temp"),
+        "cleanup_folder": os.path.join(root, "exports"),
+        "result_cache": False,
+        "min_free_disk_mb": 0
+    })
+    return config
+
+def add_song(root: str, name: str) -> dict:
+    """Write a mix into the local bucket and return a job for it"""
+    folder = os.path.join(root, "storage", "bucket", "songs", name)
+    os.makedirs(folder)
+    sf.write(os.path.join(folder, f"{name}_mix.wav"), np.zeros((4410, 2)), 44100)
+    return {
+        "execution_id": str(uuid.uuid4()),
+        "input_bucket_path": f"bucket/songs/{name}",
+        "output_bucket_path": "bucket/out",
+        "created_at": datetime.now().isoformat()
+    }
+
+class PartialExportRobot(SimulatedRobot):
+    """Simulated robot whose export times out after the first two stems"""
+    def __init__(self, config: dict, report_complete: bool = False):
+        super().__init__(config)
+        self.report_complete = report_complete
+        self.missing = [stem.lower() for stem in self.expected_stems[2:]]
+        self.expected_stems = self.expected_stems[:2]
+
+    async def process_folder(self, *args, **kwargs):
+        result = await super().process_folder(*args, **kwargs)
+        if self.report_complete:
+            return result
+        return dict(result, export_complete=False, missing_stems=self.missing)
+
+def output_stems(root: str, name: str):
+    return sorted(os.listdir(os.path.join(root, "storage", "bucket", "out", name)))
+
+def interrupt(worker, job: dict):
+    """Forget a job as if the worker had died holding it"""
+    worker.jobs_status.pop(job["execution_id"], None)
+
+def run(test):
+    """Run an async test with a worker on an emptied Redis database"""
+    async def main():
+        redis = Redis.from_url(REDIS_URL, decode_responses=True)
+        try:
+            await redis.ping()
+        except ConnectionError:
+            await redis.close()
+            import pytest
+            pytest.skip(f"No Redis available at {REDIS_URL}")
+        await redis.flushdb()
+        await redis.close()
+        saved_config = dict(logic_worker.config)
+        with tempfile.TemporaryDirectory() as root:
+            logic_worker.config.clear()
+            logic_worker.config.update(worker_config(root))
+            worker = logic_worker.LogicWorker()
+            await worker.initialize()
+            try:
+                await test(worker, root)
+            finally:
+                await worker.redis.flushdb()
+                await worker.close()
+                logic_worker.config.clear()
+                logic_worker.config.update(saved_config)
+    asyncio.run(main())
+
+async def stages(worker, job: dict):
+    return set((await worker.get_job_status(job["execution_id"]))["timings"])
+
+async def statuses(worker, execution_ids):
+    return [(await worker.get_job_status(execution_id))["status"] for execution_id in execution_ids]
+
+def after_each_robot_run(worker, record):
+    """Await record(folder_name) at the end of every robot run, before the result is returned"""
+    process_folder = worker.robot.process_folder
+    async def recorded(folder_path, folder_name=None, on_stem_ready=None):
+        result = await process_folder(folder_path, folder_name, on_stem_ready)
+        await record(folder_name)
+        return result
+    worker.robot.process_folder = recorded
+
+async def process_queue(worker, execution_ids, prefetch_depth: int = 1, batch_size: int = 1):
+    """Run the prefetching queue loop of the worker until every job has finished"""
+    loop = asyncio.create_task(worker.process_queue_with_prefetch(prefetch_depth, batch_size))
+    async def all_finished():
+        while not all(status in FINISHED_STATUSES for status in await statuses(worker, execution_ids)):
+            await asyncio.sleep(0.1)
+    try:
+        await asyncio.wait_for(all_finished(), 30)
+    finally:
+        loop.cancel()
+        await asyncio.gather(loop, return_exceptions=True)
+        await worker.wait_for_finalizations()
+
+def test_completed_job_records_its_stages():
+    async def test(worker, root):
+        job = add_song(root, "Song0")
+        await worker.process_job(job)
+        timings = (await worker.get_job_status(job["execution_id"]))["timings"]
+        assert set(timings) == {
+            "queue", "download", "verify", "robot",
+            "robot.stem_split", "robot.export", "robot.close",
+            "stem_move", "upload"
+        }
+        # Transfer first, then the WAV checks and the scan
+        assert timings["download"]["end"] == timings["verify"]["start"]
+        assert timings["verify"]["end"] <= timings["robot"]["start"]
+    run(test)
+
+def test_resume_from_downloaded_checkpoint():
+    async def test(worker, root):
+        job = add_song(root, "Song0")
+        assert await worker.prepare_job(job) is not None
+        interrupt(worker, job)
+
+        await worker.process_job(job)
+        status = await worker.get_job_status(job["execution_id"])
+        assert status["status"] == "completed"
+        assert "download" not in status["timings"]
+        assert "robot" in status["timings"]
+        assert worker.robot.processed == 1
+        assert len(output_stems(root, "Song0")) == 4
+    run(test)
+
+def test_resume_from_staged_checkpoint():
+    async def test(worker, root):
+        job = add_song(root, "Song0")
+        processing_job = await worker.prepare_job(job)
+        result = await worker.run_robot_stage(processing_job)
+        await worker.stage_stems(processing_job, result)
+        interrupt(worker, job)
+
+        await worker.process_job(job)
+        status = await worker.get_job_status(job["execution_id"])
+        assert status["status"] == "completed"
+        assert not {"download", "robot"} & await stages(worker, job)
+        assert worker.robot.processed == 1  # Not run again
+        assert len(output_stems(root, "Song0")) == 4
+    run(test)
+
+def test_resume_from_uploaded_checkpoint_without_local_files():
+    async def test(worker, root):
+        job = add_song(root, "Song0")
+        await worker.process_job(job)
+        uploaded = (await worker.get_job_status(job["execution_id"]))["results"][-1]["uploaded_stems"]
+        # The work folder is gone with the worker: only the checkpoints are left
+        assert not os.path.exists(worker.job_work_dir(job["execution_id"]))
+
+        await worker.process_job(job)
+        status = await worker.get_job_status(job["execution_id"])
+        assert status["status"] == "completed"
+        assert not {"download", "robot", "stem_move"} & await stages(worker, job)
+        assert worker.robot.processed == 1
+        assert status["results"][-1]["uploaded_stems"] == uploaded
+        assert status["processed_stems_path"] == uploaded["gcp_path"]
+    run(test)
+
+def test_leftover_exports_are_not_staged_into_the_next_job():
+    async def test(worker, root):
+        # Stems of an export interrupted by a crash
+        os.makedirs(os.path.join(root, "exports"))
+        sf.write(os.path.join(root, "exports", "Old_mix_Vocals.wav"), np.zeros((100, 2)), 44100)
+
+        job = add_song(root, "Song0")
+        await worker.process_job(job)
+        assert (await worker.get_job_status(job["execution_id"]))["status"] == "completed"
+        assert "Old_mix_Vocals.wav" not in output_stems(root, "Song0")
+        assert len(output_stems(root, "Song0")) == 4
+    run(test)
+
+def test_incomplete_export_is_an_error():
+    async def test(worker, root):
+        worker.robot = PartialExportRobot(logic_worker.config)
+        job = add_song(root, "Song0")
+        await worker.process_job(job)
+        status = await worker.get_job_status(job["execution_id"])
+        assert status["status"] == "completed_with_errors"
+        assert status["results"][-1]["status"] == "error"
+        assert "missing stems: bass, other" in status["errors"][0]["error"]
+    run(test)
+
+def test_incomplete_stem_set_is_not_cached():
+    async def test(worker, root):
+        logic_worker.config["result_cache"] = True
+        await worker.initialize()
+        # A robot wrongly reporting its partial export as complete
+        worker.robot = PartialExportRobot(logic_worker.config, report_complete=True)
+        first = add_song(root, "Song0")
+        await worker.process_job(first)
+        assert len(output_stems(root, "Song0")) == 2
+
+        again = dict(first, execution_id=str(uuid.uuid4()), output_bucket_path="bucket/again")
+        await worker.process_job(again)
+        assert not (await worker.get_job_status(again["execution_id"]))["results"][-1].get("cached")
+        assert worker.robot.processed == 2  # The robot ran again instead of a cache hit
+    run(test)
+
+def test_complete_stem_set_is_cached():
+    async def test(worker, root):
+        logic_worker.config["result_cache"] = True
+        await worker.initialize()
+        first = add_song(root, "Song0")
+        await worker.process_job(first)
+
+        again = dict(first, execution_id=str(uuid.uuid4()), output_bucket_path="bucket/again")
+        await worker.process_job(again)
+        status = await worker.get_job_status(again["execution_id"])
+        assert status["status"] == "completed"
+        assert status["results"][-1]["cached"]
+        assert worker.robot.processed == 1
+    run(test)
+
+def test_job_given_up_is_an_error_with_a_callback():
+    async def test(worker, root):
+        callbacks = []
+        async def send_callback(callback_url, data):
+            callbacks.append((callback_url, data))
+        worker.send_callback = send_callback
+        worker.queue.max_deliveries = 0
+        execution_id, = await worker.create_jobs([dict(
+            add_song(root, "Song0"),
+            callback_url="http://localhost/callback"
+        )])
+        # The worker crashed holding the job and was restarted with the same id
+        await worker.queue.get(timeout=1)
+        assert await worker.queue.recover(on_dead_letter=worker.give_up_job) == 0
+        status = await worker.get_job_status(execution_id)
+        assert status["status"] == "error"
+        assert status["errors"][-1]["error"] == "Gave up after 1 failed deliveries"
+        assert await worker.redis.ttl(worker.status_store.key(execution_id)) > 0
+        assert callbacks == [("http://localhost/callback", {
+            "execution_id": execution_id,
+            "status": "error",
+            "error": "Gave up after 1 failed deliveries",
+            "timings": status["timings"],
+            "resources": status["resources"]
+        })]
+    run(test)
+
+def test_next_job_is_prefetched_while_the_robot_runs():
+    async def test(worker, root):
+        execution_ids = await worker.create_jobs([add_song(root, f"Song{n}") for n in range(3)])
+        seen = {}
+        async def record(folder_name):
+            seen[folder_name] = await statuses(worker, execution_ids)
+        after_each_robot_run(worker, record)
+
+        await process_queue(worker, execution_ids, prefetch_depth=1)
+        # One job downloaded ahead of the robot, no more
+        assert seen["Song0"][1:] == ["prefetched", "queued"]
+        assert seen["Song1"][2] == "prefetched"
+        assert await statuses(worker, execution_ids) == ["completed"] * 3
+        assert worker.robot.processed == 3
+        stats = await worker.queue.stats()
+        assert stats["inflight"] == 0 and not sum(stats["pending"].values())
+    run(test)
+
+def test_prefetched_jobs_are_requeued_when_the_worker_stops():
+    async def test(worker, root):
+        worker.robot.delay = 5
+        execution_ids = await worker.create_jobs([add_song(root, f"Song{n}") for n in range(3)])
+        loop = asyncio.create_task(worker.process_queue_with_prefetch(1, 1))
+        async def prefetched():
+            while (await statuses(worker, execution_ids))[1] != "prefetched":
+                await asyncio.sleep(0.1)
+        await asyncio.wait_for(prefetched(), 10)
+        await asyncio.sleep(0.5)  # Handed over to the robot loop right after its status is saved
+        loop.cancel()
+        await asyncio.gather(loop, return_exceptions=True)
+
+        # The job in the robot keeps its lease, the prefetched one goes back to the queue
+        stats = await worker.queue.stats()
+        assert stats["inflight"] == 1 and stats["pending"]["normal"] == 2
+        assert execution_ids[1] not in worker.jobs_status
+        assert [json.loads(await worker.queue.get(timeout=1))["execution_id"] for _ in range(2)] == execution_ids[1:]
+    run(test)
+
+def test_upload_overlaps_the_next_robot_run():
+    async def test(worker, root):
+        logic_worker.config["streaming_upload"] = False
+        execution_ids = await worker.create_jobs([add_song(root, f"Song{n}") for n in range(3)])
+        events = []
+        process_folder = worker.robot.process_folder
+        async def recorded(folder_path, folder_name=None, on_stem_ready=None):
+            events.append(("robot", folder_name))
+            return await process_folder(folder_path, folder_name, on_stem_ready)
+        worker.robot.process_folder = recorded
+        put = worker.storage.put
+        def slow_put(local_path, bucket_path):
+            time.sleep(0.5)
+            events.append(("upload", bucket_path.split("/")[-2]))
+            return put(local_path, bucket_path)
+        worker.storage.put = slow_put
+
+        await process_queue(worker, execution_ids)
+        assert await statuses(worker, execution_ids) == ["completed"] * 3
+        # The robot took the next song before the stems of the previous one were uploaded
+        for n in range(2):
+            assert events.index(("robot", f"Song{n + 1}")) < events.index(("upload", f"Song{n}"))
+        assert len(output_stems(root, "Song2")) == 4
+    run(test)
+
+def count_puts(worker) -> list:
+    """Record the bucket path of every object the worker uploads"""
+    puts = []
+    put = worker.storage.put
+    def counted_put(local_path, bucket_path):
+        puts.append(bucket_path)
+        return put(local_path, bucket_path)
+    worker.storage.put = counted_put
+    return puts
+
+def test_stems_are_uploaded_while_the_robot_runs():
+    async def test(worker, root):
+        worker.robot.delay = 1.0  # Leaves the uploads 0.2s of project closing
+        uploaded_during_run = []
+        async def record(folder_name):
+            uploaded_during_run.extend(output_stems(root, folder_name))
+        after_each_robot_run(worker, record)
+        puts = count_puts(worker)
+
+        job = add_song(root, "Song0")
+        await worker.process_job(job)
+        status = await worker.get_job_status(job["execution_id"])
+        assert status["status"] == "completed"
+        assert len(uploaded_during_run) == 4
+        assert len(puts) == 4  # Streamed stems are not uploaded again by finalize_job
+        assert status["results"][-1]["uploaded_stems"]["uploaded_files"] == output_stems(root, "Song0")
+        mix_size = os.path.getsize(os.path.join(root, "storage", "bucket", "songs", "Song0", "Song0_mix.wav"))
+        assert status["resources"]["uploaded_bytes"] == 4 * mix_size
+    run(test)
+
+def failing_link(src, dst):
+    raise OSError(18, "Invalid cross-device link")
+
+def test_streamed_stem_is_copied_when_it_cannot_be_linked():
+    async def test(worker, root):
+        worker.robot.delay = 1.0
+        puts = count_puts(worker)
+        link = os.link
+        os.link = failing_link
+        try:
+            job = add_song(root, "Song0")
+            await worker.process_job(job)
+        finally:
+            os.link = link
+        assert (await worker.get_job_status(job["execution_id"]))["status"] == "completed"
+        assert len(puts) == 4
+        assert len(output_stems(root, "Song0")) == 4
+    run(test)
+
+def test_link_or_copy():
+    with tempfile.TemporaryDirectory() as root:
+        src = os.path.join(root, "Song_mix_Vocals.wav")
+        sf.write(src, np.zeros((4410, 2)), 44100)
+        linked = logic_worker.LogicWorker._link_or_copy(src, os.path.join(root, "linked"))
+        assert os.path.samefile(src, linked)
+        
+        # Another volume: copied, and a partial file left by an interrupted copy is replaced
+        os.makedirs(os.path.join(root, "copied"))
+        with open(os.path.join(root, "copied", "Song_mix_Vocals.wav.part"), "wb") as f:
+            f.write(b"RIFF")
+        link = os.link
+        os.link = failing_link
+        try:
+            copied = logic_worker.LogicWorker._link_or_copy(src, os.path.join(root, "copied"))
+        finally:
+            os.link = link
+        assert not os.path.samefile(src, copied)
+        assert sf.info(copied).frames == 4410
+        assert os.listdir(os.path.join(root, "copied")) == ["Song_mix_Vocals.wav"]
+        assert os.path.exists(src)  # The export is left for stage_stems
+
+def test_batch_never_holds_two_mixes_with_the_same_name():
+    def prepared(folder_name: str, mix_file: str):
+        return ({}, SimpleNamespace(folder_name=folder_name, folder_info={"mix_files": [mix_file]}))
+    pending = [
+        prepared("a", "Song_mix.wav"),
+        prepared("b", "song_MIX.wav"),  # Same stem names as a
+        prepared("a", "Other_mix.wav"),  # Same folder as a
+        prepared("c", "Other_mix.wav")
+    ]
+    first, duplicate, same_folder, other = pending
+    assert logic_worker.LogicWorker.take_batch(pending, 4) == [first, other]
+    assert pending == [duplicate, same_folder]
+    assert logic_worker.LogicWorker.take_batch(pending, 4) == [duplicate, same_folder]
+
+if __name__ == "__main__":
+    test_completed_job_records_its_stages()
+    test_resume_from_downloaded_checkpoint()
+    test_resume_from_staged_checkpoint()
+    test_resume_from_uploaded_checkpoint_without_local_files()
+    test_leftover_exports_are_not_staged_into_the_next_job()
+    test_incomplete_export_is_an_error()
+    test_incomplete_stem_set_is_not_cached()
+    test_complete_stem_set_is_cached()
+    test_job_given_up_is_an_error_with_a_callback()
+    test_next_job_is_prefetched_while_the_robot_runs()
+    test_prefetched_jobs_are_requeued_when_the_worker_stops()
+    test_upload_overlaps_the_next_robot_run()
+    test_stems_are_uploaded_while_the_robot_runs()
+    test_streamed_stem_is_copied_when_it_cannot_be_linked()
+    test_link_or_copy()
+    test_batch_never_holds_two_mixes_with_the_same_name()
+    print("✅ All worker tests passed")
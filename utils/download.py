@@ -1,10 +1,14 @@
 import os
+import time
+import fnmatch
 import tempfile
 import logging
-import subprocess
+import shutil
 import soundfile as sf
-from typing import Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, List, Dict, Optional
 from pathlib import Path
+from utils.storage import StorageBackend, StorageObject, get_storage_backend
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +16,18 @@ class CorruptedWavError(Exception):
     """Exception raised when a WAV file is corrupted"""
     pass
 
+class WorkDirectory:
+    """
+    Fixed-path counterpart of tempfile.TemporaryDirectory.
+    The folder survives a worker restart and is only removed by cleanup().
+    """
+    def __init__(self, path: str):
+        self.name = path
+        os.makedirs(path, exist_ok=True)
+    
+    def cleanup(self):
+        shutil.rmtree(self.name, ignore_errors=True)
+
 def verify_wav_file(file_path: str) -> Tuple[bool, str]:
     """
     Verify if WAV file is valid and not corrupted.
@@ -45,56 +61,116 @@ def verify_wav_file(file_path: str) -> Tuple[bool, str]:
     except Exception as e:
         return False, f"Error verifying WAV file: {str(e)}"
 
+def _download_objects(
+    backend: StorageBackend,
+    bucket_path: str,
+    dest_path: str,
+    mix_pattern: Optional[str],
+    max_transfers: int = 4
+) -> Tuple[List[StorageObject], List[StorageObject]]:
+    """
+    Download the objects below bucket_path into dest_path, preserving their layout,
+    with up to max_transfers objects transferred at once.
+    When mix_pattern is given only objects whose file name matches it are transferred.
+    
+    Returns:
+        Tuple of (downloaded objects, skipped objects)
+    """
+    prefix = bucket_path.strip('/')
+    objects = backend.list(prefix)
+    
+    downloaded = []
+    transfers = []
+    skipped = []
+    for obj in objects:
+        relative = obj.path[len(prefix):].lstrip('/')
+        if not relative or (mix_pattern and not fnmatch.fnmatch(obj.name, mix_pattern)):
+            skipped.append(obj)
+            continue
+        downloaded.append(obj)
+        transfers.append((obj.path, os.path.join(dest_path, relative)))
+    if transfers:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_transfers, len(transfers)))) as pool:
+            # Consuming the results re-raises the first failed transfer
+            list(pool.map(lambda transfer: backend.get(*transfer), transfers))
+    
+    logger.info(
+        f"Downloaded {len(downloaded)} of {len(objects)} objects under {prefix} "
+        f"({sum(o.size for o in downloaded)} bytes), "
+        f"skipped {len(skipped)} ({sum(o.size for o in skipped)} bytes)"
+    )
+    return downloaded, skipped
+
 def download_gcp_folder(
-    bucket_path: str
-) -> Tuple[str, tempfile.TemporaryDirectory]:
+    bucket_path: str,
+    mix_pattern: str = "*_mix.wav",
+    selective: bool = True,
+    backend: Optional[StorageBackend] = None,
+    work_dir: Optional[str] = None,
+    transfer: Optional[Dict[str, int]] = None,
+    max_transfers: int = 4
+) -> Tuple[str, str, tempfile.TemporaryDirectory]:
     """
-    Download a folder from GCP bucket using gsutil into a temporary directory inside ./temp.
-    Only keeps valid *_mix.wav files, removes all others.
-    Raises CorruptedWavError if any _mix.wav file is corrupted.
+    Download a folder from a storage bucket into a temporary directory inside ./temp.
+    Only keeps valid files matching mix_pattern (*_mix.wav by default).
+    Raises CorruptedWavError if any matching file is corrupted.
+    
+    In selective mode (default) the folder is listed first and only the matching
+    objects are transferred. Otherwise the whole folder is copied and non-matching
+    files are deleted afterwards.
     
     Args:
         bucket_path: Full path to GCP bucket folder (e.g. 'bucket-name/folder/subfolder')
+        mix_pattern: Filename pattern (fnmatch) of the files to keep
+        selective: List and download only matching objects instead of the whole folder
+        backend: Storage backend to download from (defaults to the in-process GCS client)
+        work_dir: Fixed folder to download into instead of a new temporary directory;
+            anything left in it by a previous attempt is removed first
+        transfer: Filled with downloaded_bytes (transferred from the bucket),
+            filtered_bytes (objects not matching mix_pattern, skipped or deleted) and
+            verify_seconds (spent checking the WAV files after the transfer)
+        max_transfers: Objects downloaded at once, in both modes
         
     Returns:
         Tuple containing:
+        - Name of the downloaded folder
         - Path to the downloaded folder
-        - TemporaryDirectory object (keep this to ensure cleanup)
+        - TemporaryDirectory (or WorkDirectory) object (keep this to ensure cleanup)
         
     Raises:
-        CorruptedWavError: If any _mix.wav file is corrupted
+        CorruptedWavError: If any matching file is corrupted
     """
+    if backend is None:
+        backend = get_storage_backend()
+    
     try:
-        # Create base temp directory if it doesn't exist
-        base_temp = os.path.join(os.getcwd(), 'temp')
-        os.makedirs(base_temp, exist_ok=True)
-        temp_dir = tempfile.TemporaryDirectory(dir=base_temp)  # Keep this for cleanup tracking
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            temp_dir = WorkDirectory(work_dir)
+        else:
+            # Create base temp directory if it doesn't exist
+            base_temp = os.path.join(os.getcwd(), 'temp')
+            os.makedirs(base_temp, exist_ok=True)
+            temp_dir = tempfile.TemporaryDirectory(dir=base_temp)  # Keep this for cleanup tracking
         temp_path = temp_dir.name
-        # Construct gsutil path
-        gs_path = f"gs://{bucket_path}"
-        
-        # Construct command
-        cmd = ["gsutil", "-m", "cp", "-r", gs_path, temp_path]
-        logger.info(f"Executing command: {' '.join(cmd)}")
-        logger.info(f"Downloading from {gs_path} to {temp_path}")
+        folder_name = bucket_path.rstrip('/').split('/')[-1]
+        logger.info(f"Downloading from {bucket_path} to {temp_path} using {backend.name} backend")
         
-        # Use gsutil to download
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True
+        # Objects are laid out under <temp>/<folder_name>/ like `gsutil cp -r` would do.
+        # In selective mode only the objects matching the pattern are transferred.
+        downloaded, skipped = _download_objects(
+            backend,
+            bucket_path,
+            os.path.join(temp_path, folder_name),
+            mix_pattern if selective else None,
+            max_transfers
         )
+        if transfer is not None:
+            transfer["downloaded_bytes"] = sum(o.size for o in downloaded)
+            transfer["filtered_bytes"] = sum(o.size for o in skipped)
         
-        # Log output
-        if result.stdout:
-            logger.info(f"gsutil output: {result.stdout}")
-        if result.stderr:
-            logger.warning(f"gsutil stderr: {result.stderr}")
-        
-        if result.returncode != 0:
-            raise Exception(f"gsutil error (code {result.returncode}): {result.stderr}")
-        
-        # Filter files - keep only valid *_mix.wav
+        # Filter files - keep only valid files matching mix_pattern
+        verify_started_at = time.monotonic()
         mix_files = []
         removed_files = []
         corrupted_files = []
@@ -102,7 +178,7 @@ def download_gcp_folder(
         for root, dirs, files in os.walk(temp_path):
             for file in files:
                 file_path = os.path.join(root, file)
-                if file.endswith('_mix.wav'):
+                if fnmatch.fnmatch(file, mix_pattern):
                     # Verify WAV file integrity
                     is_valid, error_msg = verify_wav_file(file_path)
                     if is_valid:
@@ -111,30 +187,33 @@ def download_gcp_folder(
                         os.remove(file_path)
                         corrupted_files.append((file, error_msg))
                 else:
+                    if transfer is not None:
+                        transfer["filtered_bytes"] += os.path.getsize(file_path)
                     os.remove(file_path)
                     removed_files.append(file)
+        if transfer is not None:
+            transfer["verify_seconds"] = time.monotonic() - verify_started_at
         
         # If any corrupted files were found, raise error
         if corrupted_files:
             error_msg = "\n".join([f"  - {f}: {err}" for f, err in corrupted_files])
             raise CorruptedWavError(
-                f"Found {len(corrupted_files)} corrupted _mix.wav files:\n{error_msg}"
+                f"Found {len(corrupted_files)} corrupted {mix_pattern} files:\n{error_msg}"
             )
         
         # Log what we kept and removed
         if mix_files:
-            logger.info(f"Kept {len(mix_files)} valid _mix.wav files:")
+            logger.info(f"Kept {len(mix_files)} valid {mix_pattern} files:")
             for f in mix_files:
                 logger.info(f"  - {os.path.basename(f)}")
         else:
-            raise Exception("No valid _mix.wav files found in downloaded folder")
+            raise Exception(f"No valid {mix_pattern} files found in downloaded folder")
             
         if removed_files:
             logger.info(f"Removed {len(removed_files)} non-mix files:")
             for f in removed_files:
                 logger.info(f"  - {f}")
         
-        folder_name = bucket_path.rstrip('/').split('/')[-1]
         temp_path = os.path.join(temp_path, folder_name)
         return folder_name, temp_path, temp_dir
         
@@ -0,0 +1,28 @@
+import os
+import sys
+import shutil
+import resource
+
+def folder_size(folder: str) -> int:
+    """Total size in bytes of the files below a folder (0 if it does not exist)"""
+    total = 0
+    for root, _, files in os.walk(folder):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # Removed while walking (e.g. a stem moved by another task)
+    return total
+
+def peak_rss_bytes() -> int:
+    """High-water mark of the resident memory of this process since it started"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS, in kilobytes on Linux
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def free_disk_bytes(path: str) -> int:
+    """Free space of the volume holding path (or its closest existing parent)"""
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    return shutil.disk_usage(path).free
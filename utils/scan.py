@@ -0,0 +1,208 @@
+import struct
+import fnmatch
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, Callable, Optional, Tuple
+from utils.storage import StorageBackend, StorageObject, get_storage_backend
+
+logger = logging.getLogger(__name__)
+
+# Bytes fetched per ranged read; covers the header of almost every WAV file in one request
+HEADER_READ_SIZE = 64 * 1024
+
+class WavHeaderError(Exception):
+    """Exception raised when a WAV header cannot be parsed"""
+    pass
+
+def parse_wav_header(read: Callable[[int, int], bytes], size: int) -> Dict[str, Any]:
+    """
+    Parse the RIFF/WAVE header of a file through ranged reads.
+    Chunks before 'data' (bext, JUNK, LIST...) are skipped without reading them.
+
+    Args:
+        read: Function returning `length` bytes of the file starting at `start`
+        size: Total file size in bytes
+
+    Returns:
+        Dict with samplerate, channels, bits_per_sample, format_tag, frames and duration
+
+    Raises:
+        WavHeaderError: If the file is not a valid WAV file
+    """
+    window = {"start": 0, "data": read(0, min(HEADER_READ_SIZE, size))}
+
+    def get(offset: int, length: int) -> bytes:
+        start, data = window["start"], window["data"]
+        if offset < start or offset + length > start + len(data):
+            window["start"] = offset
+            window["data"] = read(offset, min(max(length, HEADER_READ_SIZE), size - offset))
+            start, data = window["start"], window["data"]
+        chunk = data[offset - start:offset - start + length]
+        if len(chunk) < length:
+            raise WavHeaderError("File is truncated")
+        return chunk
+
+    riff, _, wave = struct.unpack('<4sI4s', get(0, 12))
+    if riff != b'RIFF' or wave != b'WAVE':
+        raise WavHeaderError("Not a RIFF/WAVE file")
+
+    fmt = None
+    offset = 12
+    while offset + 8 <= size:
+        chunk_id, chunk_size = struct.unpack('<4sI', get(offset, 8))
+        if chunk_id == b'fmt ':
+            if chunk_size < 16:
+                raise WavHeaderError("Invalid fmt chunk")
+            format_tag, channels, samplerate, _, block_align, bits = struct.unpack('<HHIIHH', get(offset + 8, 16))
+            fmt = {
+                "format_tag": format_tag,
+                "channels": channels,
+                "samplerate": samplerate,
+                "block_align": block_align,
+                "bits_per_sample": bits
+            }
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise WavHeaderError("data chunk found before fmt chunk")
+            if fmt["channels"] <= 0:
+                raise WavHeaderError("Invalid channel count")
+            if fmt["samplerate"] <= 0:
+                raise WavHeaderError("Invalid sample rate")
+            if fmt["block_align"] <= 0:
+                raise WavHeaderError("Invalid block align")
+            # A truncated upload only holds part of the declared data
+            data_size = min(chunk_size, size - offset - 8)
+            frames = data_size // fmt["block_align"]
+            if frames == 0:
+                raise WavHeaderError("File has 0 frames")
+            return {
+                "samplerate": fmt["samplerate"],
+                "channels": fmt["channels"],
+                "bits_per_sample": fmt["bits_per_sample"],
+                "format_tag": fmt["format_tag"],
+                "frames": frames,
+                "duration": frames / fmt["samplerate"],
+                "truncated": data_size < chunk_size
+            }
+        offset += 8 + chunk_size + (chunk_size & 1)
+
+    raise WavHeaderError("No data chunk found")
+
+class HeaderCache:
+    """Thread-safe LRU cache of parsed headers keyed by object path and generation"""
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(obj: StorageObject) -> Tuple:
+        # Backends without generations fall back to size and update time
+        return (obj.path, obj.generation or f"{obj.size}:{obj.updated}")
+
+    def get(self, obj: StorageObject) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            entry = self.entries.get(self.key(obj))
+            if entry is not None:
+                self.entries.move_to_end(self.key(obj))
+            return entry
+
+    def put(self, obj: StorageObject, info: Dict[str, Any]):
+        with self.lock:
+            self.entries[self.key(obj)] = info
+            self.entries.move_to_end(self.key(obj))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+header_cache = HeaderCache()
+
+def read_object_header(backend: StorageBackend, obj: StorageObject) -> Dict[str, Any]:
+    """
+    Parsed WAV header of a stored object (cached per object generation).
+    Parse errors are returned as {"valid": False, "error": ...} so they are cached too.
+    """
+    info = header_cache.get(obj)
+    if info is None:
+        try:
+            info = parse_wav_header(
+                lambda start, length: backend.read_range(obj.path, start, length),
+                obj.size
+            )
+            info["valid"] = True
+        except WavHeaderError as e:
+            info = {"valid": False, "error": str(e)}
+        header_cache.put(obj, info)
+    return info
+
+def scan_bucket_folder(
+    bucket_path: str,
+    mix_pattern: str = "*_mix.wav",
+    backend: Optional[StorageBackend] = None
+) -> Dict[str, Any]:
+    """
+    Check whether a bucket folder can be processed without downloading any audio.
+    Lists the folder and reads only the header of each mix file.
+
+    Returns:
+        Dict shaped like LogicWorker.scan_input_folder, with the header of each mix file
+        under folder_info["mix_info"]
+    """
+    if backend is None:
+        backend = get_storage_backend()
+
+    try:
+        prefix = bucket_path.strip('/')
+        folder_name = prefix.split('/')[-1]
+        # Only files directly inside the folder, like the download-based scan
+        objects = [
+            obj for obj in backend.list(prefix)
+            if '/' not in obj.path[len(prefix):].strip('/')
+        ]
+        mix_objects = [obj for obj in objects if fnmatch.fnmatch(obj.name, mix_pattern)]
+
+        if not mix_objects:
+            return {
+                "status": "error",
+                "error": "No _mix.wav file found in the specified folder",
+                "processable": False,
+                "folder_info": None
+            }
+
+        mix_info = {obj.name: read_object_header(backend, obj) for obj in mix_objects}
+        corrupted = {name: info["error"] for name, info in mix_info.items() if not info["valid"]}
+        if corrupted:
+            error_msg = "\n".join([f"  - {name}: {error}" for name, error in corrupted.items()])
+            return {
+                "status": "error",
+                "error": f"Found {len(corrupted)} corrupted {mix_pattern} files:\n{error_msg}",
+                "processable": False,
+                "folder_info": None
+            }
+
+        folder_info = {
+            "path": f"gs://{prefix}",
+            "name": folder_name,
+            "mix_files": sorted(mix_info),
+            "total_wav_files": len([obj for obj in objects if obj.name.endswith('.wav')]),
+            "should_process": True,
+            "mix_info": mix_info
+        }
+
+        return {
+            "status": "success",
+            "processable": True,
+            "folder_info": folder_info,
+            "scanned_at": datetime.now().isoformat()
+        }
+
+    except Exception as e:
+        logger.error(f"Error scanning bucket folder: {str(e)}")
+        return {
+            "status": "error",
+            "error": str(e),
+            "processable": False,
+            "folder_info": None
+        }
@@ -0,0 +1,305 @@
+import os
+import shutil
+import logging
+import threading
+import subprocess
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class StorageObject:
+    """Metadata of a single object in a storage backend"""
+    path: str  # 'bucket-name/folder/file.wav'
+    size: int
+    generation: Optional[str] = None
+    md5_hash: Optional[str] = None
+    updated: Optional[str] = None
+    metadata: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def name(self) -> str:
+        return self.path.rstrip('/').split('/')[-1]
+
+def split_bucket_path(bucket_path: str) -> Tuple[str, str]:
+    """Split 'bucket-name/folder/file' (optionally gs:// prefixed) into (bucket, key)"""
+    if bucket_path.startswith("gs://"):
+        bucket_path = bucket_path[len("gs://"):]
+    bucket, _, key = bucket_path.strip('/').partition('/')
+    if not bucket:
+        raise ValueError(f"Invalid bucket path: {bucket_path}")
+    return bucket, key
+
+class StorageBackend:
+    """
+    Interface for object storage used by the download and upload helpers.
+    All paths are bucket paths in the 'bucket-name/folder/file' form.
+    """
+    name = "base"
+
+    def list(self, bucket_path: str) -> List[StorageObject]:
+        """List every object below a folder (recursively)"""
+        raise NotImplementedError
+
+    def get(self, bucket_path: str, local_path: str) -> int:
+        """Download a single object to local_path, returning the number of bytes written"""
+        raise NotImplementedError
+
+    def put(self, local_path: str, bucket_path: str) -> int:
+        """Upload a local file to bucket_path, returning the number of bytes sent"""
+        raise NotImplementedError
+
+    def stat(self, bucket_path: str) -> Optional[StorageObject]:
+        """Return metadata of a single object or None if it does not exist"""
+        raise NotImplementedError
+
+    def copy(self, src_bucket_path: str, dst_bucket_path: str) -> int:
+        """Copy an object server-side (no local transfer), returning its size in bytes"""
+        raise NotImplementedError
+
+    def read_range(self, bucket_path: str, start: int, length: int) -> bytes:
+        """Read `length` bytes of an object starting at byte `start` (fewer at the end of the object)"""
+        raise NotImplementedError
+
+class GCSStorageBackend(StorageBackend):
+    """
+    In-process Google Cloud Storage backend.
+    A single client (and its HTTP connection pool) is shared by every instance
+    in the process, so connections and credentials are reused across jobs.
+    """
+    name = "gcs"
+
+    _clients: Dict[Optional[str], object] = {}
+    _clients_lock = threading.Lock()
+
+    def __init__(self, project: Optional[str] = None, pool_size: int = 16):
+        self.project = project
+        self.pool_size = pool_size
+
+    @property
+    def client(self):
+        with self._clients_lock:
+            client = self._clients.get(self.project)
+            if client is None:
+                # Imported lazily so the local backend works without the GCS libraries
+                from google.cloud import storage
+                from requests.adapters import HTTPAdapter
+
+                client = storage.Client(project=self.project)
+                adapter = HTTPAdapter(
+                    pool_connections=self.pool_size,
+                    pool_maxsize=self.pool_size
+                )
+                client._http.mount("https://", adapter)
+                self._clients[self.project] = client
+                logger.info(f"Created pooled GCS client (pool size {self.pool_size})")
+            return client
+
+    @staticmethod
+    def _to_object(blob) -> StorageObject:
+        return StorageObject(
+            path=f"{blob.bucket.name}/{blob.name}",
+            size=blob.size or 0,
+            generation=str(blob.generation) if blob.generation is not None else None,
+            md5_hash=blob.md5_hash,
+            updated=blob.updated.isoformat() if blob.updated else None,
+            metadata=dict(blob.metadata or {})
+        )
+
+    def list(self, bucket_path: str) -> List[StorageObject]:
+        bucket, key = split_bucket_path(bucket_path)
+        prefix = f"{key.rstrip('/')}/" if key else ""
+        return [
+            self._to_object(blob)
+            for blob in self.client.list_blobs(bucket, prefix=prefix)
+            if not blob.name.endswith('/')
+        ]
+
+    def get(self, bucket_path: str, local_path: str) -> int:
+        bucket, key = split_bucket_path(bucket_path)
+        os.makedirs(os.path.dirname(local_path) or '.', exist_ok=True)
+        blob = self.client.bucket(bucket).blob(key)
+        blob.download_to_filename(local_path)
+        return os.path.getsize(local_path)
+
+    def put(self, local_path: str, bucket_path: str) -> int:
+        bucket, key = split_bucket_path(bucket_path)
+        blob = self.client.bucket(bucket).blob(key)
+        blob.upload_from_filename(local_path)
+        return os.path.getsize(local_path)
+
+    def stat(self, bucket_path: str) -> Optional[StorageObject]:
+        bucket, key = split_bucket_path(bucket_path)
+        blob = self.client.bucket(bucket).get_blob(key)
+        return self._to_object(blob) if blob is not None else None
+
+    def copy(self, src_bucket_path: str, dst_bucket_path: str) -> int:
+        src_bucket, src_key = split_bucket_path(src_bucket_path)
+        dst_bucket, dst_key = split_bucket_path(dst_bucket_path)
+        bucket = self.client.bucket(src_bucket)
+        new_blob = bucket.copy_blob(bucket.blob(src_key), self.client.bucket(dst_bucket), dst_key)
+        return new_blob.size or 0
+
+    def read_range(self, bucket_path: str, start: int, length: int) -> bytes:
+        bucket, key = split_bucket_path(bucket_path)
+        blob = self.client.bucket(bucket).blob(key)
+        return blob.download_as_bytes(start=start, end=start + length - 1)
+
+class GsutilStorageBackend(StorageBackend):
+    """Backend that shells out to gsutil (one process per call)"""
+    name = "gsutil"
+
+    @staticmethod
+    def _run(cmd: List[str]) -> subprocess.CompletedProcess:
+        """Run a gsutil command, log its output and raise on failure"""
+        logger.info(f"Executing command: {' '.join(cmd)}")
+        result = subprocess.run(
+            cmd,
+            capture_output=True,
+            text=True
+        )
+
+        # Log output
+        if result.stdout:
+            logger.info(f"gsutil output: {result.stdout}")
+        if result.stderr:
+            logger.warning(f"gsutil stderr: {result.stderr}")
+
+        if result.returncode != 0:
+            raise Exception(f"gsutil error (code {result.returncode}): {result.stderr}")
+
+        return result
+
+    def list(self, bucket_path: str) -> List[StorageObject]:
+        gs_path = f"gs://{bucket_path.rstrip('/')}"
+        result = self._run(["gsutil", "ls", "-l", f"{gs_path}/**"])
+
+        objects = []
+        for line in result.stdout.splitlines():
+            parts = line.split()
+            # Object lines look like: "<size>  <timestamp>  gs://bucket/path"
+            if len(parts) >= 3 and parts[0].isdigit() and parts[-1].startswith("gs://"):
+                objects.append(StorageObject(
+                    path=parts[-1][len("gs://"):],
+                    size=int(parts[0]),
+                    updated=parts[1]
+                ))
+        return objects
+
+    def get(self, bucket_path: str, local_path: str) -> int:
+        os.makedirs(os.path.dirname(local_path) or '.', exist_ok=True)
+        self._run(["gsutil", "cp", f"gs://{bucket_path}", local_path])
+        return os.path.getsize(local_path)
+
+    def put(self, local_path: str, bucket_path: str) -> int:
+        self._run(["gsutil", "cp", local_path, f"gs://{bucket_path}"])
+        return os.path.getsize(local_path)
+
+    def stat(self, bucket_path: str) -> Optional[StorageObject]:
+        result = subprocess.run(
+            ["gsutil", "ls", "-l", f"gs://{bucket_path}"],
+            capture_output=True,
+            text=True
+        )
+        if result.returncode != 0:
+            return None
+        for line in result.stdout.splitlines():
+            parts = line.split()
+            if len(parts) >= 3 and parts[0].isdigit():
+                return StorageObject(path=bucket_path, size=int(parts[0]), updated=parts[1])
+        return None
+
+    def copy(self, src_bucket_path: str, dst_bucket_path: str) -> int:
+        # gsutil copies between two gs:// URLs inside the cloud
+        self._run(["gsutil", "cp", f"gs://{src_bucket_path}", f"gs://{dst_bucket_path}"])
+        obj = self.stat(dst_bucket_path)
+        return obj.size if obj else 0
+
+    def read_range(self, bucket_path: str, start: int, length: int) -> bytes:
+        cmd = ["gsutil", "cat", "-r", f"{start}-{start + length - 1}", f"gs://{bucket_path}"]
+        result = subprocess.run(cmd, capture_output=True)
+        if result.returncode != 0:
+            raise Exception(f"gsutil error (code {result.returncode}): {result.stderr.decode(errors='replace')}")
+        return result.stdout
+
+class LocalStorageBackend(StorageBackend):
+    """
+    Backend that maps 'bucket-name/path' onto '<root>/bucket-name/path'.
+    Useful to run and benchmark the whole pipeline offline.
+    """
+    name = "local"
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+
+    def _local(self, bucket_path: str) -> str:
+        bucket, key = split_bucket_path(bucket_path)
+        path = os.path.abspath(os.path.join(self.root, bucket, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Bucket path escapes storage root: {bucket_path}")
+        return path
+
+    def _to_object(self, local_path: str) -> StorageObject:
+        st = os.stat(local_path)
+        return StorageObject(
+            path=os.path.relpath(local_path, self.root).replace(os.sep, '/'),
+            size=st.st_size,
+            generation=str(st.st_mtime_ns),
+            updated=str(st.st_mtime)
+        )
+
+    def list(self, bucket_path: str) -> List[StorageObject]:
+        folder = self._local(bucket_path)
+        objects = []
+        for root, dirs, files in os.walk(folder):
+            dirs.sort()
+            for file in sorted(files):
+                objects.append(self._to_object(os.path.join(root, file)))
+        return objects
+
+    def get(self, bucket_path: str, local_path: str) -> int:
+        os.makedirs(os.path.dirname(local_path) or '.', exist_ok=True)
+        shutil.copyfile(self._local(bucket_path), local_path)
+        return os.path.getsize(local_path)
+
+    def put(self, local_path: str, bucket_path: str) -> int:
+        dest = self._local(bucket_path)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.copyfile(local_path, dest)
+        return os.path.getsize(dest)
+
+    def stat(self, bucket_path: str) -> Optional[StorageObject]:
+        path = self._local(bucket_path)
+        if not os.path.isfile(path):
+            return None
+        return self._to_object(path)
+
+    def copy(self, src_bucket_path: str, dst_bucket_path: str) -> int:
+        dest = self._local(dst_bucket_path)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.copyfile(self._local(src_bucket_path), dest)
+        return os.path.getsize(dest)
+
+    def read_range(self, bucket_path: str, start: int, length: int) -> bytes:
+        with open(self._local(bucket_path), 'rb') as f:
+            f.seek(start)
+            return f.read(length)
+
+def get_storage_backend(name: str = "gcs", root: Optional[str] = None, **kwargs) -> StorageBackend:
+    """
+    Create a storage backend by name.
+
+    Args:
+        name: One of 'gcs' (in-process client), 'gsutil' or 'local'
+        root: Root folder for the local backend
+    """
+    if name == "gcs":
+        return GCSStorageBackend(**kwargs)
+    if name == "gsutil":
+        return GsutilStorageBackend()
+    if name == "local":
+        if not root:
+            raise ValueError("The local storage backend needs a root folder")
+        return LocalStorageBackend(root)
+    raise ValueError(f"Unknown storage backend: {name}")
@@ -0,0 +1,50 @@
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+class StageTimer:
+    """
+    Start and end of the stages of a job, measured with the monotonic clock.
+
+    Times are seconds since the timer origin, which can be moved back by `offset`
+    (e.g. the time the job waited in the queue before this process took it).
+    Stages timed by another component with its own timer are added with `merge`.
+    """
+
+    def __init__(self, offset: float = 0.0):
+        self.origin = time.monotonic() - offset
+        self.stages: Dict[str, Dict[str, float]] = {}
+
+    def now(self) -> float:
+        return time.monotonic() - self.origin
+
+    def record(self, name: str, start: float, end: float):
+        self.stages[name] = {
+            "start": round(start, 3),
+            "end": round(end, 3),
+            "duration": round(end - start, 3)
+        }
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block as stage `name`, also when it raises"""
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.record(name, start, self.now())
+
+    def split(self, name: str, tail: str, duration: float):
+        """Move the last `duration` seconds of stage `name` into a new stage `tail`"""
+        stage = self.stages[name]
+        boundary = max(stage["start"], stage["end"] - duration)
+        self.record(tail, boundary, stage["end"])
+        self.record(name, stage["start"], boundary)
+
+    def merge(self, prefix: str, stages: Dict[str, Dict[str, float]], at: float):
+        """Add the stages of another timer, started `at` seconds into this one, as prefix.<name>"""
+        for name, stage in stages.items():
+            self.record(f"{prefix}.{name}", at + stage["start"], at + stage["end"])
+
+    def to_dict(self) -> Dict[str, Dict[str, float]]:
+        return dict(self.stages)
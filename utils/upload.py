@@ -1,16 +1,49 @@
 import os
 import logging
-import subprocess
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
 from pathlib import Path
+from utils.storage import StorageBackend, get_storage_backend
 
 logger = logging.getLogger(__name__)
 
+def upload_stem_file(
+    local_file: str,
+    bucket_path: str,
+    folder_name: str = None,
+    backend: Optional[StorageBackend] = None
+) -> int:
+    """
+    Upload a single stem file to GCP bucket.
+    
+    Args:
+        local_file: Path to the stem file
+        bucket_path: GCP bucket path to upload to (e.g. 'bucket-name/folder')
+        folder_name: Optional sub-folder of bucket_path to upload the stem into
+        backend: Storage backend to upload to (defaults to the in-process GCS client)
+        
+    Returns:
+        Number of bytes uploaded
+    """
+    if backend is None:
+        backend = get_storage_backend()
+    
+    dest_path = bucket_path.strip('/')
+    if folder_name:
+        dest_path = f"{dest_path}/{folder_name}"
+    
+    uploaded_bytes = backend.put(local_file, f"{dest_path}/{os.path.basename(local_file)}")
+    logger.info(f"Uploaded stem {os.path.basename(local_file)} ({uploaded_bytes} bytes) to gs://{dest_path}")
+    return uploaded_bytes
+
 def upload_stems_to_gcp(
     local_folder: str,
     bucket_path: str,
     stems_pattern: str = "*.wav",
-    folder_name: str = None
+    folder_name: str = None,
+    backend: Optional[StorageBackend] = None,
+    already_uploaded: Optional[Dict[str, int]] = None,
+    max_transfers: int = 4
 ) -> Dict[str, Any]:
     """
     Upload processed stems from local folder to GCP bucket.
@@ -19,50 +52,53 @@ def upload_stems_to_gcp(
         local_folder: Path to local folder containing stems
         bucket_path: GCP bucket path to upload to (e.g. 'bucket-name/folder')
         stems_pattern: Pattern to match stem files (default: "*.wav")
+        folder_name: Optional sub-folder of bucket_path to upload the stems into
+        backend: Storage backend to upload to (defaults to the in-process GCS client)
+        already_uploaded: Stem file names already uploaded (e.g. streamed) mapped to their size;
+            they are reported but not uploaded again
+        max_transfers: Stems uploaded at once
         
     Returns:
         Dict containing upload status and paths
     """
     try:
+        if backend is None:
+            backend = get_storage_backend()
+        
         # Ensure local folder exists
         if not os.path.exists(local_folder):
             raise Exception(f"Local folder not found: {local_folder}")
             
         # Find all stem files
-        stem_files = list(Path(local_folder).glob(stems_pattern))
+        stem_files = sorted(Path(local_folder).glob(stems_pattern))
         if not stem_files:
             raise Exception(f"No stem files found in {local_folder}")
             
-        # Construct gsutil path
-        gs_path = f"gs://{bucket_path}"
+        # Construct destination path
+        dest_path = bucket_path.strip('/')
         
         if folder_name:
-            gs_path = f"{gs_path}/{folder_name}"
+            dest_path = f"{dest_path}/{folder_name}"
+        gs_path = f"gs://{dest_path}"
             
         # Log what we're uploading
-        logger.info(f"Found {len(stem_files)} stems to upload:")
+        logger.info(f"Found {len(stem_files)} stems to upload to {gs_path} using {backend.name} backend:")
         for stem in stem_files:
             logger.info(f"  - {stem.name}")
             
-        # Construct upload command
-        cmd = ["gsutil", "-m", "cp", "-r", f"{local_folder}", gs_path]
-        logger.info(f"Executing upload command: {' '.join(cmd)}")
-        
-        # Execute upload
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True
-        )
+        # Upload the stems that were not uploaded already, several at once
+        already_uploaded = already_uploaded or {}
+        uploaded_bytes = sum(already_uploaded.get(stem.name, 0) for stem in stem_files)
+        pending = [stem for stem in stem_files if stem.name not in already_uploaded]
+        if pending:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_transfers, len(pending)))) as pool:
+                # Consuming the results re-raises the first failed upload
+                uploaded_bytes += sum(pool.map(
+                    lambda stem: backend.put(str(stem), f"{dest_path}/{stem.name}"),
+                    pending
+                ))
         
-        # Log output
-        if result.stdout:
-            logger.info(f"gsutil output: {result.stdout}")
-        if result.stderr:
-            logger.warning(f"gsutil stderr: {result.stderr}")
-            
-        if result.returncode != 0:
-            raise Exception(f"gsutil error (code {result.returncode}): {result.stderr}")
+        logger.info(f"Uploaded {len(stem_files)} stems ({uploaded_bytes} bytes) to {gs_path}")
             
         # Return success with paths
         return {
@@ -71,6 +107,7 @@ def upload_stems_to_gcp(
             "source_folder": local_folder,
             "destination_bucket": bucket_path,
             "uploaded_files": [stem.name for stem in stem_files],
+            "uploaded_bytes": uploaded_bytes,
             "gcp_path": gs_path
         }
         
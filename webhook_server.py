@@ -1,12 +1,17 @@
 #!/usr/bin/env python3
 import json
 import logging
-from typing import Optional
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from datetime import datetime
+from typing import List, Literal, Optional
+from fastapi import FastAPI, HTTPException, Header
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel, Field
 import uvicorn
-from worker.logic_worker import worker_instance
+# Only the queue/status client: the API never imports the robot or pyautogui
+from worker.job_client import JobClient, QueueFullError
+from worker.idempotency import IdempotencyConflictError
+from utils.storage import split_bucket_path
+from utils.scan import scan_bucket_folder
 
 # Load configuration
 with open('config.json', 'r') as f:
@@ -23,11 +28,24 @@ logging.basicConfig(
 )
 
 app = FastAPI(title="Logic Worker API", version="1.0.0")
+job_client = JobClient(config)
 
 class ProcessingRequest(BaseModel):
     input_bucket_path: str = Field(..., description="GCP bucket path containing the _mix.wav file (e.g. 'bucket-name/folder')")
     output_bucket_path: str = Field(..., description="GCP bucket path where processed stems should be uploaded")
     callback_url: Optional[str] = Field(None, description="Optional callback URL to notify when processing is complete")
+    priority: Literal["high", "normal", "low"] = Field("normal", description="Queue lane; a lane is only served while every higher one is empty")
+    tenant: str = Field("default", description="Client key; jobs of a priority are shared fairly between clients (see tenant_weights)")
+    deadline: Optional[datetime] = Field(None, description="Optional deadline; jobs are served earliest deadline first and dropped if not started by then")
+    idempotency_key: Optional[str] = Field(None, max_length=255, description="Optional key; retrying with the same key returns the job created the first time (also accepted as the Idempotency-Key header)")
+
+class PrefixProcessingRequest(BaseModel):
+    input_prefix: str = Field(..., description="GCP bucket prefix whose sub-folders each contain a _mix.wav file (e.g. 'bucket-name/dataset')")
+    output_bucket_path: str = Field(..., description="GCP bucket path where the stems of every song should be uploaded")
+    callback_url: Optional[str] = Field(None, description="Optional callback URL notified when each job is complete")
+    priority: Literal["high", "normal", "low"] = Field("normal", description="Queue lane of every job of the batch")
+    tenant: str = Field("default", description="Client key of every job of the batch")
+    deadline: Optional[datetime] = Field(None, description="Optional deadline of every job of the batch")
 
 class ProcessingResponse(BaseModel):
     execution_id: str
@@ -36,6 +54,32 @@ class ProcessingResponse(BaseModel):
     folder_name: str
     input_bucket_path: str
     output_bucket_path: str
+    duplicate: bool = False  # Existing job returned for a reused idempotency key
+
+class BatchProcessingResponse(BaseModel):
+    status: str
+    message: str
+    execution_ids: List[str]
+    jobs: List[ProcessingResponse]
+
+class PrefixProcessingResponse(BaseModel):
+    batch_id: str
+    status: str
+    message: str
+    execution_ids: List[str]
+    folders: List[str]
+
+class BatchStatusResponse(BaseModel):
+    batch_id: str
+    status: str
+    input_prefix: str
+    output_bucket_path: str
+    callback_url: Optional[str] = None
+    created_at: str
+    total: int
+    finished: int
+    counts: dict
+    execution_ids: List[str]
 
 class StatusResponse(BaseModel):
     execution_id: str
@@ -48,28 +92,50 @@ class StatusResponse(BaseModel):
     created_at: str
     callback_url: Optional[str]
     processed_stems_path: Optional[str] = None
+    batch_id: Optional[str] = None
+    priority: str = "normal"
+    tenant: str = "default"
+    deadline: Optional[str] = None
+    timings: dict = {}
+    resources: dict = {}
+    idempotency_key: Optional[str] = None
+
+class WorkersResponse(BaseModel):
+    count: int
+    workers: List[dict]
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize the worker when the server starts"""
+    """Connect to Redis when the server starts"""
     try:
-        await worker_instance.initialize()
-        logging.info("Worker initialized successfully")
+        await job_client.initialize()
+        logging.info("Job client initialized successfully")
     except Exception as e:
-        logging.error(f"Failed to initialize worker: {str(e)}")
+        logging.error(f"Failed to initialize job client: {str(e)}")
         raise
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Clean up when the server shuts down"""
     try:
-        await worker_instance.stop_worker()
-        logging.info("Worker stopped successfully")
+        await job_client.close()
+        logging.info("Job client closed successfully")
     except Exception as e:
-        logging.error(f"Error stopping worker: {str(e)}")
+        logging.error(f"Error closing job client: {str(e)}")
+
+def queue_full(error: QueueFullError) -> HTTPException:
+    """429 telling the client when the fleet is expected to have room for its jobs"""
+    return HTTPException(
+        status_code=429,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)}
+    )
 
 @app.post("/process", response_model=ProcessingResponse)
-async def create_processing_job(request: ProcessingRequest):
+async def create_processing_job(
+    request: ProcessingRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255)
+):
     """
     Create a new processing job
     
@@ -77,33 +143,180 @@ async def create_processing_job(request: ProcessingRequest):
     - input_bucket_path: GCP bucket path containing the _mix.wav file
     - output_bucket_path: GCP bucket path where processed stems should be uploaded
     - callback_url: Optional URL for status updates
+    - priority: high, normal (default) or low
+    - tenant: Client key used to share the queue fairly between clients
+    - deadline: Optional datetime; the job is dropped (status deadline_exceeded) if not started by then
+    - idempotency_key (or Idempotency-Key header): Optional; a retry with the same key returns
+      the existing job instead of creating a duplicate
     """
     try:
         # Create the job with bucket paths
-        execution_id = await worker_instance.create_job(
+        duplicates = []
+        execution_id = await job_client.create_job(
             input_bucket_path=request.input_bucket_path,
             output_bucket_path=request.output_bucket_path,
-            callback_url=request.callback_url
+            callback_url=request.callback_url,
+            priority=request.priority,
+            tenant=request.tenant,
+            deadline=request.deadline,
+            idempotency_key=idempotency_key or request.idempotency_key,
+            duplicates=duplicates
         )
         
-        # Get initial job status
-        job_status = worker_instance.get_job_status(execution_id)
+        # Get initial job status (not saved yet if the first attempt is still being enqueued)
+        job_status = await job_client.get_job_status(execution_id) or {}
         
+        if duplicates:
+            message = "Job already created for this idempotency key"
+        else:
+            message = f"Job created successfully. Will process from bucket: {request.input_bucket_path}"
         return ProcessingResponse(
             execution_id=execution_id,
-            status="queued",
-            message=f"Job created successfully. Will process from bucket: {request.input_bucket_path}",
+            status=job_status.get('status', 'queued'),
+            message=message,
             folder_name=job_status['folder_name'] if job_status.get('folder_name') else '',
             input_bucket_path=request.input_bucket_path,
-            output_bucket_path=request.output_bucket_path
+            output_bucket_path=request.output_bucket_path,
+            duplicate=bool(duplicates)
         )
         
     except HTTPException:
         raise
+    except IdempotencyConflictError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except QueueFullError as e:
+        raise queue_full(e)
     except Exception as e:
         logging.error(f"Error creating processing job: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/process/batch", response_model=BatchProcessingResponse)
+async def create_processing_jobs(requests: List[ProcessingRequest]):
+    """
+    Create several processing jobs at once
+    
+    Accepts a list of processing requests (same fields as POST /process).
+    The whole list is validated first, then every job is enqueued in a single
+    Redis transaction: either all jobs are created or none. Jobs whose idempotency_key
+    was used before are returned as they are instead of being created again.
+    """
+    max_jobs = config.get('max_batch_jobs', 1000)
+    if not requests:
+        raise HTTPException(status_code=422, detail="The batch is empty")
+    if len(requests) > max_jobs:
+        raise HTTPException(status_code=422, detail=f"A batch can hold at most {max_jobs} jobs")
+    
+    for index, request in enumerate(requests):
+        try:
+            split_bucket_path(request.input_bucket_path)
+            split_bucket_path(request.output_bucket_path)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=f"Job {index}: {str(e)}")
+    
+    try:
+        duplicates = []
+        execution_ids = await job_client.create_jobs(
+            [request.model_dump() for request in requests],
+            duplicates=duplicates
+        )
+        statuses = {
+            execution_id: (await job_client.get_job_status(execution_id) or {}).get('status', 'queued')
+            for execution_id in duplicates
+        }
+        
+        return BatchProcessingResponse(
+            status="queued",
+            message=f"{len(set(execution_ids) - set(duplicates))} jobs created successfully",
+            execution_ids=execution_ids,
+            jobs=[
+                ProcessingResponse(
+                    execution_id=execution_id,
+                    status=statuses.get(execution_id, "queued"),
+                    message=(
+                        "Job already created for this idempotency key" if execution_id in duplicates
+                        else f"Job created successfully. Will process from bucket: {request.input_bucket_path}"
+                    ),
+                    folder_name='',
+                    input_bucket_path=request.input_bucket_path,
+                    output_bucket_path=request.output_bucket_path,
+                    duplicate=execution_id in duplicates
+                )
+                for execution_id, request in zip(execution_ids, requests)
+            ]
+        )
+        
+    except IdempotencyConflictError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except QueueFullError as e:
+        raise queue_full(e)
+    except Exception as e:
+        logging.error(f"Error creating processing jobs: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/process/prefix", response_model=PrefixProcessingResponse)
+async def create_prefix_jobs(request: PrefixProcessingRequest):
+    """
+    Create one processing job per song folder below a bucket prefix
+    
+    The prefix is listed once; every folder containing a _mix.wav file becomes a job.
+    All jobs share a batch_id whose aggregated progress is available at GET /batch/{batch_id}.
+    """
+    try:
+        split_bucket_path(request.input_prefix)
+        split_bucket_path(request.output_bucket_path)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    try:
+        batch = await job_client.create_batch(
+            input_prefix=request.input_prefix,
+            output_bucket_path=request.output_bucket_path,
+            callback_url=request.callback_url,
+            priority=request.priority,
+            tenant=request.tenant,
+            deadline=request.deadline
+        )
+        
+        if batch is None:
+            raise HTTPException(status_code=404, detail=f"No folder with a _mix.wav file found under {request.input_prefix}")
+        
+        return PrefixProcessingResponse(
+            batch_id=batch["batch_id"],
+            status="queued",
+            message=f"{len(batch['execution_ids'])} jobs created from prefix: {request.input_prefix}",
+            execution_ids=batch["execution_ids"],
+            folders=batch["folders"]
+        )
+        
+    except HTTPException:
+        raise
+    except QueueFullError as e:
+        raise queue_full(e)
+    except Exception as e:
+        logging.error(f"Error creating jobs from prefix: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/batch/{batch_id}", response_model=BatchStatusResponse)
+async def get_batch_status(batch_id: str):
+    """
+    Get the aggregated status of a batch created with POST /process/prefix
+    
+    Returns the number of jobs in each status and the overall batch status.
+    """
+    try:
+        batch_status = await job_client.get_batch_status(batch_id)
+        
+        if batch_status is None:
+            raise HTTPException(status_code=404, detail="Batch not found")
+        
+        return BatchStatusResponse(**batch_status)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error getting batch status: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/status/{execution_id}", response_model=StatusResponse)
 async def get_job_status(execution_id: str):
     """
@@ -113,7 +326,7 @@ async def get_job_status(execution_id: str):
     including progress, errors, and results.
     """
     try:
-        job_status = worker_instance.get_job_status(execution_id)
+        job_status = await job_client.get_job_status(execution_id)
         
         if job_status is None:
             raise HTTPException(status_code=404, detail="Job not found")
@@ -126,36 +339,67 @@ async def get_job_status(execution_id: str):
         logging.error(f"Error getting job status: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/workers", response_model=WorkersResponse)
+async def list_workers():
+    """
+    List the live workers of the fleet
+    
+    A worker is live while its heartbeat is younger than heartbeat_ttl. Each entry
+    has its capabilities, the job in its robot (current_job) and every job it holds.
+    """
+    try:
+        workers = await job_client.list_workers()
+        return WorkersResponse(count=len(workers), workers=workers)
+        
+    except Exception as e:
+        logging.error(f"Error listing workers: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/scan")
 async def scan_folder(bucket_path: str):
     """
     Scan a GCP bucket folder to see if it can be processed
     
     This is a utility endpoint to preview if a folder can be processed
-    without actually creating a job.
+    without actually creating a job. Nothing is downloaded: the folder is
+    listed and only the header of each _mix.wav file is read.
     """
     try:
-        from utils.download import download_gcp_folder
-        
-        # Download files to temp directory
-        temp_path, temp_dir = download_gcp_folder(bucket_path)
-        
-        try:
-            scan_result = worker_instance.scan_input_folder(temp_path)
-            return scan_result
-        finally:
-            temp_dir.cleanup()
+        return await job_client.run_blocking(
+            scan_bucket_folder,
+            bucket_path,
+            mix_pattern=config.get('mix_pattern', '*_mix.wav'),
+            backend=job_client.storage
+        )
         
     except Exception as e:
         logging.error(f"Error scanning folder: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Fleet metrics in the Prometheus text format, aggregated over every worker process
+    """
+    try:
+        return PlainTextResponse(
+            await job_client.collect_metrics(),
+            media_type="text/plain; version=0.0.4"
+        )
+    except Exception as e:
+        logging.error(f"Error collecting metrics: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/health")
 async def health_check():
     """
     Health check endpoint
     """
-    return {"status": "healthy", "message": "Logic Worker API is running"}
+    return {
+        "status": "healthy",
+        "message": "Logic Worker API is running",
+        "event_loop_lag": job_client.get_loop_lag()
+    }
 
 @app.get("/")
 async def root():
@@ -167,8 +411,13 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "POST /process": "Create a new processing job",
+            "POST /process/batch": "Create several processing jobs in one request",
+            "POST /process/prefix": "Create one job per song folder below a bucket prefix",
+            "GET /batch/{batch_id}": "Get aggregated status of a prefix batch",
             "GET /status/{execution_id}": "Get job status",
+            "GET /workers": "List live workers and their current jobs",
             "GET /scan": "Scan GCP bucket folder for processable files",
+            "GET /metrics": "Prometheus metrics (queue, jobs, stage latencies, transfers)",
             "GET /health": "Health check"
         }
     }
@@ -178,5 +427,6 @@ if __name__ == "__main__":
         "webhook_server:app",
         host="0.0.0.0",
         port=config["webhook_port"],
+        workers=config.get("api_workers", 1),
         log_level="info"
     ) 
\ No newline at end of file
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+import json
+import hashlib
+from typing import Dict, Any, List, Optional, Tuple
+from redis.asyncio import Redis
+
+# Request fields that must match for a retry to be recognised as the same submission
+FINGERPRINT_FIELDS = ("input_bucket_path", "output_bucket_path", "callback_url", "priority", "tenant", "deadline")
+
+class IdempotencyConflictError(Exception):
+    """Raised when an idempotency key is reused for a different request"""
+    pass
+
+def request_fingerprint(request: Dict[str, Any]) -> str:
+    fields = {field: request.get(field) for field in FINGERPRINT_FIELDS}
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, default=str).encode()).hexdigest()
+
+class IdempotencyStore:
+    """
+    Idempotency keys of job submissions, so a client retrying a request gets the job
+    created by its first attempt instead of a duplicate.
+
+    A key is claimed with SET NX EX: of several API processes handling the same key at
+    once, exactly one creates the job, the others read its execution id. Keys are scoped
+    to the tenant and expire after `ttl` seconds.
+
+    Keys:
+        logic-idempotency:<tenant>:<key>    JSON {execution_id, fingerprint}
+    """
+    KEY_PREFIX = "logic-idempotency:"
+
+    def __init__(self, redis: Redis, ttl: int = 86400):
+        self.redis = redis
+        self.ttl = ttl
+
+    @classmethod
+    def key(cls, tenant: str, idempotency_key: str) -> str:
+        return f"{cls.KEY_PREFIX}{tenant}:{idempotency_key}"
+
+    async def claim(self, claims: List[Tuple[str, str, Dict[str, Any]]]) -> List[Optional[str]]:
+        """
+        Claim idempotency keys for new jobs.
+
+        Args:
+            claims: (redis key, execution id of the new job, request) per keyed request
+
+        Returns:
+            Per claim, None if the key was claimed for the new job, else the execution id
+            of the job created for it before
+
+        Raises:
+            IdempotencyConflictError: If a key was used before for a different request
+        """
+        results: List[Optional[str]] = [None] * len(claims)
+        conflicts = []
+        pending = list(range(len(claims)))
+        while pending:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for index in pending:
+                    key, execution_id, request = claims[index]
+                    record = {"execution_id": execution_id, "fingerprint": request_fingerprint(request)}
+                    pipe.set(key, json.dumps(record), nx=True, ex=self.ttl)
+                claimed = await pipe.execute()
+            taken = [index for index, ok in zip(pending, claimed) if not ok]
+            if not taken:
+                break
+            records = await self.redis.mget([claims[index][0] for index in taken])
+            pending = []
+            for index, record in zip(taken, records):
+                if record is None:
+                    pending.append(index)  # Expired in between, claim it again
+                    continue
+                record = json.loads(record)
+                if record["fingerprint"] != request_fingerprint(claims[index][2]):
+                    conflicts.append(index)
+                results[index] = record["execution_id"]
+        
+        if conflicts:
+            # Nothing is created: give back the keys claimed by this call
+            await self.release([key for (key, _, _), existing in zip(claims, results) if existing is None])
+            key = claims[conflicts[0]][0][len(self.KEY_PREFIX):]
+            raise IdempotencyConflictError(f"Idempotency key {key} was already used for a different request")
+        return results
+
+    async def release(self, keys: List[str]):
+        """Drop keys claimed for jobs that could not be created, so a retry can create them"""
+        if keys:
+            await self.redis.delete(*keys)
@@ -0,0 +1,518 @@
+#!/usr/bin/env python3
+import math
+import uuid
+import time
+import asyncio
+import fnmatch
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Callable
+from dataclasses import dataclass
+from redis.asyncio import Redis, ConnectionPool
+from utils.storage import get_storage_backend
+from utils.timing import StageTimer
+from worker.status_store import JobStatusStore, FINISHED_STATUSES
+from worker.registry import WorkerRegistry
+from worker.metrics import MetricsStore
+from worker.idempotency import IdempotencyStore
+from worker.job_queue import ReliableQueue, DEFAULT_PRIORITY, DEFAULT_TENANT
+
+class QueueFullError(Exception):
+    """Raised when accepting more jobs would exceed max_queued_jobs"""
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after  # Seconds until the fleet is expected to have made room
+
+@dataclass
+class ProcessingJob:
+    execution_id: str
+    input_bucket_path: str
+    output_bucket_path: str
+    callback_url: Optional[str]
+    created_at: datetime
+    status: str = "pending"
+    folder_name: str = ""
+    errors: List[Dict[str, Any]] = None
+    results: List[Dict[str, Any]] = None
+    processed_stems_path: Optional[str] = None
+    temp_dir: Optional[Any] = None  # TemporaryDirectory instance
+    temp_path: Optional[str] = None  # Downloaded song folder inside temp_dir
+    folder_info: Optional[Dict[str, Any]] = None  # Result of scan_input_folder
+    stems_path: Optional[str] = None  # Per-job staging folder holding the exported stems
+    uploaded_stems: Dict[str, int] = None  # Stems already streamed to the output bucket (name -> bytes)
+    upload_tasks: List[asyncio.Task] = None  # Streaming uploads still in flight
+    queue_item: Optional[str] = None  # Raw queue entry, acknowledged once the job is finished
+    checkpoints: Dict[str, Dict[str, Any]] = None  # Stages finished by a previous delivery of the job
+    content_hash: Optional[str] = None  # Content hash of the mix, key of the result cache
+    batch_id: Optional[str] = None  # Batch the job was submitted with (prefix submissions)
+    priority: str = DEFAULT_PRIORITY  # Queue lane (high, normal, low)
+    tenant: str = DEFAULT_TENANT  # Client the job is scheduled fairly against
+    deadline: Optional[datetime] = None  # Dropped if not in the robot by then
+    timer: Optional[StageTimer] = None  # Start/end of each stage, in seconds since the job was created
+    resources: Dict[str, int] = None  # Bytes moved and disk/memory high-water marks of the job
+    idempotency_key: Optional[str] = None  # Client key that makes retried submissions return this job
+
+    def __post_init__(self):
+        if self.errors is None:
+            self.errors = []
+        if self.results is None:
+            self.results = []
+        if self.uploaded_stems is None:
+            self.uploaded_stems = {}
+        if self.upload_tasks is None:
+            self.upload_tasks = []
+        if self.checkpoints is None:
+            self.checkpoints = {}
+        if self.timer is None:
+            self.timer = StageTimer(offset=max(0.0, (datetime.now() - self.created_at).total_seconds()))
+        if self.resources is None:
+            self.resources = {
+                "downloaded_bytes": 0,  # Transferred from the input bucket
+                "filtered_bytes": 0,  # Input objects discarded by mix_pattern (skipped or deleted)
+                "uploaded_bytes": 0,  # Stems sent to the output bucket
+                "peak_temp_bytes": 0,  # Largest size seen of the job's temp folder (input + staged stems)
+                "peak_rss_bytes": 0  # Worker process RSS high-water mark, as of the last sample
+            }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Public status of the job, as stored in Redis and returned by the API"""
+        return {
+            "execution_id": self.execution_id,
+            "status": self.status,
+            "input_bucket_path": self.input_bucket_path,
+            "output_bucket_path": self.output_bucket_path,
+            "folder_name": self.folder_name,
+            "errors": self.errors,
+            "results": self.results,
+            "created_at": self.created_at.isoformat(),
+            "callback_url": self.callback_url,
+            "processed_stems_path": self.processed_stems_path,
+            "batch_id": self.batch_id,
+            "priority": self.priority,
+            "tenant": self.tenant,
+            "deadline": self.deadline.isoformat() if self.deadline else None,
+            "timings": self.timer.to_dict(),
+            "resources": self.resources,
+            "idempotency_key": self.idempotency_key
+        }
+
+    def deadline_passed(self) -> bool:
+        return self.deadline is not None and datetime.now() >= self.deadline
+
+def local_deadline(deadline: Any) -> Optional[datetime]:
+    """Deadline (datetime or ISO string) as a naive local datetime, like created_at"""
+    if not deadline:
+        return None
+    if isinstance(deadline, str):
+        deadline = datetime.fromisoformat(deadline)
+    if deadline.tzinfo is not None:
+        deadline = deadline.astimezone().replace(tzinfo=None)
+    return deadline
+
+class JobClient:
+    """
+    Queue and status store client: everything needed to submit jobs and read their status.
+    Used as is by the HTTP API and extended by LogicWorker. It never imports the robot
+    (pyautogui needs a display), so the API can run on headless hosts.
+    """
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.logger = logging.getLogger(__name__)
+        self.redis = None
+        self.pool = None
+        # Storage backend shared by every job so connections are reused
+        self.storage = get_storage_backend(
+            config.get('storage_backend', 'gcs'),
+            root=config.get('storage_root')
+        )
+        self.status_store = None  # Job status shared between the API and the workers through Redis
+        self.registry = None  # Live workers of the fleet, with their capabilities and current jobs
+        self.queue = None  # Priority/tenant lanes of the logic-processing queue
+        self.metrics = None  # Counters and stage histograms aggregated over every process
+        self.idempotency = None  # Idempotency keys of submitted jobs
+        # Bounded pool for blocking I/O (downloads, uploads, WAV checks, file moves)
+        self.io_executor = ThreadPoolExecutor(
+            max_workers=config.get('io_threads', 4),
+            thread_name_prefix="logic-io"
+        )
+        # Event loop lag gauge, in seconds
+        self.loop_lag = {"current": 0.0, "max": 0.0}
+        self.loop_monitor_task = None
+        
+    async def run_blocking(self, func: Callable, *args, **kwargs):
+        """Run a blocking function in the I/O thread pool without stalling the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.io_executor,
+            functools.partial(func, *args, **kwargs)
+        )
+
+    async def monitor_loop_lag(self, interval: float = 0.5):
+        """Measure how late the event loop wakes up from a sleep of `interval` seconds"""
+        threshold = self.config.get('loop_lag_warning', 0.25)
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(interval)
+            lag = max(0.0, time.monotonic() - start - interval)
+            self.loop_lag["current"] = lag
+            self.loop_lag["max"] = max(self.loop_lag["max"], lag)
+            if lag > threshold:
+                self.logger.warning(f"Event loop lag of {lag * 1000:.0f} ms detected")
+
+    def get_loop_lag(self) -> Dict[str, float]:
+        """Current and maximum event loop lag in milliseconds"""
+        return {
+            "current_ms": round(self.loop_lag["current"] * 1000, 2),
+            "max_ms": round(self.loop_lag["max"] * 1000, 2)
+        }
+
+    async def initialize(self):
+        """Initialize Redis connection pool"""
+        self.pool = ConnectionPool.from_url(
+            self.config['redis_url'],
+            max_connections=10,
+            decode_responses=True
+        )
+        self.redis = Redis(connection_pool=self.pool)
+        self.status_store = JobStatusStore(
+            self.redis,
+            self.config.get('finished_job_ttl', 86400),
+            self.config.get('batch_ttl', 7 * 86400)
+        )
+        self.registry = WorkerRegistry(self.redis, self.config.get('heartbeat_ttl', 30))
+        self.queue = ReliableQueue(self.redis, tenant_weights=self.config.get('tenant_weights'))
+        self.metrics = MetricsStore(self.redis)
+        self.idempotency = IdempotencyStore(self.redis, self.config.get('idempotency_ttl', 86400))
+        if self.loop_monitor_task is None:
+            self.loop_monitor_task = asyncio.create_task(self.monitor_loop_lag())
+
+    async def close(self):
+        """Close the Redis connections and the I/O pool"""
+        if self.loop_monitor_task:
+            self.loop_monitor_task.cancel()
+            self.loop_monitor_task = None
+        self.io_executor.shutdown(wait=False)
+        if self.redis:
+            await self.redis.close()
+        if self.pool:
+            await self.pool.disconnect()
+
+    async def create_job(
+        self, 
+        input_bucket_path: str,
+        output_bucket_path: str,
+        callback_url: Optional[str] = None,
+        priority: str = DEFAULT_PRIORITY,
+        tenant: str = DEFAULT_TENANT,
+        deadline: Optional[datetime] = None,
+        idempotency_key: Optional[str] = None,
+        duplicates: Optional[List[str]] = None
+    ) -> str:
+        """Create a new processing job (see create_jobs for idempotency_key and duplicates)"""
+        execution_ids = await self.create_jobs([{
+            "input_bucket_path": input_bucket_path,
+            "output_bucket_path": output_bucket_path,
+            "callback_url": callback_url,
+            "priority": priority,
+            "tenant": tenant,
+            "deadline": deadline,
+            "idempotency_key": idempotency_key
+        }], duplicates=duplicates)
+        return execution_ids[0]
+
+    async def create_jobs(
+        self,
+        requests: List[Dict[str, Any]],
+        batch: Optional[Dict[str, Any]] = None,
+        duplicates: Optional[List[str]] = None
+    ) -> List[str]:
+        """
+        Create several processing jobs in one Redis round trip.
+        
+        A request with an idempotency_key already used by the same tenant within
+        idempotency_ttl is not enqueued again: the execution id of the job created
+        for it the first time is returned instead.
+        
+        Args:
+            requests: Dicts with input_bucket_path, output_bucket_path and optional callback_url,
+                priority, tenant, deadline and idempotency_key
+            batch: Batch record the jobs belong to, saved in the same transaction
+            duplicates: Filled with the returned execution ids that already existed
+            
+        Returns:
+            The execution ids, in the order of the requests (processing order within a lane)
+            
+        Raises:
+            QueueFullError: If the new jobs would take the queue past max_queued_jobs
+            IdempotencyConflictError: If an idempotency key was used for a different request
+        """
+        execution_ids = [str(uuid.uuid4()) for _ in requests]
+        keyed = [index for index, request in enumerate(requests) if request.get("idempotency_key")]
+        claims = [
+            (
+                self.idempotency.key(
+                    requests[index].get("tenant") or DEFAULT_TENANT,
+                    requests[index]["idempotency_key"]
+                ),
+                execution_ids[index],
+                requests[index]
+            )
+            for index in keyed
+        ]
+        existing = dict(zip(keyed, await self.idempotency.claim(claims)))
+        claimed = [key for (key, _, _), index in zip(claims, keyed) if existing[index] is None]
+        created = {execution_ids[index] for index in keyed if existing[index] is None}
+        for index, execution_id in existing.items():
+            if execution_id is not None:
+                execution_ids[index] = execution_id
+                # A key repeated within the request is not a duplicate of an earlier job
+                if duplicates is not None and execution_id not in created:
+                    duplicates.append(execution_id)
+        new = [index for index in range(len(requests)) if existing.get(index) is None]
+        
+        try:
+            await self.check_admission(len(new))
+            payloads = []
+            processing_jobs = []
+            for index in new:
+                request = requests[index]
+                execution_id = execution_ids[index]
+                
+                # Create job in queue
+                job_data = {
+                    "execution_id": execution_id,
+                    "input_bucket_path": request["input_bucket_path"],
+                    "output_bucket_path": request["output_bucket_path"],
+                    "callback_url": request.get("callback_url"),
+                    "created_at": datetime.now().isoformat(),
+                    "priority": request.get("priority") or DEFAULT_PRIORITY,
+                    "tenant": request.get("tenant") or DEFAULT_TENANT,
+                    "deadline": None,
+                    "idempotency_key": request.get("idempotency_key")
+                }
+                deadline = local_deadline(request.get("deadline"))
+                if deadline:
+                    job_data["deadline"] = deadline.isoformat()
+                if batch:
+                    job_data["batch_id"] = batch["batch_id"]
+                payloads.append(job_data)
+                
+                # Initialize job status
+                processing_jobs.append(ProcessingJob(
+                    execution_id=execution_id,
+                    input_bucket_path=job_data["input_bucket_path"],
+                    output_bucket_path=job_data["output_bucket_path"],
+                    callback_url=job_data["callback_url"],
+                    created_at=datetime.fromisoformat(job_data["created_at"]),
+                    status="queued",
+                    batch_id=job_data.get("batch_id"),
+                    priority=job_data["priority"],
+                    tenant=job_data["tenant"],
+                    deadline=deadline,
+                    idempotency_key=job_data["idempotency_key"]
+                ))
+            
+            if not processing_jobs:
+                return execution_ids
+            
+            # Save the statuses and add the jobs to their queue lanes in one transaction.
+            # Jobs of one lane without a deadline are served in the order of the requests.
+            async with self.redis.pipeline(transaction=True) as pipe:
+                for processing_job in processing_jobs:
+                    self.status_store.queue_save(pipe, processing_job.to_dict())
+                if batch:
+                    self.status_store.queue_save_batch(
+                        pipe,
+                        batch,
+                        [processing_job.execution_id for processing_job in processing_jobs]
+                    )
+                await self.queue.queue_push(pipe, payloads)
+                await pipe.execute()
+            
+            for processing_job in processing_jobs:
+                self.logger.info(f"Created job {processing_job.execution_id} for bucket path: {processing_job.input_bucket_path}")
+            
+            return execution_ids
+            
+        except Exception as e:
+            self.logger.error(f"Error creating job: {str(e)}")
+            # Let a retry with the same keys create the jobs
+            await self.idempotency.release(claimed)
+            raise
+
+    async def check_admission(self, count: int):
+        """
+        Refuse `count` new jobs if every live worker is deferring new jobs (low disk
+        space) or if the queue would grow past max_queued_jobs (0 disables the limit).
+        The check is not atomic with the enqueue: concurrent requests may overshoot the
+        limit by a few jobs, which only delays them.
+        """
+        workers = await self.registry.list_workers()
+        if count and workers and all(worker.get("deferred") for worker in workers):
+            retry_after = self.config.get('admission_retry_after', 60)
+            raise QueueFullError(
+                f"Every worker is deferring new jobs (low disk space). Retry in {retry_after}s",
+                retry_after
+            )
+        max_queued = self.config.get('max_queued_jobs', 0)
+        if not max_queued:
+            return
+        stats = await self.queue.stats()
+        queued = sum(stats["pending"].values())
+        if queued + count <= max_queued:
+            return
+        retry_after = await self.estimate_retry_after(queued + count - max_queued)
+        raise QueueFullError(
+            f"Queue full: {queued} jobs queued, limit is {max_queued}. Retry in {retry_after}s",
+            retry_after
+        )
+
+    async def estimate_retry_after(self, excess: int) -> int:
+        """
+        Seconds the fleet needs to dequeue `excess` jobs at its current throughput: live
+        workers divided by the mean robot time of finished jobs. Falls back to
+        admission_retry_after while there is no worker or no finished job yet.
+        """
+        fallback = self.config.get('admission_retry_after', 60)
+        workers = len(await self.registry.list_workers())
+        robot_seconds = await self.metrics.mean("logic_stage_duration_seconds", "robot")
+        if not workers or not robot_seconds:
+            return fallback
+        jobs_per_second = workers / robot_seconds
+        return min(max(math.ceil(excess / jobs_per_second), 1), 3600)
+
+    def find_song_folders(self, input_prefix: str) -> List[str]:
+        """List a bucket prefix once and return every folder below it that contains a mix file"""
+        mix_pattern = self.config.get('mix_pattern', '*_mix.wav')
+        folders = {
+            obj.path.rsplit('/', 1)[0]
+            for obj in self.storage.list(input_prefix)
+            if fnmatch.fnmatch(obj.name, mix_pattern)
+        }
+        return sorted(folders)
+
+    async def create_batch(
+        self,
+        input_prefix: str,
+        output_bucket_path: str,
+        callback_url: Optional[str] = None,
+        priority: str = DEFAULT_PRIORITY,
+        tenant: str = DEFAULT_TENANT,
+        deadline: Optional[datetime] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Create one job per song folder found below input_prefix, grouped under a batch id.
+        
+        Returns:
+            Dict with batch_id, execution_ids and folders, or None if no song folder was found
+        """
+        folders = await self.run_blocking(self.find_song_folders, input_prefix)
+        if not folders:
+            return None
+        
+        batch = {
+            "batch_id": str(uuid.uuid4()),
+            "input_prefix": input_prefix,
+            "output_bucket_path": output_bucket_path,
+            "callback_url": callback_url,
+            "created_at": datetime.now().isoformat()
+        }
+        execution_ids = await self.create_jobs(
+            [
+                {
+                    "input_bucket_path": folder,
+                    "output_bucket_path": output_bucket_path,
+                    "callback_url": callback_url,
+                    "priority": priority,
+                    "tenant": tenant,
+                    "deadline": deadline
+                }
+                for folder in folders
+            ],
+            batch=batch
+        )
+        self.logger.info(f"Created batch {batch['batch_id']} with {len(execution_ids)} jobs under {input_prefix}")
+        return {
+            "batch_id": batch["batch_id"],
+            "execution_ids": execution_ids,
+            "folders": folders
+        }
+
+    async def get_batch_status(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """Get the aggregated status of a batch by batch ID"""
+        return await self.status_store.get_batch(batch_id)
+
+    async def get_job_status(self, execution_id: str) -> Optional[Dict[str, Any]]:
+        """Get status of a job by execution ID, from any process"""
+        return await self.status_store.get(execution_id)
+
+    async def list_workers(self) -> List[Dict[str, Any]]:
+        """Live workers of the fleet (heartbeat within heartbeat_ttl) and the jobs they hold"""
+        return await self.registry.list_workers()
+
+    async def collect_metrics(self) -> str:
+        """
+        Fleet metrics in the Prometheus text format: the stored counters and histograms,
+        plus gauges read now from the queue and from the worker heartbeats.
+        """
+        stats = await self.queue.stats()
+        workers = await self.registry.list_workers()
+        deferred = sum(1 for worker in workers if worker.get("deferred"))
+        # Lag of the worker event loops at their last heartbeat (older workers do not report it)
+        loop_lag = {
+            (("worker_id", worker["worker_id"]),): worker["event_loop_lag"]
+            for worker in workers if "event_loop_lag" in worker
+        }
+        
+        jobs = {status: 0 for status in ("queued", "prefetched", "processing", "uploading")}
+        jobs["queued"] = sum(stats["pending"].values())
+        for worker in workers:
+            for job in worker.get("jobs", []):
+                # A finished job stays in the record until the worker has released it
+                if job["status"] not in FINISHED_STATUSES:
+                    jobs[job["status"]] = jobs.get(job["status"], 0) + 1
+        
+        return await self.metrics.render([
+            (
+                "logic_queue_length",
+                "Jobs waiting in the logic-processing queue, by priority",
+                {(("priority", priority),): count for priority, count in stats["pending"].items()}
+            ),
+            (
+                "logic_inflight_jobs",
+                "Jobs leased by a worker and not acknowledged yet",
+                {(): stats["inflight"]}
+            ),
+            (
+                "logic_dead_letter_jobs",
+                "Jobs given up after max_deliveries deliveries",
+                {(): stats["dead"]}
+            ),
+            (
+                "logic_jobs",
+                "Unfinished jobs by status (queued from the queue, the others from the worker heartbeats)",
+                {(("status", status),): count for status, count in jobs.items()}
+            ),
+            (
+                "logic_workers",
+                "Live workers (heartbeat within heartbeat_ttl)",
+                {(): len(workers)}
+            ),
+            (
+                "logic_deferred_workers",
+                "Live workers not taking new jobs because of low free disk space",
+                {(): deferred}
+            ),
+            (
+                "logic_worker_event_loop_lag_seconds",
+                "Event loop lag of each live worker at its last heartbeat",
+                {labels: lag["current_ms"] / 1000 for labels, lag in loop_lag.items()}
+            ),
+            (
+                "logic_worker_event_loop_lag_max_seconds",
+                "Maximum event loop lag of each live worker since it started",
+                {labels: lag["max_ms"] / 1000 for labels, lag in loop_lag.items()}
+            ),
+        ])
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+import json
+import time
+import socket
+import logging
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Iterable, Callable, Awaitable
+from redis.asyncio import Redis
+
+logger = logging.getLogger(__name__)
+
+# Priority lanes, highest first: a lane is only served while every higher one is empty
+PRIORITIES = ("high", "normal", "low")
+DEFAULT_PRIORITY = "normal"
+DEFAULT_TENANT = "default"
+
+# Add an entry to the lane of its priority and tenant. The entry score is its deadline
+# (earliest first) or, without one, NO_DEADLINE plus an enqueue sequence number (FIFO
+# after every job with a deadline). Entries without a score (pushed to the legacy list
+# by an older API) get the default priority and tenant and are re-encoded.
+# A tenant joining the tenants zset of a priority starts at the virtual clock of that
+# priority, so it gets no credit for the time it had nothing queued.
+# Lane keys are derived from the queue name, so these scripts need a single Redis node.
+ENQUEUE_LUA = """
+local NO_DEADLINE = 1e12
+local function enqueue(name, item)
+    local job = cjson.decode(item)
+    if job.score == nil then
+        job.priority = job.priority or 'normal'
+        job.tenant = job.tenant or 'default'
+        job.score = NO_DEADLINE + redis.call('INCR', name .. ':seq')
+        item = cjson.encode(job)
+    end
+    local tenants = name .. ':tenants:' .. job.priority
+    redis.call('ZADD', name .. ':lane:' .. job.priority .. ':' .. job.tenant, job.score, item)
+    if not redis.call('ZSCORE', tenants, job.tenant) then
+        local clock = tonumber(redis.call('GET', name .. ':clock:' .. job.priority) or 0)
+        local last = tonumber(redis.call('HGET', name .. ':passes:' .. job.priority, job.tenant) or 0)
+        redis.call('ZADD', tenants, math.max(clock, last), job.tenant)
+    end
+    redis.call('LPUSH', name .. ':signal', 1)
+    redis.call('LTRIM', name .. ':signal', 0, 99)
+    return item
+end
+"""
+
+PUSH_SCRIPT = ENQUEUE_LUA + """
+for i = 2, #ARGV do
+    enqueue(ARGV[1], ARGV[i])
+end
+return #ARGV - 1
+"""
+
+# Lease the next job: the first non-empty priority, within it the tenant with the lowest
+# virtual pass (weighted fair queueing: each job advances the pass of its tenant by
+# 1 / weight), within the tenant the entry with the lowest score (earliest deadline).
+# Entries left in the legacy list are moved into the lanes first, oldest first.
+GET_SCRIPT = ENQUEUE_LUA + """
+local name = ARGV[1]
+local legacy = redis.call('RPOP', KEYS[4])
+while legacy do
+    enqueue(name, legacy)
+    legacy = redis.call('RPOP', KEYS[4])
+end
+local weights = cjson.decode(ARGV[3])
+for i = 4, #ARGV do
+    local priority = ARGV[i]
+    local tenants = name .. ':tenants:' .. priority
+    while true do
+        local head = redis.call('ZRANGE', tenants, 0, 0, 'WITHSCORES')
+        if #head == 0 then
+            break
+        end
+        local tenant, pass = head[1], tonumber(head[2])
+        local lane = name .. ':lane:' .. priority .. ':' .. tenant
+        local popped = redis.call('ZPOPMIN', lane)
+        local weight = tonumber(weights[tenant])
+        if not weight or weight <= 0 then
+            weight = 1
+        end
+        if redis.call('ZCARD', lane) == 0 then
+            redis.call('ZREM', tenants, tenant)
+            redis.call('HSET', name .. ':passes:' .. priority, tenant, pass + 1 / weight)
+        else
+            redis.call('ZADD', tenants, pass + 1 / weight, tenant)
+        end
+        if #popped > 0 then
+            redis.call('SET', name .. ':clock:' .. priority, pass)
+            redis.call('LPUSH', KEYS[1], popped[1])
+            redis.call('ZADD', KEYS[2], ARGV[2], popped[1])
+            redis.call('SADD', KEYS[3], KEYS[1])
+            return popped[1]
+        end
+    end
+end
+return false
+"""
+
+REQUEUE_SCRIPT = ENQUEUE_LUA + """
+redis.call('LREM', KEYS[1], 1, ARGV[2])
+redis.call('ZREM', KEYS[2], ARGV[2])
+enqueue(ARGV[1], ARGV[2])
+return 1
+"""
+
+# Requeue the in-flight entries of one consumer whose lease expired.
+# Entries without a lease (the consumer died between the dequeue and ZADD) get a fresh one
+# instead of being requeued right away. With ARGV[4] set to 1 the consumer is known to
+# be dead and every entry is requeued regardless of its lease. Entries delivered more
+# than max_deliveries times are moved to the dead letter list.
+# Returns the number of requeued entries followed by the dead-lettered entries.
+REAP_SCRIPT = ENQUEUE_LUA + """
+local items = redis.call('LRANGE', KEYS[1], 0, -1)
+local dead = ARGV[4] == '1'
+local result = {0}
+for _, item in ipairs(items) do
+    local deadline = redis.call('ZSCORE', KEYS[2], item)
+    if not deadline and not dead then
+        redis.call('ZADD', KEYS[2], ARGV[2], item)
+    elseif dead or tonumber(deadline) <= tonumber(ARGV[1]) then
+        redis.call('LREM', KEYS[1], 1, item)
+        redis.call('ZREM', KEYS[2], item)
+        local deliveries = redis.call('HINCRBY', KEYS[3], item, 1)
+        if deliveries > tonumber(ARGV[3]) then
+            redis.call('HDEL', KEYS[3], item)
+            redis.call('LPUSH', KEYS[4], item)
+            result[#result + 1] = item
+        else
+            enqueue(ARGV[5], item)
+            result[1] = result[1] + 1
+        end
+    end
+end
+return result
+"""
+
+# Pending entries of each priority (in ARGV order), summed over the lanes of its tenants
+DEPTH_SCRIPT = """
+local depths = {}
+for i = 2, #ARGV do
+    local total = 0
+    for _, tenant in ipairs(redis.call('ZRANGE', ARGV[1] .. ':tenants:' .. ARGV[i], 0, -1)) do
+        total = total + redis.call('ZCARD', ARGV[1] .. ':lane:' .. ARGV[i] .. ':' .. tenant)
+    end
+    depths[#depths + 1] = total
+end
+return depths
+"""
+
+def schedule_order(job: Dict[str, Any]) -> tuple:
+    """Sort key of dequeued jobs: priority first, then deadline (enqueue order without one)"""
+    return (PRIORITIES.index(job.get("priority", DEFAULT_PRIORITY)), job.get("score", 0))
+
+class ReliableQueue:
+    """
+    At-least-once consumption of a queue with priority lanes, per-tenant fairness and
+    deadlines.
+
+    Pending jobs sit in one zset per priority and tenant, ordered by deadline. A dequeue
+    picks the highest priority with pending jobs, in it the tenant furthest behind its
+    weighted share, and that tenant's earliest deadline. The job is moved atomically into
+    a per-consumer in-flight list and leased for `visibility_timeout` seconds. A job
+    leaves the in-flight list only when it is acknowledged. If the consumer dies, `reap`
+    puts its jobs back in their lane (same position) once their lease has expired, or
+    right away when the worker registry reports the consumer as dead.
+
+    Keys (for the default queue name):
+        logic-processing                            legacy list, moved into the lanes on dequeue
+        logic-processing:lane:<priority>:<tenant>   pending jobs of a tenant, by deadline
+        logic-processing:tenants:<priority>         tenants with pending jobs, by virtual pass
+        logic-processing:passes:<priority>          virtual pass of tenants with nothing pending
+        logic-processing:clock:<priority>           virtual time of the priority
+        logic-processing:seq                        enqueue sequence of jobs without deadline
+        logic-processing:signal                     wake-up tokens for waiting consumers
+        logic-processing:inflight:<worker>          jobs held by one consumer
+        logic-processing:consumers                  set of in-flight list keys
+        logic-processing:leases                     zset of in-flight jobs by lease deadline
+        logic-processing:deliveries                 hash counting redeliveries per job
+        logic-processing:dead                       jobs that exceeded max_deliveries
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        name: str = "logic-processing",
+        worker_id: Optional[str] = None,
+        visibility_timeout: float = 600.0,
+        max_deliveries: int = 3,
+        tenant_weights: Optional[Dict[str, float]] = None
+    ):
+        self.redis = redis
+        self.name = name
+        self.worker_id = worker_id or socket.gethostname()
+        self.visibility_timeout = visibility_timeout
+        self.max_deliveries = max_deliveries
+        self.tenant_weights = tenant_weights or {}  # Share of each tenant within a priority (default 1)
+        self.inflight_key = self.inflight_key_of(self.worker_id)
+        self.consumers_key = f"{name}:consumers"
+        self.leases_key = f"{name}:leases"
+        self.deliveries_key = f"{name}:deliveries"
+        self.dead_key = f"{name}:dead"
+        self.signal_key = f"{name}:signal"
+        self.push_script = redis.register_script(PUSH_SCRIPT)
+        self.get_script = redis.register_script(GET_SCRIPT)
+        self.requeue_script = redis.register_script(REQUEUE_SCRIPT)
+        self.reap_script = redis.register_script(REAP_SCRIPT)
+        self.depth_script = redis.register_script(DEPTH_SCRIPT)
+
+    def inflight_key_of(self, worker_id: str) -> str:
+        return f"{self.name}:inflight:{worker_id}"
+
+    def _deadline(self) -> float:
+        return time.time() + self.visibility_timeout
+
+    @staticmethod
+    def encode(job: Dict[str, Any]) -> str:
+        """
+        Queue entry of a job. The deadline (ISO datetime) becomes the entry score;
+        jobs without one are numbered in enqueue order by the push script.
+        """
+        entry = dict(job)
+        entry["priority"] = entry.get("priority") or DEFAULT_PRIORITY
+        entry["tenant"] = entry.get("tenant") or DEFAULT_TENANT
+        if entry["priority"] not in PRIORITIES:
+            raise ValueError(f"Unknown priority {entry['priority']}, expected one of: {', '.join(PRIORITIES)}")
+        if entry.get("deadline"):
+            entry["score"] = datetime.fromisoformat(entry["deadline"]).timestamp()
+        return json.dumps(entry)
+
+    async def queue_push(self, pipe, jobs: List[Dict[str, Any]]):
+        """Add the commands enqueueing jobs to an existing pipeline"""
+        await self.push_script(args=[self.name] + [self.encode(job) for job in jobs], client=pipe)
+
+    async def push(self, jobs: List[Dict[str, Any]]):
+        """Enqueue jobs in one round trip"""
+        async with self.redis.pipeline(transaction=True) as pipe:
+            await self.queue_push(pipe, jobs)
+            await pipe.execute()
+
+    async def get(self, timeout: float = 1) -> Optional[str]:
+        """
+        Wait up to `timeout` seconds for a job and lease it to this consumer.
+
+        Returns:
+            The raw queue entry, or None if the queue stayed empty
+        """
+        give_up = time.monotonic() + timeout
+        weights = json.dumps(self.tenant_weights)
+        while True:
+            item = await self.get_script(
+                keys=[self.inflight_key, self.leases_key, self.consumers_key, self.name],
+                args=[self.name, self._deadline(), weights, *PRIORITIES]
+            )
+            if item:
+                return item
+            remaining = give_up - time.monotonic()
+            if remaining <= 0:
+                return None
+            # Woken up by the next push, at the latest when the timeout expires
+            await self.redis.blpop(self.signal_key, timeout=max(remaining, 0.01))
+
+    async def ack(self, item: str):
+        """Remove a finished job from the in-flight list"""
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.lrem(self.inflight_key, 1, item)
+            pipe.zrem(self.leases_key, item)
+            pipe.hdel(self.deliveries_key, item)
+            await pipe.execute()
+
+    async def requeue(self, item: str):
+        """Give a job back to its lane, at its original position, without counting a failed delivery"""
+        await self.requeue_script(
+            keys=[self.inflight_key, self.leases_key],
+            args=[self.name, item]
+        )
+
+    async def extend_lease(self, *items: str):
+        """Push the lease deadline of in-flight jobs `visibility_timeout` seconds ahead"""
+        if items:
+            deadline = self._deadline()
+            await self.redis.zadd(self.leases_key, {item: deadline for item in items}, xx=True)
+
+    async def stats(self) -> Dict[str, Any]:
+        """
+        Size of the queue: pending jobs per priority (legacy list entries count as
+        the default priority), leased jobs of every consumer and dead letters.
+        """
+        depths = await self.depth_script(args=[self.name, *PRIORITIES])
+        pending = dict(zip(PRIORITIES, depths))
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.llen(self.name)
+            pipe.zcard(self.leases_key)
+            pipe.llen(self.dead_key)
+            legacy, inflight, dead = await pipe.execute()
+        pending[DEFAULT_PRIORITY] += legacy
+        return {"pending": pending, "inflight": inflight, "dead": dead}
+
+    async def _reap_consumer(
+        self,
+        inflight_key: str,
+        dead: bool,
+        on_dead_letter: Optional[Callable[[str], Awaitable[None]]]
+    ) -> int:
+        """Run the reap script on one in-flight list and report its dead letters"""
+        count, *dead_letters = await self.reap_script(
+            keys=[inflight_key, self.leases_key, self.deliveries_key, self.dead_key],
+            args=[time.time(), self._deadline(), self.max_deliveries, 1 if dead else 0, self.name]
+        )
+        for item in dead_letters:
+            logger.error(f"Job delivered more than {self.max_deliveries} times, moved to {self.dead_key}")
+            if on_dead_letter:
+                await on_dead_letter(item)
+        return count
+
+    async def recover(self, on_dead_letter: Optional[Callable[[str], Awaitable[None]]] = None) -> int:
+        """
+        Requeue the jobs left in this consumer's in-flight list by a previous run
+        (same worker_id). Call once at startup, before consuming.
+        Each counts as a failed delivery, so a job that keeps crashing the worker
+        ends in the dead letter list instead of looping forever.
+
+        Args:
+            on_dead_letter: Awaited with each job moved to the dead letter list
+
+        Returns:
+            Number of jobs put back in the queue
+        """
+        count = await self._reap_consumer(self.inflight_key, True, on_dead_letter)
+        if count:
+            logger.warning(f"Recovered {count} unacknowledged job(s) from {self.inflight_key}")
+        return count
+
+    async def reap(
+        self,
+        dead_workers: Iterable[str] = (),
+        on_dead_letter: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> int:
+        """
+        Requeue in-flight jobs of every consumer whose lease has expired.
+
+        Args:
+            dead_workers: Ids of consumers known to be dead (no heartbeat): all their
+                jobs are requeued right away, without waiting for the leases to expire
+            on_dead_letter: Awaited with each job moved to the dead letter list
+
+        Returns:
+            Number of jobs put back in the queue
+        """
+        dead_keys = {self.inflight_key_of(worker_id) for worker_id in dead_workers}
+        requeued = 0
+        for inflight_key in await self.redis.smembers(self.consumers_key):
+            dead = inflight_key in dead_keys
+            count = await self._reap_consumer(inflight_key, dead, on_dead_letter)
+            if dead:
+                await self.redis.srem(self.consumers_key, inflight_key)
+                if count:
+                    logger.warning(f"Reassigned {count} job(s) of dead worker {inflight_key}")
+            requeued += count
+        if requeued:
+            logger.warning(f"Requeued {requeued} job(s) with an expired lease or a dead worker")
+        return requeued
@@ -1,22 +1,25 @@
 #!/usr/bin/env python3
 import os
 import json
-import uuid
 import asyncio
 import logging
 import shutil
+import socket
+import fnmatch
+import functools
 from datetime import datetime
 from typing import Dict, Any, List, Optional
-from dataclasses import dataclass
-from redis.asyncio import Redis, ConnectionPool
 from redis.exceptions import RedisError
 import aiohttp
-from utils.download import download_gcp_folder
-from utils.upload import upload_stems_to_gcp
-# Import the robot
+from utils.download import download_gcp_folder, WorkDirectory
+from utils.upload import upload_stems_to_gcp, upload_stem_file
+from utils.resources import folder_size, peak_rss_bytes, free_disk_bytes
+from worker.job_client import JobClient, ProcessingJob, local_deadline
+from worker.job_queue import ReliableQueue, schedule_order, DEFAULT_PRIORITY, DEFAULT_TENANT
+from worker.status_store import FINISHED_STATUSES
+from worker.result_cache import ResultCache, file_content_hash, object_content_hash
 import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-from robot.logic import LogicRobot
 
 # Load configuration
 with open('config.json', 'r') as f:
@@ -32,55 +35,112 @@ logging.basicConfig(
     ]
 )
 
-@dataclass
-class ProcessingJob:
-    execution_id: str
-    input_bucket_path: str
-    output_bucket_path: str
-    callback_url: Optional[str]
-    created_at: datetime
-    status: str = "pending"
-    folder_name: str = ""
-    errors: List[Dict[str, Any]] = None
-    results: List[Dict[str, Any]] = None
-    processed_stems_path: Optional[str] = None
-    temp_dir: Optional[Any] = None  # TemporaryDirectory instance
-
-    def __post_init__(self):
-        if self.errors is None:
-            self.errors = []
-        if self.results is None:
-            self.results = []
-
-class LogicWorker:
+class LogicWorker(JobClient):
     def __init__(self):
+        super().__init__(config)
         self.logger = logging.getLogger(__name__)
-        self.redis = None
-        self.pool = None
-        self.robot = LogicRobot()
-        self.jobs_status = {}  # In-memory job status tracking
+        self._robot = None
+        # Identity in the fleet: queue consumer id and registry key (one worker per Mac)
+        self.worker_id = os.environ.get('LOGIC_WORKER_ID') or config.get('worker_id') or socket.gethostname()
+        self.started_at = datetime.now().isoformat()
+        self.jobs_processed = 0
+        self.robot_restarts = 0  # Robot restarts already added to the fleet metrics
+        self.deferred = False  # Not dequeuing because the temp or export volume is almost full
+        self.queue = None  # Reliable consumer of the logic-processing lanes
+        self.reaper_task = None
+        self.heartbeat_task = None
+        self.result_cache = None  # Stems already produced for a mix, reused instead of running the robot
+        self.jobs_status = {}  # Jobs currently held by this worker process
+        # Background post-robot stages (upload, callback, cleanup)
+        self.finalize_tasks = set()
+        self.finalize_slots = asyncio.Semaphore(config.get('max_pending_finalizations', 2))
         
+    @property
+    def robot(self):
+        """The LogicRobot, created on first use: pyautogui needs a display"""
+        if self._robot is None:
+            if config.get('robot', 'logic') == 'simulated':
+                from robot.simulated import SimulatedRobot
+                self._robot = SimulatedRobot(config)
+            else:
+                from robot.logic import LogicRobot
+                self._robot = LogicRobot(config)
+        return self._robot
+
+    @robot.setter
+    def robot(self, robot):
+        self._robot = robot
+
     async def initialize(self):
-        """Initialize Redis connection pool"""
+        """Initialize Redis connection pool, job queue and result cache"""
         try:
-            self.pool = ConnectionPool.from_url(
-                config['redis_url'],
-                max_connections=10,
-                decode_responses=True
+            await super().initialize()
+            # A job may wait for `depth` robot runs before its next stage transition renews the lease
+            depth = max(config.get('prefetch_depth', 1), config.get('batch_size', 1))
+            self.queue = ReliableQueue(
+                self.redis,
+                worker_id=self.worker_id,
+                visibility_timeout=config.get(
+                    'visibility_timeout',
+                    config['processing_timeout'] / 1000 * (depth + 1)
+                ),
+                max_deliveries=config.get('max_deliveries', 3),
+                tenant_weights=config.get('tenant_weights')
             )
-            self.redis = Redis(connection_pool=self.pool)
+            if config.get('result_cache', True):
+                self.result_cache = ResultCache(
+                    self.redis,
+                    self.storage,
+                    self.robot.get_logic_version,
+                    max_age=config.get('result_cache_max_age', 30 * 86400),
+                    max_entries=config.get('result_cache_max_entries', 10000)
+                )
             self.logger.info("Worker initialized successfully")
         except Exception as e:
             self.logger.error(f"Failed to initialize worker: {str(e)}")
             raise
 
+    @staticmethod
+    def _reset_folder(folder: str) -> bool:
+        """Remove and recreate a folder, returning False if it did not exist"""
+        if not os.path.exists(folder):
+            return False
+        shutil.rmtree(folder)
+        os.makedirs(folder)
+        return True
+
+    @staticmethod
+    def _move_wav_files(src_folder: str, dst_folder: str, names: Optional[List[str]] = None) -> List[str]:
+        """Move every .wav file (or only `names`) from src_folder into dst_folder"""
+        os.makedirs(dst_folder, exist_ok=True)
+        moved = []
+        for file in os.listdir(src_folder):
+            if file.endswith('.wav') and (names is None or file in names):
+                shutil.move(os.path.join(src_folder, file), os.path.join(dst_folder, file))
+                moved.append(file)
+        return moved
+
+    @staticmethod
+    def _link_or_copy(src: str, dst_folder: str) -> str:
+        """Hard link src into dst_folder (copy when on another volume) and return the new path"""
+        os.makedirs(dst_folder, exist_ok=True)
+        dst = os.path.join(dst_folder, os.path.basename(src))
+        partial = f"{dst}.part"
+        if os.path.exists(partial):
+            os.remove(partial)
+        try:
+            os.link(src, partial)
+        except OSError:
+            shutil.copy2(src, partial)
+        # Atomic, so a stem already moved to dst by stage_stems is never lost
+        os.replace(partial, dst)
+        return dst
+
     async def cleanup_logic_folder(self):
         """Clean up Logic folder in case of errors"""
         try:
             cleanup_folder = config['cleanup_folder']
-            if os.path.exists(cleanup_folder):
-                shutil.rmtree(cleanup_folder)
-                os.makedirs(cleanup_folder)
+            if await self.run_blocking(self._reset_folder, cleanup_folder):
                 self.logger.info(f"Cleaned up folder: {cleanup_folder}")
         except Exception as e:
             self.logger.error(f"Error cleaning up folder: {str(e)}")
@@ -97,7 +157,8 @@ class LogicWorker:
                 }
             
             # Check if this folder directly contains a _mix.wav file
-            mix_files = [f for f in os.listdir(folder_path) if f.endswith('_mix.wav')]
+            mix_pattern = config.get('mix_pattern', '*_mix.wav')
+            mix_files = [f for f in os.listdir(folder_path) if fnmatch.fnmatch(f, mix_pattern)]
             
             if mix_files:
                 # This is the folder we want to process
@@ -142,284 +203,1090 @@ class LogicWorker:
                 async with session.post(callback_url, json=data) as response:
                     if response.status == 200:
                         self.logger.info(f"Callback sent successfully to {callback_url}")
-                    else:
-                        self.logger.error(f"Callback failed with status {response.status}")
+                        await self.count_metric("logic_callbacks_total", result="success")
+                        return
+                    self.logger.error(f"Callback failed with status {response.status}")
         except Exception as e:
             self.logger.error(f"Error sending callback: {str(e)}")
+        await self.count_metric("logic_callbacks_total", result="failure")
 
-    async def process_job(self, job_data: Dict[str, Any]):
-        """Process a single job from the queue"""
-        temp_dir = None
+    async def count_metric(self, name: str, amount: float = 1, **labels: str):
+        """Increment a fleet-wide counter; a Redis error is logged, never raised into the job"""
+        try:
+            await self.metrics.incr(name, amount, **labels)
+        except RedisError as e:
+            self.logger.warning(f"Failed to update metric {name}: {str(e)}")
+
+    async def count_robot_restarts(self):
+        """Add the Logic Pro launches of the robot since the last call to the fleet metrics"""
+        restarts = getattr(self.robot, "restarts", 0)
+        await self.count_metric("logic_robot_restarts_total", restarts - self.robot_restarts)
+        self.robot_restarts = restarts
+
+    async def add_transfer(self, processing_job: ProcessingJob, key: str, amount: int):
+        """Add bytes moved for a job to its resources and to the fleet counter of the same name"""
+        processing_job.resources[key] += amount
+        await self.count_metric(f"logic_{key}_total", amount)
+
+    async def sample_resources(self, processing_job: ProcessingJob):
+        """Update the disk and memory high-water marks of a job"""
+        resources = processing_job.resources
+        if processing_job.temp_dir:
+            size = await self.run_blocking(folder_size, processing_job.temp_dir.name)
+            resources["peak_temp_bytes"] = max(resources["peak_temp_bytes"], size)
+        resources["peak_rss_bytes"] = peak_rss_bytes()
+
+    async def record_job_metrics(self, processing_job: ProcessingJob):
+        """Count a finished job and add its stage timings and resource peaks to the fleet histograms"""
+        if processing_job.status not in FINISHED_STATUSES:
+            return
+        try:
+            await self.metrics.observe_job(
+                processing_job.status,
+                processing_job.timer.to_dict(),
+                processing_job.resources
+            )
+        except RedisError as e:
+            self.logger.warning(f"Failed to record metrics of job {processing_job.execution_id}: {str(e)}")
+
+    async def set_job_status(self, processing_job: ProcessingJob, status: str):
+        """Update the status of a job, persist it for the API and renew its queue lease"""
+        processing_job.status = status
+        try:
+            await self.status_store.save(processing_job.to_dict())
+            if processing_job.queue_item:
+                await self.queue.extend_lease(processing_job.queue_item)
+        except RedisError as e:
+            self.logger.warning(f"Failed to save status of job {processing_job.execution_id}: {str(e)}")
+        # Keep the fleet listing in step with the stage of the job
+        await self.send_heartbeat()
+
+    async def ack_job(self, queue_item: Optional[str]):
+        """Acknowledge a finished job so it is never redelivered"""
+        if queue_item is None:
+            return
+        try:
+            await self.queue.ack(queue_item)
+            self.jobs_processed += 1
+        except RedisError as e:
+            self.logger.warning(f"Failed to acknowledge job: {str(e)}")
+
+    def worker_record(self) -> Dict[str, Any]:
+        """Registry record of this worker: identity, capabilities and the jobs it holds"""
+        jobs = [
+            {
+                "execution_id": job.execution_id,
+                "status": job.status,
+                "folder_name": job.folder_name
+            }
+            for job in self.jobs_status.values()
+        ]
+        return {
+            "worker_id": self.worker_id,
+            "hostname": socket.gethostname(),
+            "pid": os.getpid(),
+            "started_at": self.started_at,
+            "last_heartbeat": datetime.now().isoformat(),
+            "capabilities": {
+                "robot": config.get('robot', 'logic'),
+                "logic_version": self.robot.get_logic_version(),
+                "platform": sys.platform,
+                "batch_size": config.get('batch_size', 1),
+                "prefetch_depth": config.get('prefetch_depth', 1),
+                "session_mode": config.get('session_mode', False),
+                "expected_stems": config.get('expected_stems', [])
+            },
+            # The job in the robot, the others are prefetched or finishing their upload
+            "current_job": next((job for job in jobs if job["status"] == "processing"), None),
+            "jobs": jobs,
+            "jobs_processed": self.jobs_processed,
+            "deferred": self.deferred,
+            "event_loop_lag": self.get_loop_lag()
+        }
+
+    @staticmethod
+    def low_disk_volumes() -> List[str]:
+        """Temp and export folders whose volume has less than min_free_disk_mb free"""
+        min_free = config.get('min_free_disk_mb', 0) * 1024 * 1024
+        if not min_free:
+            return []
+        return [
+            folder
+            for folder in (config.get('temp_base_folder', './temp'), config['cleanup_folder'])
+            if free_disk_bytes(folder) < min_free
+        ]
+
+    async def wait_for_disk_headroom(self):
+        """
+        Hold off dequeuing while the temp or export volume is low on space. Jobs already
+        taken go on and free their files, other workers keep serving the queue.
+        """
+        interval = config.get('disk_check_interval', 5)
+        while True:
+            low = await self.run_blocking(self.low_disk_volumes)
+            if not low:
+                if self.deferred:
+                    self.logger.info("Free disk space back above min_free_disk_mb, taking jobs again")
+                    self.deferred = False
+                    await self.send_heartbeat()
+                return
+            if not self.deferred:
+                self.logger.warning(
+                    f"Less than {config.get('min_free_disk_mb')} MB free on {', '.join(low)}, deferring new jobs"
+                )
+                self.deferred = True
+                await self.send_heartbeat()
+            await asyncio.sleep(interval)
+
+    async def send_heartbeat(self):
+        """Refresh the registry record of this worker and the leases of every job it holds"""
+        if self.registry is None:
+            return
+        try:
+            await self.registry.heartbeat(self.worker_record())
+            await self.queue.extend_lease(
+                *[job.queue_item for job in self.jobs_status.values() if job.queue_item]
+            )
+        except RedisError as e:
+            self.logger.warning(f"Failed to send heartbeat: {str(e)}")
+
+    async def heartbeat_loop(self):
+        """Heartbeat every heartbeat_interval seconds while the worker runs"""
+        interval = config.get('heartbeat_interval', 10)
+        while True:
+            await asyncio.sleep(interval)
+            await self.send_heartbeat()
+
+    async def save_checkpoint(self, processing_job: ProcessingJob, stage: str, data: Dict[str, Any]):
+        """Durably record a finished stage so a redelivered job can skip it"""
+        processing_job.checkpoints[stage] = data
+        try:
+            await self.status_store.save_checkpoint(processing_job.execution_id, stage, data)
+        except RedisError as e:
+            self.logger.warning(f"Failed to checkpoint stage {stage} of job {processing_job.execution_id}: {str(e)}")
+
+    @staticmethod
+    def job_work_dir(execution_id: str) -> str:
+        """Folder holding the files of a job, at a fixed path so a restarted worker finds them"""
+        return os.path.abspath(os.path.join(config.get('temp_base_folder', './temp'), 'jobs', execution_id))
+
+    async def restore_download(self, processing_job: ProcessingJob) -> bool:
+        """Reuse the input downloaded by a previous delivery of the job if it is still on disk"""
+        checkpoint = processing_job.checkpoints.get("downloaded")
+        if not checkpoint or not os.path.isdir(checkpoint["temp_path"]):
+            return False
+        
+        processing_job.temp_dir = WorkDirectory(checkpoint["work_dir"])
+        processing_job.temp_path = checkpoint["temp_path"]
+        processing_job.folder_info = checkpoint["folder_info"]
+        processing_job.folder_name = checkpoint["folder_info"]["name"]
+        processing_job.content_hash = checkpoint.get("content_hash")
+        if "staged" not in processing_job.checkpoints:
+            # Drop stems streamed during the interrupted robot run
+            await self.run_blocking(
+                shutil.rmtree,
+                os.path.join(processing_job.temp_path, 'stems'),
+                ignore_errors=True
+            )
+        self.logger.info(f"Resuming job {processing_job.execution_id} from checkpoint, input already downloaded")
+        return True
+
+    def restore_staged_stems(self, processing_job: ProcessingJob) -> Optional[Dict[str, Any]]:
+        """
+        Reuse the stems exported by a previous delivery of the job if they are still on disk.
+        
+        Returns:
+            The robot result of that run, or None if the robot has to run again
+        """
+        checkpoint = processing_job.checkpoints.get("staged")
+        if not checkpoint or not os.path.isdir(checkpoint["stems_path"]):
+            return None
+        
+        processing_job.stems_path = checkpoint["stems_path"]
+        processing_job.results = checkpoint["results"]
+        processing_job.errors = checkpoint["errors"]
+        self.logger.info(f"Resuming job {processing_job.execution_id} from checkpoint, stems already exported")
+        return processing_job.results[-1]
+
+    def restore_upload(self, processing_job: ProcessingJob) -> Optional[Dict[str, Any]]:
+        """
+        Reuse the stems uploaded by a previous delivery of the job: only the callback is
+        left, so no local file is needed and a leftover work folder is just removed.
+        
+        Returns:
+            The result of that delivery, or None if its stems were not uploaded
+        """
+        checkpoint = processing_job.checkpoints.get("uploaded")
+        if not checkpoint:
+            return None
+        
+        work_dir = self.job_work_dir(processing_job.execution_id)
+        if os.path.isdir(work_dir):
+            processing_job.temp_dir = WorkDirectory(work_dir)
+        processing_job.folder_name = checkpoint["folder_name"]
+        processing_job.results = checkpoint["results"]
+        processing_job.errors = checkpoint["errors"]
+        self.logger.info(f"Resuming job {processing_job.execution_id} from checkpoint, stems already uploaded")
+        return processing_job.results[-1]
+
+    async def save_upload_checkpoint(self, processing_job: ProcessingJob, upload_result: Dict[str, Any]):
+        """Checkpoint the uploaded stems with everything a redelivery needs to report the job"""
+        await self.save_checkpoint(processing_job, "uploaded", {
+            "upload": upload_result,
+            "folder_name": processing_job.folder_name,
+            "results": processing_job.results,
+            "errors": processing_job.errors
+        })
+
+    def find_mix_hash(self, input_bucket_path: str) -> Optional[str]:
+        """Content hash of the mix of an input folder read from the object metadata, if the backend has one"""
+        try:
+            mix_pattern = config.get('mix_pattern', '*_mix.wav')
+            mixes = [
+                obj for obj in self.storage.list(input_bucket_path)
+                if fnmatch.fnmatch(obj.name, mix_pattern)
+            ]
+            return object_content_hash(mixes[0]) if len(mixes) == 1 else None
+        except Exception as e:
+            self.logger.warning(f"Could not read the mix hash of {input_bucket_path}: {str(e)}")
+            return None
+
+    async def complete_from_cache(self, processing_job: ProcessingJob) -> bool:
+        """
+        Finish a job from the result cache: copy the stems produced for the same mix
+        into the job's output folder server-side and report it without running the robot.
+        
+        Returns:
+            True if the job was completed from the cache
+        """
+        if self.result_cache is None or not processing_job.content_hash:
+            return False
+        
+        try:
+            entry = await self.result_cache.lookup(processing_job.content_hash)
+        except RedisError as e:
+            self.logger.warning(f"Result cache lookup failed: {str(e)}")
+            return False
+        if entry is None:
+            return False
+        
+        try:
+            copy_result = await self.run_blocking(
+                self.result_cache.copy_stems,
+                entry,
+                f"{processing_job.output_bucket_path.strip('/')}/{processing_job.folder_name}"
+            )
+        except Exception as e:
+            self.logger.warning(f"Dropping unusable result cache entry: {str(e)}")
+            await self.result_cache.invalidate(processing_job.content_hash)
+            return False
+        
+        self.logger.info(f"Result cache hit for job {processing_job.execution_id}, skipping the robot")
+        result = {"status": "success", "folder": processing_job.folder_name, "cached": True}
+        processing_job.results.append(result)
+        await self.save_upload_checkpoint(processing_job, copy_result)
+        await self.finalize_job(processing_job, result)
+        return True
+
+    async def cache_result(self, processing_job: ProcessingJob):
+        """
+        Record the uploaded stems of a successful job in the result cache. Only a
+        complete stem set is cached: a hit would be served for every later submission.
+        """
+        uploaded = processing_job.checkpoints.get("uploaded")
+        if self.result_cache is None or not processing_job.content_hash or not uploaded:
+            return
+        
+        uploaded = uploaded["upload"]
+        names = [name.lower() for name in uploaded["uploaded_files"]]
+        missing = [
+            stem for stem in config.get('expected_stems', [])
+            if not any(stem.lower() in name for name in names)
+        ]
+        if processing_job.results[-1].get("export_complete") is not True or missing:
+            self.logger.warning(
+                f"Not caching the stems of job {processing_job.execution_id}: "
+                f"incomplete export (missing {', '.join(missing) or 'unknown'})"
+            )
+            return
         try:
-            execution_id = job_data['execution_id']
-            input_bucket_path = job_data['input_bucket_path']
-            output_bucket_path = job_data['output_bucket_path']
-            callback_url = job_data.get('callback_url')
+            stems_path = uploaded["gcp_path"][len("gs://"):]
+            objects = await self.run_blocking(self.storage.list, stems_path)
+            files = {
+                obj.name: obj.generation
+                for obj in objects if obj.name in uploaded["uploaded_files"]
+            }
+            if len(files) == len(uploaded["uploaded_files"]):
+                await self.result_cache.store(processing_job.content_hash, stems_path, files)
+        except Exception as e:
+            self.logger.warning(f"Could not add job {processing_job.execution_id} to the result cache: {str(e)}")
+
+    async def reap_stale_jobs(self):
+        """Periodically requeue jobs whose worker died without acknowledging them"""
+        interval = config.get('reaper_interval', 30)
+        while True:
+            try:
+                # Workers without a heartbeat lose their jobs at once, the others when a lease expires
+                dead_workers = [
+                    worker_id for worker_id in await self.registry.dead_workers()
+                    if worker_id != self.worker_id
+                ]
+                await self.queue.reap(dead_workers, on_dead_letter=self.give_up_job)
+                await self.registry.forget(dead_workers)
+            except Exception as e:
+                self.logger.error(f"Error reaping stale jobs: {str(e)}")
+            await asyncio.sleep(interval)
+
+    async def give_up_job(self, queue_item: str):
+        """Mark a job moved to the dead letter list as failed and notify its callback"""
+        job_data = json.loads(queue_item)
+        execution_id = job_data['execution_id']
+        error = f"Gave up after {self.queue.max_deliveries + 1} failed deliveries"
+        self.logger.error(f"Job {execution_id}: {error}")
+        try:
+            status = await self.status_store.get(execution_id) or {
+                "execution_id": execution_id,
+                "input_bucket_path": job_data.get('input_bucket_path'),
+                "output_bucket_path": job_data.get('output_bucket_path'),
+                "callback_url": job_data.get('callback_url')
+            }
+            status["status"] = "error"
+            status["errors"] = status.get("errors", []) + [{
+                "error": error,
+                "timestamp": datetime.now().isoformat()
+            }]
+            await self.status_store.save(status)
+        except RedisError as e:
+            self.logger.warning(f"Failed to save status of job {execution_id}: {str(e)}")
+            status = dict(job_data)
+        
+        callback_url = status.get("callback_url") or job_data.get('callback_url')
+        if callback_url:
+            await self.send_callback(callback_url, {
+                "execution_id": execution_id,
+                "status": "error",
+                "error": error,
+                "timings": status.get("timings", {}),
+                "resources": status.get("resources", {})
+            })
+
+    async def fail_job(
+        self,
+        processing_job: ProcessingJob,
+        error: str,
+        callback_error: Optional[str] = None,
+        status: str = "error"
+    ):
+        """Mark a job as failed and notify its callback"""
+        processing_job.errors.append({
+            "error": error,
+            "timestamp": datetime.now().isoformat()
+        })
+        await self.sample_resources(processing_job)
+        await self.set_job_status(processing_job, status)
+        
+        if processing_job.callback_url:
+            await self.send_callback(processing_job.callback_url, {
+                "execution_id": processing_job.execution_id,
+                "status": status,
+                "error": callback_error or error,
+                "timings": processing_job.timer.to_dict(),
+                "resources": processing_job.resources
+            })
+
+    async def expire_job(self, processing_job: ProcessingJob):
+        """Drop a job whose deadline passed before the robot could take it"""
+        self.logger.warning(f"Deadline of job {processing_job.execution_id} passed, dropping it")
+        await self.fail_job(
+            processing_job,
+            f"Deadline {processing_job.deadline.isoformat()} passed before processing started",
+            status="deadline_exceeded"
+        )
+
+    async def drop_expired_jobs(self, batch: List) -> List:
+        """Expire the prepared jobs of a robot batch whose deadline passed while they waited"""
+        kept = []
+        for job, processing_job in batch:
+            if processing_job.deadline_passed():
+                await self.expire_job(processing_job)
+                await self.release_job_files(processing_job)
+                await self.ack_job(processing_job.queue_item)
+            else:
+                kept.append((job, processing_job))
+        return kept
+
+    async def prepare_job(self, job_data: Dict[str, Any], queue_item: Optional[str] = None) -> Optional[ProcessingJob]:
+        """
+        Download and validate the input of a job (everything before the robot stage).
+        
+        Args:
+            job_data: Job read from the queue
+            queue_item: Raw queue entry of the job, used to renew its lease
             
-            self.logger.info(f"Processing job {execution_id} from bucket: {input_bucket_path}")
+        Returns:
+            The ProcessingJob ready for the robot, or None if the job already failed
+            or was completed from the result cache
+        """
+        execution_id = job_data['execution_id']
+        input_bucket_path = job_data['input_bucket_path']
+        
+        self.logger.info(f"Processing job {execution_id} from bucket: {input_bucket_path}")
+        
+        # Update job status
+        processing_job = ProcessingJob(
+            execution_id=execution_id,
+            input_bucket_path=input_bucket_path,
+            output_bucket_path=job_data['output_bucket_path'],
+            callback_url=job_data.get('callback_url'),
+            created_at=datetime.fromisoformat(job_data['created_at']) if job_data.get('created_at') else datetime.now(),
+            queue_item=queue_item,
+            batch_id=job_data.get('batch_id'),
+            priority=job_data.get('priority', DEFAULT_PRIORITY),
+            tenant=job_data.get('tenant', DEFAULT_TENANT),
+            deadline=local_deadline(job_data.get('deadline')),
+            idempotency_key=job_data.get('idempotency_key')
+        )
+        processing_job.timer.record("queue", 0.0, processing_job.timer.now())
+        self.jobs_status[execution_id] = processing_job
+        await self.set_job_status(processing_job, "processing")
+        
+        try:
+            processing_job.checkpoints = await self.status_store.get_checkpoints(execution_id)
+        except RedisError as e:
+            self.logger.warning(f"Failed to load checkpoints of job {execution_id}: {str(e)}")
+        
+        # Stems uploaded by a previous delivery: straight to the callback
+        result = self.restore_upload(processing_job)
+        if result is not None:
+            await self.finalize_job(processing_job, result)
+            await self.release_job_files(processing_job)
+            return None
+        
+        # Not worth downloading anything, unless the robot already ran for it
+        if processing_job.deadline_passed() and "staged" not in processing_job.checkpoints:
+            await self.expire_job(processing_job)
+            await self.release_job_files(processing_job)
+            return None
+        
+        try:
+            if await self.restore_download(processing_job):
+                return processing_job
             
-            # Update job status
-            processing_job = ProcessingJob(
-                execution_id=execution_id,
-                input_bucket_path=input_bucket_path,
-                output_bucket_path=output_bucket_path,
-                callback_url=callback_url,
-                created_at=datetime.now(),
-                status="processing"
-            )
-            self.jobs_status[execution_id] = processing_job
+            # A mix split before is served from the result cache without downloading it
+            processing_job.folder_name = input_bucket_path.rstrip('/').split('/')[-1]
+            if self.result_cache is not None:
+                with processing_job.timer.stage("cache_lookup"):
+                    processing_job.content_hash = await self.run_blocking(self.find_mix_hash, input_bucket_path)
+                    cached = await self.complete_from_cache(processing_job)
+                if cached:
+                    await self.release_job_files(processing_job)
+                    return None
             
             # Download from GCP bucket
+            transfer = {}
             try:
-                folder_name, temp_path, temp_dir = download_gcp_folder(input_bucket_path)
+                with processing_job.timer.stage("download"):
+                    folder_name, temp_path, temp_dir = await self.run_blocking(
+                        download_gcp_folder,
+                        input_bucket_path,
+                        mix_pattern=config.get('mix_pattern', '*_mix.wav'),
+                        selective=config.get('selective_download', True),
+                        backend=self.storage,
+                        work_dir=self.job_work_dir(execution_id),
+                        transfer=transfer,
+                        max_transfers=config.get('download_threads', 4)
+                    )
                 processing_job.temp_dir = temp_dir
-                print(f"Temp dir: {temp_dir}")
-                print(f"Temp path: {temp_path}")
+                processing_job.temp_path = temp_path
                 self.logger.info(f"Downloaded files to temp folder: {temp_path}")
             except Exception as e:
-                processing_job.status = "error"
-                processing_job.errors.append({
-                    "error": f"Failed to download from GCP: {str(e)}",
-                    "timestamp": datetime.now().isoformat()
-                })
-                if callback_url:
-                    await self.send_callback(callback_url, {
-                        "execution_id": execution_id,
-                        "status": "error",
-                        "error": f"Download failed: {str(e)}"
-                    })
-                return
+                await self.fail_job(
+                    processing_job,
+                    f"Failed to download from GCP: {str(e)}",
+                    f"Download failed: {str(e)}"
+                )
+                return None
             
+            # The WAV files were checked at the end of the download: that is verify, not transfer time
+            processing_job.timer.split("download", "verify", transfer["verify_seconds"])
             # Scan the downloaded folder
-            scan_result = self.scan_input_folder(temp_path)
+            scan_result = await self.run_blocking(self.scan_input_folder, temp_path)
+            processing_job.timer.record(
+                "verify",
+                processing_job.timer.stages["verify"]["start"],
+                processing_job.timer.now()
+            )
+            await self.add_transfer(processing_job, "downloaded_bytes", transfer["downloaded_bytes"])
+            await self.add_transfer(processing_job, "filtered_bytes", transfer["filtered_bytes"])
+            await self.sample_resources(processing_job)
             
             if scan_result["status"] == "error":
-                processing_job.status = "error"
-                processing_job.errors.append({
-                    "error": scan_result["error"],
-                    "timestamp": datetime.now().isoformat()
-                })
-                
-                if callback_url:
-                    await self.send_callback(callback_url, {
-                        "execution_id": execution_id,
-                        "status": "error",
-                        "error": scan_result["error"]
-                    })
-                return
+                await self.fail_job(processing_job, scan_result["error"])
+                await self.release_job_files(processing_job)
+                return None
             
             folder_info = scan_result["folder_info"]
             
             if not folder_info or not folder_info["should_process"]:
-                processing_job.status = "error"
-                processing_job.errors.append({
-                    "error": "No processable folder found or folder contains other .wav files",
-                    "timestamp": datetime.now().isoformat()
-                })
-                
-                if callback_url:
-                    await self.send_callback(callback_url, {
-                        "execution_id": execution_id,
-                        "status": "error",
-                        "error": "No processable folder found"
-                    })
-                return
+                await self.fail_job(
+                    processing_job,
+                    "No processable folder found or folder contains other .wav files",
+                    "No processable folder found"
+                )
+                await self.release_job_files(processing_job)
+                return None
             
             # Save folder name for control
             processing_job.folder_name = folder_info["name"]
-            self.logger.info(f"Processing folder: {folder_info['name']}")
+            processing_job.folder_info = folder_info
             
-            # Process the folder
-            try:
-                result = await self.robot.process_folder(folder_info["path"], folder_info["name"])
-                processing_job.results.append(result)
-                
-                if result["status"] == "error":
-                    processing_job.errors.append({
-                        "folder": folder_info["name"],
-                        "error": result.get("error", "Unknown error"),
-                        "timestamp": datetime.now().isoformat()
-                    })
-                    
-                    # If any error occurs, cleanup
-                    await self.cleanup_logic_folder()
-                    
-                else:
-                    # If processing was successful, move stems to temp folder and upload
-                    try:   
-                        # Move stems from Logic folder to temp folder
-                        logic_folder = config['cleanup_folder']
-                        temp_stems_folder = os.path.join(temp_path, 'stems')
-                        os.makedirs(temp_stems_folder, exist_ok=True)
-                        
-                        # Move all wav files
-                        for file in os.listdir(logic_folder):
-                            if file.endswith('.wav'):
-                                src = os.path.join(logic_folder, file)
-                                dst = os.path.join(temp_stems_folder, file)
-                                shutil.move(src, dst)
-                        
-                        # Upload stems to GCP
-                        upload_result = upload_stems_to_gcp(
-                            local_folder=temp_stems_folder,
-                            bucket_path=output_bucket_path,
-                            folder_name=folder_name
-                        )
-                        
-                        if upload_result["status"] == "success":
-                            processing_job.processed_stems_path = upload_result["gcp_path"]
-                            result["uploaded_stems"] = upload_result
-                        else:
-                            processing_job.errors.append({
-                                "folder": folder_info["name"],
-                                "error": f"Failed to upload stems: {upload_result['message']}",
-                                "timestamp": datetime.now().isoformat()
-                            })
-                        
-                    except Exception as e:
-                        self.logger.error(f"Error handling stems: {str(e)}")
-                        processing_job.errors.append({
-                            "folder": folder_info["name"],
-                            "error": f"Failed to handle stems: {str(e)}",
-                            "timestamp": datetime.now().isoformat()
-                        })
-                    
-                    # Cleanup Logic folder
-                    await self.cleanup_logic_folder()
-                    
-            except Exception as e:
-                self.logger.error(f"Error processing folder {folder_info['name']}: {str(e)}")
-                processing_job.errors.append({
-                    "folder": folder_info["name"],
-                    "error": str(e),
-                    "timestamp": datetime.now().isoformat()
-                })
-                
-                # Cleanup on error
-                await self.cleanup_logic_folder()
+            # Backends without object hashes: hash the downloaded mix and check the cache again
+            if self.result_cache is not None and processing_job.content_hash is None and len(folder_info["mix_files"]) == 1:
+                with processing_job.timer.stage("hash"):
+                    processing_job.content_hash = await self.run_blocking(
+                        file_content_hash,
+                        os.path.join(temp_path, folder_info["mix_files"][0])
+                    )
+                    cached = await self.complete_from_cache(processing_job)
+                if cached:
+                    await self.release_job_files(processing_job)
+                    return None
             
-            # Update final status
-            if processing_job.errors:
-                processing_job.status = "completed_with_errors"
-            else:
-                processing_job.status = "completed"
+            await self.save_checkpoint(processing_job, "downloaded", {
+                "work_dir": temp_dir.name,
+                "temp_path": temp_path,
+                "folder_info": folder_info,
+                "content_hash": processing_job.content_hash
+            })
+            return processing_job
             
-            self.logger.info(f"Job {execution_id} completed with status: {processing_job.status}")
+        except Exception as e:
+            self.logger.error(f"Critical error preparing job {execution_id}: {str(e)}")
+            await self.fail_job(processing_job, str(e))
+            await self.release_job_files(processing_job)
+            return None
+
+    def record_robot_result(
+        self,
+        processing_job: ProcessingJob,
+        result: Dict[str, Any],
+        started_at: float
+    ) -> bool:
+        """
+        Store a robot result on the job, returning False if it is an error (an
+        incomplete export is one). The robot step timings are moved into the job timings (robot.<step>).
+        """
+        processing_job.timer.record("robot", started_at, processing_job.timer.now())
+        processing_job.timer.merge("robot", result.pop("timings", {}), started_at)
+        processing_job.results.append(result)
+        if result["status"] == "success" and result.get("export_complete") is False:
+            # Timed out before every expected stem was exported: not a usable stem set
+            result["status"] = "error"
+            result["error"] = f"Export incomplete, missing stems: {', '.join(result.get('missing_stems', []))}"
+        if result["status"] == "error":
+            processing_job.errors.append({
+                "folder": processing_job.folder_name,
+                "error": result.get("error", "Unknown error"),
+                "timestamp": datetime.now().isoformat()
+            })
+            return False
+        return True
+
+    async def run_robot_stage(self, processing_job: ProcessingJob) -> Optional[Dict[str, Any]]:
+        """
+        Run LogicRobot on a prepared job.
+        
+        Returns:
+            The robot result, or None if the robot raised
+        """
+        folder_info = processing_job.folder_info
+        await self.set_job_status(processing_job, "processing")
+        self.logger.info(f"Processing folder: {folder_info['name']}")
+        
+        on_stem_ready = None
+        if config.get('streaming_upload', True):
+            on_stem_ready = functools.partial(self.stream_stem, processing_job)
+        
+        # Only the stems of this run may be in the export folder when they are staged
+        await self.cleanup_logic_folder()
+        started_at = processing_job.timer.now()
+        try:
+            result = await self.robot.process_folder(
+                folder_info["path"],
+                folder_info["name"],
+                on_stem_ready=on_stem_ready
+            )
+            await self.count_robot_restarts()
             
-            # Send callback if provided
-            if callback_url:
-                callback_data = {
-                    "execution_id": execution_id,
-                    "status": processing_job.status,
-                    "folder_name": processing_job.folder_name,
-                    "errors": processing_job.errors,
-                    "results": processing_job.results,
-                    "processed_stems_path": processing_job.processed_stems_path,
-                    "completed_at": datetime.now().isoformat()
-                }
-                await self.send_callback(callback_url, callback_data)
+            if not self.record_robot_result(processing_job, result, started_at):
+                # If any error occurs, cleanup
+                await self.cleanup_logic_folder()
+            
+            return result
             
         except Exception as e:
-            self.logger.error(f"Critical error in job processing: {str(e)}")
-            execution_id = job_data.get('execution_id', 'unknown')
+            self.logger.error(f"Error processing folder {folder_info['name']}: {str(e)}")
+            processing_job.timer.record("robot", started_at, processing_job.timer.now())
+            processing_job.errors.append({
+                "folder": folder_info["name"],
+                "error": str(e),
+                "timestamp": datetime.now().isoformat()
+            })
             
-            if execution_id in self.jobs_status:
-                self.jobs_status[execution_id].status = "error"
-                self.jobs_status[execution_id].errors.append({
+            # Cleanup on error
+            await self.cleanup_logic_folder()
+            return None
+
+    async def run_robot_batch(self, processing_jobs: List[ProcessingJob]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Run LogicRobot on several prepared jobs in one Logic session and fan the
+        per-song results back out to each job.
+        
+        Returns:
+            One robot result per job (None where the robot raised)
+        """
+        if len(processing_jobs) == 1:
+            return [await self.run_robot_stage(processing_jobs[0])]
+        
+        by_folder = {job.folder_name: job for job in processing_jobs}
+        for job in processing_jobs:
+            await self.set_job_status(job, "processing")
+        self.logger.info(f"Processing batch of {len(processing_jobs)} folders: {', '.join(by_folder)}")
+        
+        on_stem_ready = None
+        if config.get('streaming_upload', True):
+            on_stem_ready = lambda folder_name, stem_path: self.stream_stem(by_folder[folder_name], stem_path)
+        
+        await self.cleanup_logic_folder()
+        started_at = {job.execution_id: job.timer.now() for job in processing_jobs}
+        try:
+            results = await self.robot.process_folders(
+                [(job.folder_info["path"], job.folder_name) for job in processing_jobs],
+                on_stem_ready=on_stem_ready
+            )
+            await self.count_robot_restarts()
+        except Exception as e:
+            self.logger.error(f"Error processing batch: {str(e)}")
+            for job in processing_jobs:
+                job.timer.record("robot", started_at[job.execution_id], job.timer.now())
+                job.errors.append({
+                    "folder": job.folder_name,
                     "error": str(e),
                     "timestamp": datetime.now().isoformat()
                 })
-            
-            # Cleanup on critical error
             await self.cleanup_logic_folder()
-            
-            # Send error callback
-            callback_url = job_data.get('callback_url')
-            if callback_url:
-                await self.send_callback(callback_url, {
-                    "execution_id": execution_id,
-                    "status": "error",
-                    "error": str(e)
-                })
-        finally:
-            # Always cleanup temp directory if it exists
-            if temp_dir:
-                temp_dir.cleanup()
-
-    async def create_job(
-        self, 
-        input_bucket_path: str,
-        output_bucket_path: str,
-        callback_url: Optional[str] = None
-    ) -> str:
-        """Create a new processing job"""
+            return [None] * len(processing_jobs)
+        
+        for job, result in zip(processing_jobs, results):
+            self.record_robot_result(job, result, started_at[job.execution_id])
+        return results
+
+    def stream_stem(self, processing_job: ProcessingJob, stem_path: str):
+        """Called by the export watcher for every finalized stem: upload it right away"""
+        task = asyncio.create_task(self.upload_streamed_stem(processing_job, stem_path))
+        processing_job.upload_tasks.append(task)
+
+    async def upload_streamed_stem(self, processing_job: ProcessingJob, stem_path: str):
+        """Stage a single finalized stem into the job folder and upload it"""
         try:
-            execution_id = str(uuid.uuid4())
-            
-            # Create job in queue
-            job_data = {
-                "execution_id": execution_id,
-                "input_bucket_path": input_bucket_path,
-                "output_bucket_path": output_bucket_path,
-                "callback_url": callback_url,
-                "created_at": datetime.now().isoformat()
-            }
-            
-            # Add job to Redis list
-            await self.redis.lpush("logic-processing", json.dumps(job_data))
-            
-            # Initialize job status
-            processing_job = ProcessingJob(
-                execution_id=execution_id,
-                input_bucket_path=input_bucket_path,
-                output_bucket_path=output_bucket_path,
-                callback_url=callback_url,
-                created_at=datetime.now(),
-                status="queued"
+            staged = await self.run_blocking(
+                self._link_or_copy,
+                stem_path,
+                os.path.join(processing_job.temp_path, 'stems')
             )
-            self.jobs_status[execution_id] = processing_job
-            
-            self.logger.info(f"Created job {execution_id} for bucket path: {input_bucket_path}")
+            uploaded_bytes = await self.run_blocking(
+                upload_stem_file,
+                staged,
+                processing_job.output_bucket_path,
+                folder_name=processing_job.folder_name,
+                backend=self.storage
+            )
+            processing_job.uploaded_stems[os.path.basename(staged)] = uploaded_bytes
+            await self.add_transfer(processing_job, "uploaded_bytes", uploaded_bytes)
+        except Exception as e:
+            # Not fatal: finalize_job uploads every stem that was not streamed
+            self.logger.warning(f"Streaming upload of {stem_path} failed: {str(e)}")
+
+    async def wait_for_streamed_uploads(self, processing_job: ProcessingJob):
+        if processing_job.upload_tasks:
+            await asyncio.gather(*processing_job.upload_tasks, return_exceptions=True)
+            processing_job.upload_tasks = []
+
+    async def stage_stems(
+        self,
+        processing_job: ProcessingJob,
+        result: Optional[Dict[str, Any]],
+        only_exported: bool = False,
+        cleanup: bool = True
+    ):
+        """
+        Hand the exported stems over to the job: move them from the Logic export folder
+        into the job's own staging folder and clear the export folder for the next run.
+        With only_exported, only the files the robot reported for this job are moved
+        (used when a batch exported the stems of several songs into the same folder).
+        """
+        if result is None or result["status"] == "error":
+            if cleanup:
+                await self.cleanup_logic_folder()
+            return
+        
+        try:
+            # Move stems from Logic folder to temp folder
+            logic_folder = config['cleanup_folder']
+            temp_stems_folder = os.path.join(processing_job.temp_path, 'stems')
+            names = None
+            if only_exported:
+                names = [os.path.basename(f) for f in result.get("exported_files", [])]
             
-            return execution_id
+            # Move all wav files
+            with processing_job.timer.stage("stem_move"):
+                await self.run_blocking(self._move_wav_files, logic_folder, temp_stems_folder, names)
+            processing_job.stems_path = temp_stems_folder
+            await self.sample_resources(processing_job)
+            await self.save_checkpoint(processing_job, "staged", {
+                "stems_path": temp_stems_folder,
+                "results": processing_job.results,
+                "errors": processing_job.errors
+            })
             
         except Exception as e:
-            self.logger.error(f"Error creating job: {str(e)}")
-            raise
+            self.logger.error(f"Error handling stems: {str(e)}")
+            processing_job.errors.append({
+                "folder": processing_job.folder_name,
+                "error": f"Failed to handle stems: {str(e)}",
+                "timestamp": datetime.now().isoformat()
+            })
+        
+        # Cleanup Logic folder
+        if cleanup:
+            await self.cleanup_logic_folder()
 
-    def get_job_status(self, execution_id: str) -> Optional[Dict[str, Any]]:
-        """Get status of a job by execution ID"""
-        if execution_id not in self.jobs_status:
-            return None
+    async def finalize_job(self, processing_job: ProcessingJob, result: Optional[Dict[str, Any]]):
+        """Upload the staged stems of a robot run, then report the final status"""
+        upload_started_at = processing_job.timer.now()
+        await self.wait_for_streamed_uploads(processing_job)
         
-        job = self.jobs_status[execution_id]
-        return {
-            "execution_id": job.execution_id,
-            "status": job.status,
-            "input_bucket_path": job.input_bucket_path,
-            "output_bucket_path": job.output_bucket_path,
-            "folder_name": job.folder_name,
-            "errors": job.errors,
-            "results": job.results,
-            "created_at": job.created_at.isoformat(),
-            "callback_url": job.callback_url,
-            "processed_stems_path": job.processed_stems_path
-        }
+        uploaded = processing_job.checkpoints.get("uploaded")
+        if uploaded:
+            # Uploaded by a previous delivery of the job, or copied from the result cache
+            processing_job.processed_stems_path = uploaded["upload"]["gcp_path"]
+            result["uploaded_stems"] = uploaded["upload"]
+        elif processing_job.stems_path:
+            await self.set_job_status(processing_job, "uploading")
+            try:
+                # Upload the stems that were not streamed already
+                upload_result = await self.run_blocking(
+                    upload_stems_to_gcp,
+                    local_folder=processing_job.stems_path,
+                    bucket_path=processing_job.output_bucket_path,
+                    folder_name=processing_job.folder_name,
+                    backend=self.storage,
+                    already_uploaded=processing_job.uploaded_stems,
+                    max_transfers=config.get('upload_threads', 4)
+                )
+                
+                if upload_result["status"] == "success":
+                    # Streamed stems were counted as they were uploaded
+                    await self.add_transfer(
+                        processing_job,
+                        "uploaded_bytes",
+                        upload_result["uploaded_bytes"] - sum(processing_job.uploaded_stems.values())
+                    )
+                    processing_job.processed_stems_path = upload_result["gcp_path"]
+                    result["uploaded_stems"] = upload_result
+                    await self.save_upload_checkpoint(processing_job, upload_result)
+                else:
+                    processing_job.errors.append({
+                        "folder": processing_job.folder_name,
+                        "error": f"Failed to upload stems: {upload_result['message']}",
+                        "timestamp": datetime.now().isoformat()
+                    })
+                
+            except Exception as e:
+                self.logger.error(f"Error uploading stems: {str(e)}")
+                processing_job.errors.append({
+                    "folder": processing_job.folder_name,
+                    "error": f"Failed to upload stems: {str(e)}",
+                    "timestamp": datetime.now().isoformat()
+                })
+        processing_job.timer.record("upload", upload_started_at, processing_job.timer.now())
+        await self.sample_resources(processing_job)
+        
+        # Update final status
+        if processing_job.errors:
+            await self.set_job_status(processing_job, "completed_with_errors")
+        else:
+            await self.set_job_status(processing_job, "completed")
+            if not result.get("cached"):
+                await self.cache_result(processing_job)
+        
+        self.logger.info(f"Job {processing_job.execution_id} completed with status: {processing_job.status}")
+        
+        # Send callback if provided (and not already sent by a previous delivery)
+        if processing_job.callback_url and "callback" not in processing_job.checkpoints:
+            callback_data = {
+                "execution_id": processing_job.execution_id,
+                "status": processing_job.status,
+                "folder_name": processing_job.folder_name,
+                "errors": processing_job.errors,
+                "results": processing_job.results,
+                "processed_stems_path": processing_job.processed_stems_path,
+                "completed_at": datetime.now().isoformat(),
+                "timings": processing_job.timer.to_dict(),
+                "resources": processing_job.resources
+            }
+            with processing_job.timer.stage("callback"):
+                await self.send_callback(processing_job.callback_url, callback_data)
+            await self.save_checkpoint(processing_job, "callback", {"sent_at": callback_data["completed_at"]})
+            # Persist the callback timing too
+            await self.set_job_status(processing_job, processing_job.status)
+
+    async def release_job_files(self, processing_job: ProcessingJob):
+        """Remove the temporary input files of a job, recording its metrics if it is finished"""
+        await self.wait_for_streamed_uploads(processing_job)
+        if processing_job.temp_dir:
+            await self.run_blocking(processing_job.temp_dir.cleanup)
+            processing_job.temp_dir = None
+        if self.jobs_status.pop(processing_job.execution_id, None) is not None:
+            await self.record_job_metrics(processing_job)
+
+    async def handle_critical_error(self, job_data: Dict[str, Any], error: Exception):
+        """Report an unexpected error raised while a job was running"""
+        self.logger.error(f"Critical error in job processing: {str(error)}")
+        execution_id = job_data.get('execution_id', 'unknown')
+        
+        if execution_id in self.jobs_status:
+            processing_job = self.jobs_status[execution_id]
+            processing_job.errors.append({
+                "error": str(error),
+                "timestamp": datetime.now().isoformat()
+            })
+            await self.set_job_status(processing_job, "error")
+        
+        # Cleanup on critical error
+        await self.cleanup_logic_folder()
+        
+        # Send error callback
+        callback_url = job_data.get('callback_url')
+        if callback_url:
+            await self.send_callback(callback_url, {
+                "execution_id": execution_id,
+                "status": "error",
+                "error": str(error)
+            })
+
+    async def process_job(self, job_data: Dict[str, Any], queue_item: Optional[str] = None):
+        """Process a single job from the queue"""
+        processing_job = None
+        try:
+            processing_job = await self.prepare_job(job_data, queue_item)
+            if processing_job is None:
+                return
+            
+            result = self.restore_staged_stems(processing_job)
+            if result is None:
+                result = await self.run_robot_stage(processing_job)
+                await self.stage_stems(processing_job, result)
+            await self.finalize_job(processing_job, result)
+            
+        except Exception as e:
+            await self.handle_critical_error(job_data, e)
+        
+        # Cleanup temp directory if it exists (kept when cancelled, to resume from checkpoints)
+        if processing_job:
+            await self.release_job_files(processing_job)
 
     async def process_queue(self):
         """Process jobs from the queue"""
+        # Join the fleet before consuming, so the reaper of other workers sees this one alive
+        await self.send_heartbeat()
+        if self.heartbeat_task is None:
+            self.heartbeat_task = asyncio.create_task(self.heartbeat_loop())
+        self.logger.info(f"Worker {self.worker_id} registered")
+        # Jobs left unacknowledged by a previous run of this worker go back to the queue
+        await self.queue.recover(on_dead_letter=self.give_up_job)
+        # And the stems it was exporting when it stopped must not be staged into the next job
+        await self.cleanup_logic_folder()
+        if self.reaper_task is None:
+            self.reaper_task = asyncio.create_task(self.reap_stale_jobs())
+        
+        prefetch_depth = config.get('prefetch_depth', 1)
+        batch_size = config.get('batch_size', 1)
+        if prefetch_depth > 0 or batch_size > 1:
+            await self.process_queue_with_prefetch(prefetch_depth, batch_size)
+            return
+        
         while True:
             try:
-                # Get job from Redis list
-                job_data = await self.redis.brpop("logic-processing", timeout=1)
-                if job_data:
-                    _, job_json = job_data
-                    job = json.loads(job_json)
-                    await self.process_job(job)
+                await self.wait_for_disk_headroom()
+                # Lease a job from the Redis list; it stays in flight until acknowledged
+                queue_item = await self.queue.get(timeout=1)
+                if queue_item:
+                    job = json.loads(queue_item)
+                    await self.process_job(job, queue_item)
+                    await self.ack_job(queue_item)
             except Exception as e:
                 self.logger.error(f"Error processing queue: {str(e)}")
                 await asyncio.sleep(1)
 
+    async def prefetch_jobs(self, ready: asyncio.Queue, slots: asyncio.Semaphore):
+        """
+        Dequeue jobs and download/validate their input ahead of the robot.
+        A slot is taken before each dequeue and given back when the robot picks the job up,
+        so at most `prefetch_depth` prepared jobs wait for the robot.
+        """
+        while True:
+            await slots.acquire()
+            job = None
+            queue_item = None
+            try:
+                while queue_item is None:
+                    await self.wait_for_disk_headroom()
+                    queue_item = await self.queue.get(timeout=1)
+                job = json.loads(queue_item)
+                processing_job = await self.prepare_job(job, queue_item)
+                if processing_job is None:
+                    await self.ack_job(queue_item)
+                    slots.release()
+                    continue
+                result = self.restore_staged_stems(processing_job)
+                if result is not None:
+                    # Robot already ran for this job, go straight to upload
+                    await self.schedule_finalize(job, processing_job, result)
+                    slots.release()
+                    continue
+                await self.set_job_status(processing_job, "prefetched")
+                await ready.put((job, processing_job))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if job is not None:
+                    await self.handle_critical_error(job, e)
+                    await self.ack_job(queue_item)
+                else:
+                    self.logger.error(f"Error prefetching from queue: {str(e)}")
+                    await asyncio.sleep(1)
+                slots.release()
+
+    async def finalize_in_background(
+        self,
+        job_data: Dict[str, Any],
+        processing_job: ProcessingJob,
+        result: Optional[Dict[str, Any]]
+    ):
+        """Run finalize_job for a job whose stems are already staged, then free its slot"""
+        try:
+            try:
+                await self.finalize_job(processing_job, result)
+            except Exception as e:
+                await self.handle_critical_error(job_data, e)
+            # Not reached when cancelled: the files and the lease are kept for a redelivery
+            await self.release_job_files(processing_job)
+            await self.ack_job(processing_job.queue_item)
+        finally:
+            self.finalize_slots.release()
+
+    async def schedule_finalize(
+        self,
+        job_data: Dict[str, Any],
+        processing_job: ProcessingJob,
+        result: Optional[Dict[str, Any]]
+    ):
+        """Start finalize_in_background once a finalization slot is free"""
+        await self.finalize_slots.acquire()
+        task = asyncio.create_task(self.finalize_in_background(job_data, processing_job, result))
+        self.finalize_tasks.add(task)
+        task.add_done_callback(self.finalize_tasks.discard)
+
+    async def wait_for_finalizations(self):
+        """Wait until every background upload/callback has finished"""
+        if self.finalize_tasks:
+            await asyncio.gather(*self.finalize_tasks, return_exceptions=True)
+
+    @staticmethod
+    def take_batch(pending: List, batch_size: int) -> List:
+        """
+        Take up to batch_size prepared jobs from pending, skipping jobs whose folder
+        name or mix file name is already in the batch (stems are named after the mix,
+        so theirs would collide in the export folder).
+        """
+        batch = []
+        folder_names = set()
+        mix_names = set()
+        for item in list(pending):
+            if len(batch) >= batch_size:
+                break
+            processing_job = item[1]
+            names = {os.path.splitext(name)[0].lower() for name in processing_job.folder_info["mix_files"]}
+            if processing_job.folder_name in folder_names or names & mix_names:
+                continue
+            folder_names.add(processing_job.folder_name)
+            mix_names |= names
+            batch.append(item)
+            pending.remove(item)
+        return batch
+
+    async def process_queue_with_prefetch(self, prefetch_depth: int, batch_size: int = 1):
+        """
+        Run the robot serially while the next jobs are prefetched and the previous
+        jobs are uploaded in the background. The robot is the only serialized stage.
+        With batch_size > 1, up to batch_size prepared jobs go through one robot run.
+        """
+        ready: asyncio.Queue = asyncio.Queue()
+        slots = asyncio.Semaphore(max(prefetch_depth, batch_size))
+        prefetcher = asyncio.create_task(self.prefetch_jobs(ready, slots))
+        self.logger.info(f"Prefetching up to {prefetch_depth} job(s) ahead of the robot")
+        pending = []
+        
+        try:
+            while True:
+                if not pending:
+                    pending.append(await ready.get())
+                    slots.release()
+                while not ready.empty():
+                    pending.append(ready.get_nowait())
+                    slots.release()
+                # Jobs prefetched meanwhile may outrank the older ones
+                pending.sort(key=lambda item: schedule_order(item[0]))
+                batch = await self.drop_expired_jobs(self.take_batch(pending, batch_size))
+                if not batch:
+                    continue
+                processing_jobs = [processing_job for _, processing_job in batch]
+                
+                try:
+                    results = await self.run_robot_batch(processing_jobs)
+                    for processing_job, result in zip(processing_jobs, results):
+                        await self.stage_stems(
+                            processing_job,
+                            result,
+                            only_exported=len(batch) > 1,
+                            cleanup=False
+                        )
+                    await self.cleanup_logic_folder()
+                except Exception as e:
+                    for job, processing_job in batch:
+                        await self.handle_critical_error(job, e)
+                        await self.release_job_files(processing_job)
+                        await self.ack_job(processing_job.queue_item)
+                    continue
+                
+                # Upload, callback and cleanup overlap with the next robot run.
+                # Waiting for a slot bounds how many finished jobs can pile up on disk.
+                for (job, processing_job), result in zip(batch, results):
+                    await self.schedule_finalize(job, processing_job, result)
+        finally:
+            prefetcher.cancel()
+            # Drop input files of jobs that were prefetched but never processed
+            # and give the jobs back to the queue for another worker
+            while not ready.empty():
+                pending.append(ready.get_nowait())
+            for _, processing_job in reversed(pending):
+                await self.release_job_files(processing_job)
+                try:
+                    await self.queue.requeue(processing_job.queue_item)
+                except RedisError as e:
+                    self.logger.warning(f"Failed to requeue job {processing_job.execution_id}: {str(e)}")
+
     async def start_worker(self):
         """Start the worker"""
         try:
@@ -433,10 +1300,17 @@ class LogicWorker:
     async def stop_worker(self):
         """Stop the worker"""
         try:
-            if self.redis:
-                await self.redis.close()
-            if self.pool:
-                await self.pool.disconnect()
+            await self.wait_for_finalizations()
+            if self.reaper_task:
+                self.reaper_task.cancel()
+                self.reaper_task = None
+            if self.heartbeat_task:
+                self.heartbeat_task.cancel()
+                self.heartbeat_task = None
+            if self.registry:
+                # Jobs still held are reassigned by the next reaper run of another worker
+                await self.registry.deregister(self.worker_id)
+            await self.close()
             self.logger.info("Worker stopped")
         except Exception as e:
             self.logger.error(f"Error stopping worker: {str(e)}")
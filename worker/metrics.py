@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+from typing import Dict, List, Optional, Tuple
+from redis.asyncio import Redis
+
+# Upper bounds (seconds) of the stage latency histogram buckets: from a cache lookup to a robot run
+STAGE_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+# Upper bounds (bytes) of the per-job disk and memory histogram buckets: 10 MB to 10 GB
+BYTE_BUCKETS = tuple(mb * 1024 * 1024 for mb in (10, 50, 100, 250, 500, 1024, 2048, 5120, 10240))
+
+# Counters every process may increment: name -> help text
+COUNTERS = {
+    "logic_jobs_finished_total": "Jobs that reached a final status, by status",
+    "logic_downloaded_bytes_total": "Bytes of input files downloaded from the storage backend",
+    "logic_filtered_bytes_total": "Bytes of input objects discarded by the mix_pattern filter",
+    "logic_uploaded_bytes_total": "Bytes of stems uploaded to the storage backend",
+    "logic_callbacks_total": "Callbacks sent, by result (success or failure)",
+    "logic_robot_restarts_total": "Logic Pro (re)launches by the robot",
+}
+# Histograms of finished jobs: name -> (help text, label, buckets)
+HISTOGRAMS = {
+    "logic_stage_duration_seconds": (
+        "Duration of the stages of finished jobs (see timings in the job status)", "stage", STAGE_BUCKETS
+    ),
+    "logic_job_peak_temp_bytes": (
+        "Peak size of the temporary folder of finished jobs", None, BYTE_BUCKETS
+    ),
+    "logic_job_peak_rss_bytes": (
+        "Peak RSS of the worker process at the end of finished jobs", None, BYTE_BUCKETS
+    ),
+}
+
+# Gauge read at scrape time: (name, help, {label values: value})
+Gauge = Tuple[str, str, Dict[Tuple[Tuple[str, str], ...], float]]
+
+def series(name: str, labels: Optional[Dict[str, str]] = None) -> str:
+    """Prometheus series name, e.g. logic_callbacks_total{result="success"}"""
+    if not labels:
+        return name
+    pairs = ",".join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+    return f"{name}{{{pairs}}}"
+
+def format_value(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+class MetricsStore:
+    """
+    Counters and stage latency histograms shared by every worker process through Redis,
+    rendered in the Prometheus text format by the API. Workers increment them with one
+    pipelined round trip; gauges (queue depth, jobs by status...) are not stored but read
+    from the queue and the worker registry at scrape time.
+
+    Keys:
+        logic-metrics:counters              hash of counter series -> value
+        logic-metrics:histogram:<name>      hash of <label>|<bucket>, <label>|sum and <label>|count
+    """
+    COUNTERS_KEY = "logic-metrics:counters"
+    HISTOGRAM_PREFIX = "logic-metrics:histogram:"
+
+    def __init__(self, redis: Redis):
+        self.redis = redis
+
+    @classmethod
+    def histogram_key(cls, name: str) -> str:
+        return f"{cls.HISTOGRAM_PREFIX}{name}"
+
+    async def incr(self, name: str, amount: float = 1, **labels: str):
+        """Increment a counter of COUNTERS"""
+        if amount:
+            await self.redis.hincrbyfloat(self.COUNTERS_KEY, series(name, labels), amount)
+
+    async def mean(self, name: str, label: str = "") -> Optional[float]:
+        """Mean of the observations of a histogram, None before the first one"""
+        total, count = await self.redis.hmget(self.histogram_key(name), f"{label}|sum", f"{label}|count")
+        if not count or not float(count):
+            return None
+        return float(total) / float(count)
+
+    def queue_observe(self, pipe, name: str, value: float, label: str = ""):
+        """Add the commands recording one observation of a histogram of HISTOGRAMS to a pipeline"""
+        key = self.histogram_key(name)
+        for bound in HISTOGRAMS[name][2]:
+            if value <= bound:
+                pipe.hincrby(key, f"{label}|{bound}", 1)
+        pipe.hincrby(key, f"{label}|+Inf", 1)
+        pipe.hincrbyfloat(key, f"{label}|sum", value)
+        pipe.hincrby(key, f"{label}|count", 1)
+
+    async def observe_job(
+        self,
+        status: str,
+        timings: Dict[str, Dict[str, float]],
+        resources: Dict[str, int]
+    ):
+        """Count a finished job and add its stage durations and resource peaks to the histograms"""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hincrbyfloat(self.COUNTERS_KEY, series("logic_jobs_finished_total", {"status": status}), 1)
+            for stage, timing in timings.items():
+                self.queue_observe(pipe, "logic_stage_duration_seconds", timing["duration"], stage)
+            self.queue_observe(pipe, "logic_job_peak_temp_bytes", resources.get("peak_temp_bytes", 0))
+            self.queue_observe(pipe, "logic_job_peak_rss_bytes", resources.get("peak_rss_bytes", 0))
+            await pipe.execute()
+
+    async def render(self, gauges: List[Gauge]) -> str:
+        """Every metric in the Prometheus text exposition format (version 0.0.4)"""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hgetall(self.COUNTERS_KEY)
+            for name in HISTOGRAMS:
+                pipe.hgetall(self.histogram_key(name))
+            counters, *histograms = await pipe.execute()
+
+        lines = []
+        for name, help_text, values in gauges:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            for labels, value in sorted(values.items()):
+                lines.append(f"{series(name, dict(labels))} {format_value(value)}")
+
+        for name, help_text in COUNTERS.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for key in sorted(counters):
+                if key == name or key.startswith(f"{name}{{"):
+                    lines.append(f"{key} {format_value(counters[key])}")
+
+        for (name, (help_text, label_name, buckets)), values in zip(HISTOGRAMS.items(), histograms):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            for label in sorted({key.split("|")[0] for key in values}):
+                labels = {label_name: label} if label_name else {}
+                for bound in [*map(str, buckets), "+Inf"]:
+                    count = values.get(f"{label}|{bound}", 0)
+                    lines.append(f"{series(f'{name}_bucket', dict(labels, le=bound))} {format_value(count)}")
+                lines.append(f"{series(f'{name}_sum', labels)} {format_value(values.get(f'{label}|sum', 0))}")
+                lines.append(f"{series(f'{name}_count', labels)} {format_value(values.get(f'{label}|count', 0))}")
+        return "\n".join(lines) + "\n"
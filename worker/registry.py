@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+import json
+import logging
+from typing import Dict, Any, List
+from redis.asyncio import Redis
+
+logger = logging.getLogger(__name__)
+
+class WorkerRegistry:
+    """
+    Live view of the worker fleet through Redis.
+
+    Every worker registers under its worker id (the same id its queue consumer uses) and
+    rewrites its record on each heartbeat. The record expires `ttl` seconds after the last
+    heartbeat, so a worker that stopped or lost its machine drops out of the listing on its
+    own. Its id stays in the registered set until the reaper has requeued its jobs.
+
+    Keys:
+        logic-workers          set of registered worker ids
+        logic-worker:<id>      JSON record of one worker (capabilities, current jobs...)
+    """
+    WORKERS_KEY = "logic-workers"
+    KEY_PREFIX = "logic-worker:"
+
+    def __init__(self, redis: Redis, ttl: int = 30):
+        self.redis = redis
+        self.ttl = ttl
+
+    @classmethod
+    def key(cls, worker_id: str) -> str:
+        return f"{cls.KEY_PREFIX}{worker_id}"
+
+    async def heartbeat(self, worker: Dict[str, Any]):
+        """Write the record of a worker and renew its liveness for `ttl` seconds"""
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(self.key(worker["worker_id"]), json.dumps(worker), ex=self.ttl)
+            pipe.sadd(self.WORKERS_KEY, worker["worker_id"])
+            await pipe.execute()
+
+    async def deregister(self, worker_id: str):
+        """
+        Drop the record of a stopping worker. The id stays registered, so the jobs it
+        still holds are reassigned by the next reaper run instead of after their lease.
+        """
+        await self.redis.delete(self.key(worker_id))
+
+    async def list_workers(self) -> List[Dict[str, Any]]:
+        """Records of every live worker, sorted by worker id"""
+        worker_ids = sorted(await self.redis.smembers(self.WORKERS_KEY))
+        if not worker_ids:
+            return []
+        records = await self.redis.mget([self.key(worker_id) for worker_id in worker_ids])
+        return [json.loads(record) for record in records if record]
+
+    async def dead_workers(self) -> List[str]:
+        """Registered worker ids whose record expired (no heartbeat for `ttl` seconds)"""
+        worker_ids = sorted(await self.redis.smembers(self.WORKERS_KEY))
+        if not worker_ids:
+            return []
+        records = await self.redis.mget([self.key(worker_id) for worker_id in worker_ids])
+        return [worker_id for worker_id, record in zip(worker_ids, records) if record is None]
+
+    async def forget(self, worker_ids: List[str]):
+        """Unregister dead workers once their jobs were reassigned"""
+        if worker_ids:
+            await self.redis.srem(self.WORKERS_KEY, *worker_ids)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+import json
+import time
+import base64
+import hashlib
+import logging
+from typing import Dict, Any, Optional, Callable
+from redis.asyncio import Redis
+from utils.storage import StorageBackend, StorageObject
+
+logger = logging.getLogger(__name__)
+
+def file_content_hash(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Base64 MD5 of a local file, the same format GCS reports as md5_hash"""
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            md5.update(chunk)
+    return base64.b64encode(md5.digest()).decode()
+
+def object_content_hash(obj: StorageObject) -> Optional[str]:
+    """Content hash of a stored object from its metadata, None if the backend has none"""
+    return obj.md5_hash or obj.metadata.get('md5_hash')
+
+class ResultCache:
+    """
+    Index of stems already produced for a mix, keyed by the mix content hash and the
+    Logic Pro version (so an upgrade invalidates every entry).
+
+    An entry points to the output folder of the job that produced the stems and
+    records the generation of every stem, so it is only used while those objects are
+    unchanged. Backends without object generations (gsutil) cannot tell, so nothing is
+    cached for them. A hit is served with server-side copies into the new output folder.
+    Entries expire after `max_age` seconds; beyond `max_entries` the oldest are evicted.
+    """
+    KEY_PREFIX = "logic-cache:"
+    INDEX_KEY = "logic-cache:index"
+
+    def __init__(
+        self,
+        redis: Redis,
+        storage: StorageBackend,
+        logic_version: Callable[[], str],
+        max_age: int = 30 * 86400,
+        max_entries: int = 10000
+    ):
+        self.redis = redis
+        self.storage = storage
+        self.logic_version = logic_version
+        self.max_age = max_age
+        self.max_entries = max_entries
+
+    def key(self, content_hash: str) -> str:
+        return f"{self.KEY_PREFIX}{self.logic_version()}:{content_hash}"
+
+    async def lookup(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        entry = await self.redis.get(self.key(content_hash))
+        return json.loads(entry) if entry else None
+
+    async def store(self, content_hash: str, stems_path: str, files: Dict[str, Optional[str]]):
+        """
+        Record the stems produced for a mix.
+
+        Args:
+            content_hash: Content hash of the mix
+            stems_path: Bucket path of the folder holding the stems
+            files: Stem file names mapped to their object generation
+        """
+        if not files or None in files.values():
+            logger.info(f"Not caching the stems in {stems_path}: the storage backend reports no generations")
+            return
+        key = self.key(content_hash)
+        entry = {
+            "stems_path": stems_path,
+            "files": files,
+            "created_at": time.time()
+        }
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.set(key, json.dumps(entry), ex=self.max_age)
+            pipe.zadd(self.INDEX_KEY, {key: entry["created_at"]})
+            await pipe.execute()
+        await self.evict()
+
+    async def invalidate(self, content_hash: str):
+        key = self.key(content_hash)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.delete(key)
+            pipe.zrem(self.INDEX_KEY, key)
+            await pipe.execute()
+
+    async def evict(self) -> int:
+        """Drop entries older than max_age, then the oldest ones beyond max_entries"""
+        removed = await self.redis.zremrangebyscore(self.INDEX_KEY, "-inf", time.time() - self.max_age)
+        excess = await self.redis.zcard(self.INDEX_KEY) - self.max_entries
+        if excess > 0:
+            oldest = await self.redis.zrange(self.INDEX_KEY, 0, excess - 1)
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.delete(*oldest)
+                pipe.zrem(self.INDEX_KEY, *oldest)
+                await pipe.execute()
+            removed += len(oldest)
+        return removed
+
+    def copy_stems(self, entry: Dict[str, Any], dest_path: str) -> Dict[str, Any]:
+        """
+        Copy the stems of a cache entry into dest_path with server-side copies.
+        Blocking, run it in an executor.
+
+        Returns:
+            Dict shaped like the upload_stems_to_gcp result
+
+        Raises:
+            Exception: If a cached stem was deleted or overwritten since it was recorded,
+                or its generation is unknown so that cannot be ruled out
+        """
+        src_path = entry["stems_path"].strip('/')
+        dest_path = dest_path.strip('/')
+        for name, generation in entry["files"].items():
+            obj = self.storage.stat(f"{src_path}/{name}")
+            if obj is None or generation is None or obj.generation != generation:
+                raise Exception(f"Cached stem {src_path}/{name} changed, was removed or has no generation")
+
+        copied_bytes = 0
+        if src_path != dest_path:
+            for name in entry["files"]:
+                copied_bytes += self.storage.copy(f"{src_path}/{name}", f"{dest_path}/{name}")
+        logger.info(f"Copied {len(entry['files'])} cached stems from gs://{src_path} to gs://{dest_path}")
+
+        return {
+            "status": "success",
+            "message": f"Copied {len(entry['files'])} cached stems",
+            "source_folder": f"gs://{src_path}",
+            "destination_bucket": dest_path,
+            "uploaded_files": sorted(entry["files"]),
+            "uploaded_bytes": copied_bytes,
+            "gcp_path": f"gs://{dest_path}",
+            "cached": True
+        }
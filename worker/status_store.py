@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+import json
+import logging
+from typing import Dict, Any, List, Optional
+from redis.asyncio import Redis
+
+logger = logging.getLogger(__name__)
+
+# Job status fields stored as JSON inside the Redis hash, with the type of their empty value
+JSON_FIELDS = {"errors": list, "results": list, "timings": dict, "resources": dict}
+# Optional job status fields, stored as empty strings when unset
+NULLABLE_FIELDS = ("callback_url", "processed_stems_path", "batch_id", "deadline", "idempotency_key")
+# Statuses after which a job will not change anymore
+FINISHED_STATUSES = ("completed", "completed_with_errors", "error", "deadline_exceeded")
+
+class JobStatusStore:
+    """
+    Job status shared by every process through Redis.
+    Each job is a hash at logic-job:<execution_id>, written with a single pipelined
+    round trip per stage transition and readable in O(1) from any process.
+    Stage checkpoints are kept next to it at logic-job:<execution_id>:checkpoint.
+    Finished jobs and their checkpoints expire after `finished_ttl` seconds.
+    """
+    KEY_PREFIX = "logic-job:"
+    BATCH_PREFIX = "logic-batch:"
+
+    def __init__(self, redis: Redis, finished_ttl: int = 86400, batch_ttl: int = 7 * 86400):
+        self.redis = redis
+        self.finished_ttl = finished_ttl
+        self.batch_ttl = batch_ttl
+
+    @classmethod
+    def key(cls, execution_id: str) -> str:
+        return f"{cls.KEY_PREFIX}{execution_id}"
+
+    @classmethod
+    def checkpoint_key(cls, execution_id: str) -> str:
+        return f"{cls.KEY_PREFIX}{execution_id}:checkpoint"
+
+    @staticmethod
+    def encode(status: Dict[str, Any]) -> Dict[str, str]:
+        encoded = {}
+        for field, value in status.items():
+            if field in JSON_FIELDS or isinstance(value, (dict, list)):
+                encoded[field] = json.dumps(value)
+            elif value is None:
+                encoded[field] = ""
+            else:
+                encoded[field] = str(value)
+        return encoded
+
+    @staticmethod
+    def decode(raw: Dict[str, str]) -> Dict[str, Any]:
+        status: Dict[str, Any] = {}
+        for field, value in raw.items():
+            if field in JSON_FIELDS:
+                status[field] = json.loads(value) if value else JSON_FIELDS[field]()
+            elif field in NULLABLE_FIELDS and value == "":
+                status[field] = None
+            else:
+                status[field] = value
+        return status
+
+    def queue_save(self, pipe, status: Dict[str, Any]):
+        """Add the commands saving a job status to an existing pipeline"""
+        key = self.key(status["execution_id"])
+        pipe.hset(key, mapping=self.encode(status))
+        if status.get("status") in FINISHED_STATUSES:
+            pipe.expire(key, self.finished_ttl)
+            pipe.expire(self.checkpoint_key(status["execution_id"]), self.finished_ttl)
+        else:
+            pipe.persist(key)
+
+    async def save(self, status: Dict[str, Any]):
+        """Write a job status in one pipelined round trip"""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            self.queue_save(pipe, status)
+            await pipe.execute()
+
+    async def get(self, execution_id: str) -> Optional[Dict[str, Any]]:
+        raw = await self.redis.hgetall(self.key(execution_id))
+        if not raw:
+            return None
+        return self.decode(raw)
+
+    def queue_save_batch(self, pipe, batch: Dict[str, Any], execution_ids: List[str]):
+        """
+        Add the commands saving a batch of jobs to an existing pipeline.
+        The batch is a hash at logic-batch:<batch_id> and its jobs a list at logic-batch:<batch_id>:jobs.
+        """
+        key = f"{self.BATCH_PREFIX}{batch['batch_id']}"
+        pipe.hset(key, mapping=self.encode(batch))
+        pipe.rpush(f"{key}:jobs", *execution_ids)
+        pipe.expire(key, self.batch_ttl)
+        pipe.expire(f"{key}:jobs", self.batch_ttl)
+
+    async def get_batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Batch information with the number of its jobs in each status.
+        Jobs whose status already expired are counted as 'expired'.
+        """
+        key = f"{self.BATCH_PREFIX}{batch_id}"
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hgetall(key)
+            pipe.lrange(f"{key}:jobs", 0, -1)
+            raw, execution_ids = await pipe.execute()
+        if not raw:
+            return None
+        
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for execution_id in execution_ids:
+                pipe.hget(self.key(execution_id), "status")
+            statuses = await pipe.execute()
+        
+        counts: Dict[str, int] = {}
+        for status in statuses:
+            status = status or "expired"
+            counts[status] = counts.get(status, 0) + 1
+        finished = sum(counts.get(status, 0) for status in FINISHED_STATUSES + ("expired",))
+        
+        if finished == len(execution_ids):
+            batch_status = "completed" if counts.get("completed", 0) == finished else "completed_with_errors"
+        elif counts.get("queued", 0) == len(execution_ids):
+            batch_status = "queued"
+        else:
+            batch_status = "processing"
+        
+        batch = self.decode(raw)
+        batch.update({
+            "status": batch_status,
+            "total": len(execution_ids),
+            "finished": finished,
+            "counts": counts,
+            "execution_ids": execution_ids
+        })
+        return batch
+
+    async def save_checkpoint(self, execution_id: str, stage: str, data: Dict[str, Any]):
+        """Record that a stage of the job finished, with the location of its artifacts"""
+        await self.redis.hset(self.checkpoint_key(execution_id), stage, json.dumps(data))
+
+    async def get_checkpoints(self, execution_id: str) -> Dict[str, Dict[str, Any]]:
+        """Finished stages of a job mapped to their checkpoint data"""
+        raw = await self.redis.hgetall(self.checkpoint_key(execution_id))
+        return {stage: json.loads(data) for stage, data in raw.items()}